@@ -0,0 +1,125 @@
+"""
+Admin List Search & Pagination for E-Warranty Portal
+An in-memory index over the admin catalogs (projects, companies) so the
+admin pages only build widgets for one page of results, however large the
+catalog gets.
+
+Matching: every query word must occur in the record, either as the start of
+a word (prefix index: sorted word list + bisect) or anywhere (substring
+index: trigram -> records, verified against the text). Records where every
+query word is a word prefix rank first.
+"""
+import bisect
+import hashlib
+import math
+import re
+
+import streamlit as st
+
+PAGE_SIZES = (10, 20, 50)
+_WORD = re.compile(r"\w+")
+
+
+def _trigrams(text):
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+class SearchIndex:
+    """records: list of dicts; fields(record) -> list of searchable strings."""
+
+    def __init__(self, records, fields):
+        self.records = list(records)
+        self._texts = [" ".join(str(f or "") for f in fields(r)).casefold() for r in self.records]
+        words = set()
+        self._grams = {}
+        for idx, text in enumerate(self._texts):
+            for word in _WORD.findall(text):
+                words.add((word, idx))
+            for gram in _trigrams(text):
+                self._grams.setdefault(gram, set()).add(idx)
+        self._words = sorted(words)
+
+    def _prefix(self, token):
+        """Records with a word starting with token."""
+        hits = set()
+        pos = bisect.bisect_left(self._words, (token,))
+        while pos < len(self._words) and self._words[pos][0].startswith(token):
+            hits.add(self._words[pos][1])
+            pos += 1
+        return hits
+
+    def _substring(self, token):
+        """Records whose text contains token anywhere."""
+        if len(token) < 3:
+            return {idx for idx, text in enumerate(self._texts) if token in text}
+        grams = sorted((self._grams.get(g, set()) for g in _trigrams(token)), key=len)
+        candidates = set.intersection(*grams) if grams else set()
+        return {idx for idx in candidates if token in self._texts[idx]}
+
+    def search(self, query):
+        """Matching records, prefix matches first, catalog order otherwise."""
+        tokens = _WORD.findall((query or "").casefold())
+        if not tokens:
+            return self.records
+        prefix_hits = substring_hits = None
+        for token in tokens:
+            p = self._prefix(token)
+            s = self._substring(token) | p
+            prefix_hits = p if prefix_hits is None else prefix_hits & p
+            substring_hits = s if substring_hits is None else substring_hits & s
+        ranked = sorted(substring_hits, key=lambda idx: (idx not in prefix_hits, idx))
+        return [self.records[idx] for idx in ranked]
+
+
+def paginate(items, page, page_size):
+    """(items on page, page clamped to range, number of pages); page is 1-based."""
+    n_pages = max(1, math.ceil(len(items) / page_size))
+    page = min(max(1, page), n_pages)
+    start = (page - 1) * page_size
+    return items[start:start + page_size], page, n_pages
+
+
+def get_index(key, records, fields):
+    """Index for a catalog, rebuilt only when the searchable text changes."""
+    texts = [" ".join(str(f or "") for f in fields(r)) for r in records]
+    signature = hashlib.blake2b("\x1f".join(texts).encode(), digest_size=16).digest()
+    cached = st.session_state.get(f"_index_{key}")
+    if cached is None or cached[0] != signature:
+        cached = (signature, SearchIndex(records, fields))
+        st.session_state[f"_index_{key}"] = cached
+    # Records are edited in place, so hand back the live objects
+    index = cached[1]
+    index.records = list(records)
+    return index
+
+
+def search_page(key, records, fields, placeholder="Search..."):
+    """
+    Search box + pager for an admin list. Returns only the records of the
+    visible page, so callers build widgets for that page alone.
+    """
+    c_search, c_size = st.columns([4, 1])
+    query = c_search.text_input("Search", key=f"{key}_q", placeholder=placeholder, label_visibility="collapsed")
+    page_size = c_size.selectbox("Per page", PAGE_SIZES, index=1, key=f"{key}_size", label_visibility="collapsed")
+
+    matches = get_index(key, records, fields).search(query)
+    # New search -> back to page 1
+    if st.session_state.get(f"{key}_last_q") != query:
+        st.session_state[f"{key}_last_q"] = query
+        st.session_state[f"{key}_page"] = 1
+    visible, page, n_pages = paginate(matches, st.session_state.get(f"{key}_page", 1), page_size)
+    st.session_state[f"{key}_page"] = page
+
+    if not matches:
+        st.caption("No matches.")
+        return []
+    c_prev, c_info, c_next = st.columns([1, 3, 1])
+    if c_prev.button("◀ Prev", key=f"{key}_prev", disabled=page <= 1):
+        st.session_state[f"{key}_page"] = page - 1
+        st.rerun()
+    if c_next.button("Next ▶", key=f"{key}_next", disabled=page >= n_pages):
+        st.session_state[f"{key}_page"] = page + 1
+        st.rerun()
+    first = (page - 1) * page_size + 1
+    c_info.caption(f"Showing {first}–{first + len(visible) - 1} of {len(matches)} (page {page}/{n_pages})")
+    return visible
@@ -1,11 +1,13 @@
 import streamlit as st
-import pandas as pd
+import json
 import os
 import tempfile
 import zipfile
 import io
-from streamlit_quill import st_quill
-from pdf_engine import generate_bulk_certificates
+from admin_index import search_page
+
+# pandas, streamlit_quill, PIL and the PDF stack are imported inside the views
+# that use them, so main.py can render the login page without loading them.
 
 # --- MOCK DATA INIT (Function to be called from main.py) ---
 def init_mock_data():
@@ -30,6 +32,8 @@ def init_mock_data():
 
 # --- MODULE A: USER MANAGEMENT ---
 def render_user_management():
+    import pandas as pd
+    from user_import import email_index, next_user_ids, render_bulk_import
     st.subheader("👥 User Management")
     
     # Create User
@@ -42,21 +46,30 @@ def render_user_management():
             password = st.text_input("Temporary Password", type="password") # In Supabase this triggers invite or signup
             
             if st.form_submit_button("Create User"):
-                st.session_state.profiles.append({
-                    "id": f"u{len(st.session_state.profiles)+1}",
-                    "email": email, "role": role, "full_name": name
-                })
-                st.success(f"User {email} created!")
-                st.rerun()
+                if email.strip().casefold() in email_index(st.session_state.profiles):
+                    st.error(f"User {email} already exists!")
+                else:
+                    st.session_state.profiles.append({
+                        "id": next_user_ids(st.session_state.profiles, 1)[0],
+                        "email": email.strip(), "role": role, "full_name": name
+                    })
+                    st.success(f"User {email} created!")
+                    st.rerun()
+
+    # Bulk Import
+    with st.expander("Bulk Import Users (CSV / Excel)"):
+        # Sign-in goes through Supabase: profiles never hold passwords
+        render_bulk_import("profiles", st.session_state.client_projects, lambda p: p['client_name'], with_passwords=False)
 
     # List Users
     st.markdown("### Existing Users")
-    df = pd.DataFrame(st.session_state.profiles)
-    st.dataframe(df, use_container_width=True)
+    df = pd.DataFrame(st.session_state.profiles, columns=["email", "role", "full_name"])
+    st.dataframe(df, use_container_width=True, hide_index=True)
 
 
 # --- MODULE B: INTERNAL COMPANY MANAGEMENT ---
 def render_company_management():
+    from asset_store import store_logo
     st.subheader("🏢 Internal Company Management")
     
     # Create
@@ -68,9 +81,11 @@ def render_company_management():
             # Mock Upload logic
             logo_path = None
             if logo:
-                os.makedirs("assets", exist_ok=True)
-                logo_path = os.path.join("assets", logo.name)
-                with open(logo_path, "wb") as f: f.write(logo.getbuffer())
+                try:
+                    logo_path = store_logo(logo.getbuffer(), logo.name)["pdf_path"]
+                except ValueError as e:
+                    st.error(f"Logo rejected: {e}")
+                    return
             
             st.session_state.internal_companies.append({
                 "id": f"c{len(st.session_state.internal_companies)+1}",
@@ -94,8 +109,15 @@ def render_company_management():
 
 # --- MODULE C: CLIENT PROJECT MANAGEMENT ---
 def render_project_management():
+    from streamlit_quill import st_quill
+    from catalog_io import render_catalog_io
+    from warranty_rules import default_rules_json, parse_warranty_rules
     st.subheader("📁 Client Project Management")
     
+    with st.expander("📦 Bulk Import / Export Companies & Projects"):
+        render_catalog_io("internal_companies", "client_projects", terms_key="terms_conditions", logo_key="logo_url",
+                          company_prefix="c", project_prefix="p", key="catalog_admin")
+    
     # Create
     with st.form("new_project"):
         st.markdown("#### Create New Client Project")
@@ -109,23 +131,45 @@ def render_project_management():
         
         st.markdown("**Terms & Conditions**")
         terms = st_quill(placeholder="Enter legal terms here...", key="quill_new")
+        rules_text = st.text_area("Warranty Rules (JSON, blank = default 36 months)", height=150, placeholder=default_rules_json())
         
         if st.form_submit_button("Create Project"):
-            st.session_state.client_projects.append({
-                "id": f"p{len(st.session_state.client_projects)+1}",
-                "company_id": c_names[company_name],
-                "client_name": client_name,
-                "terms_conditions": terms,
-                "is_active": True
-            })
-            st.success(f"Project '{client_name}' created under '{company_name}'!")
-            st.rerun()
+            rules, rules_error = parse_warranty_rules(rules_text)
+            if rules_error:
+                st.error(f"Invalid warranty rules: {rules_error}")
+            else:
+                st.session_state.client_projects.append({
+                    "id": f"p{len(st.session_state.client_projects)+1}",
+                    "company_id": c_names[company_name],
+                    "client_name": client_name,
+                    "terms_conditions": terms,
+                    "warranty_rules": rules,
+                    "is_active": True
+                })
+                st.success(f"Project '{client_name}' created under '{company_name}'!")
+                st.rerun()
 
     # List
     st.markdown("### Active Projects")
-    projects = st.session_state.client_projects
+    company_names = {c['id']: c['name'] for c in st.session_state.internal_companies}
+    projects = search_page(
+        "client_projects", st.session_state.client_projects,
+        lambda p: (p['client_name'], p.get('warranty_issue'), company_names.get(p['company_id'])),
+        placeholder="Search by client, warranty issue or company"
+    )
     for p in projects:
         st.info(f"**{p['client_name']}** (Internal: {p['company_id']})")
+        with st.expander(f"Warranty Rules: {p['client_name']}"):
+            current_rules = json.dumps(p['warranty_rules'], indent=2) if p.get('warranty_rules') else ""
+            new_rules = st.text_area("Warranty Rules (JSON, blank = default)", current_rules, height=100, key=f"rules_{p['id']}")
+            if st.button("Save Rules", key=f"save_rules_{p['id']}"):
+                rules, rules_error = parse_warranty_rules(new_rules)
+                if rules_error:
+                    st.error(f"Invalid warranty rules: {rules_error}")
+                else:
+                    p['warranty_rules'] = rules
+                    st.success(f"Warranty rules of '{p['client_name']}' saved!")
+                    st.rerun()
 
 
 # --- MODULE 3: WARRANTY GENERATOR (The Core Logic) ---
@@ -3,13 +3,18 @@ E-Warranty Portal - TRIAD Technologies
 Multi-tenant platform for managing warranty projects and generating certificates.
 """
 import streamlit as st
-import pandas as pd
 import os
 import tempfile
 import zipfile
 import io
-from PIL import Image
-from pdf_engine import generate_bulk_certificates
+import json
+from render_pool import get_render_pool
+from metrics import start_exporter
+from admin_index import search_page
+from tenant_data import bind_admin_tables, get_store, tenant_scope
+
+# pandas, PIL, the PDF stack and the registry are imported inside the views
+# that use them, so the login page renders without loading any of them.
 
 # Page Config
 st.set_page_config(
@@ -33,29 +38,14 @@ st.markdown("""
 if 'user' not in st.session_state:
     st.session_state.user = None
 
-# Mock Database - Internal Companies
-if 'internal_companies' not in st.session_state:
-    st.session_state.internal_companies = [
-        {"id": 1, "name": "TRIAD Technologies", "logo_path": None, "is_active": True, "created_at": "2025-01-01"},
-        {"id": 2, "name": "TRIAD Marketing", "logo_path": None, "is_active": True, "created_at": "2025-01-15"}
-    ]
-
-# Mock Database - Projects (Client Projects)
-if 'projects' not in st.session_state:
-    st.session_state.projects = [
-        {"id": 1, "company_id": 1, "client_name": "Rajasthan Gramin Bank", "warranty_issue": "Branch Signage Warranty", "terms_text": "", "created_at": "2025-01-01"},
-        {"id": 2, "company_id": 1, "client_name": "Test Client Corp", "warranty_issue": "Equipment Installation", "terms_text": "Sample Terms", "created_at": "2025-02-01"}
-    ]
-
-if 'users_db' not in st.session_state:
-    st.session_state.users_db = [
-        {"id": "u1", "email": "admin@triad.com", "role": "admin", "project_id": None},
-        {"id": "u2", "email": "user@client.com", "role": "user", "project_id": 1}
-    ]
+# Mock Database: one shared catalog (tenant_data); sessions load their slice on first use
 
 if 'current_view' not in st.session_state:
     st.session_state.current_view = "Generate Warranty"
 
+# Metrics endpoint/file, if METRICS_PORT / METRICS_FILE are set
+start_exporter()
+
 # Success message handler
 if 'success_message' not in st.session_state:
     st.session_state.success_message = None
@@ -65,20 +55,15 @@ def show_success(message):
     st.session_state.success_message = message
 
 def get_project_by_id(pid):
-    for p in st.session_state.projects:
-        if p['id'] == pid: return p
-    return None
+    return get_store().get("projects", pid)
 
 def get_company_by_id(cid):
-    for c in st.session_state.internal_companies:
-        if c['id'] == cid: return c
-    return None
+    return get_store().get("internal_companies", cid)
 
 def get_client_name(project):
     """Helper to get client name - supports both old ('name') and new ('client_name') data"""
     return project.get('client_name') or project.get('name', 'Unknown')
 
-
 # ================= AUTHENTICATION =================
 def login_page():
     st.markdown("<h1 style='text-align: center;'>🔐 E-Warranty Portal</h1>", unsafe_allow_html=True)
@@ -93,11 +78,7 @@ def login_page():
             
             if submit:
                 # Mock Login Logic
-                valid_user = None
-                for u in st.session_state.users_db:
-                    if u['email'] == email: 
-                        valid_user = u
-                        break
+                valid_user = get_store().user_by_email(email)
                 
                 if valid_user:
                     st.session_state.user = valid_user
@@ -131,9 +112,17 @@ def render_header(user):
 
 # ================= 1. CREATE PROJECT =================
 def view_create_project():
+    from catalog_io import render_catalog_io
+    from cert_registry import get_registry
+    from reissue import reissue_project
+    from warranty_rules import default_rules_json, parse_warranty_rules
     st.header("📁 Create Project")
     
-    tab_create, tab_edit = st.tabs(["➕ Create New", "✏️ Edit Existing"])
+    tab_create, tab_edit, tab_bulk = st.tabs(["➕ Create New", "✏️ Edit Existing", "📦 Import / Export"])
+    
+    with tab_bulk:
+        st.subheader("Bulk Import / Export Companies & Projects")
+        render_catalog_io("internal_companies", "projects", key="catalog_app")
     
     with tab_create:
         st.subheader("Add New Client Project")
@@ -142,15 +131,19 @@ def view_create_project():
             client_name = st.text_input("Client Name *", placeholder="e.g., Rajasthan Gramin Bank")
             warranty_issue = st.text_input("Warranty Issue Name *", placeholder="e.g., Branch Signage Warranty")
             terms_text = st.text_area("Terms & Conditions", height=150, placeholder="Enter warranty terms and conditions...")
+            rules_text = st.text_area("Warranty Rules (JSON, blank = default 36 months)", height=150, placeholder=default_rules_json())
             
             submitted = st.form_submit_button("Create Project", type="primary")
             
             if submitted:
                 # Validation
+                rules, rules_error = parse_warranty_rules(rules_text)
                 if not client_name.strip():
                     st.error("❌ Client Name is required!")
                 elif not warranty_issue.strip():
                     st.error("❌ Warranty Issue Name is required!")
+                elif rules_error:
+                    st.error(f"❌ Invalid warranty rules: {rules_error}")
                 else:
                     # Check for duplicate client name
                     existing_names = [get_client_name(p).lower() for p in st.session_state.projects]
@@ -164,6 +157,7 @@ def view_create_project():
                             "client_name": client_name.strip(),
                             "warranty_issue": warranty_issue.strip(),
                             "terms_text": terms_text,
+                            "warranty_rules": rules,
                             "created_at": "Now"
                         })
                         show_success(f"✅ Project \"{client_name}\" created successfully!")
@@ -175,7 +169,12 @@ def view_create_project():
         if not st.session_state.projects:
             st.info("No projects yet. Create one from the 'Create New' tab.")
         else:
-            for p in st.session_state.projects:
+            visible = search_page(
+                "projects", st.session_state.projects,
+                lambda p: (get_client_name(p), p.get('warranty_issue'), (get_company_by_id(p.get('company_id')) or {}).get('name')),
+                placeholder="Search by client, warranty issue or company"
+            )
+            for p in visible:
                 with st.expander(f"📁 {get_client_name(p)}"):
                     # Edit Form
                     col1, col2 = st.columns(2)
@@ -185,28 +184,52 @@ def view_create_project():
                         new_warranty = st.text_input("Warranty Issue", p.get('warranty_issue', ''), key=f"warranty_{p['id']}")
                     
                     new_terms = st.text_area("Terms & Conditions", p.get('terms_text', ''), height=100, key=f"terms_{p['id']}")
+                    current_rules = json.dumps(p['warranty_rules'], indent=2) if p.get('warranty_rules') else ""
+                    new_rules = st.text_area("Warranty Rules (JSON, blank = default)", current_rules, height=100, key=f"rules_{p['id']}")
                     
                     col_save, col_delete = st.columns([3, 1])
                     with col_save:
                         if st.button("💾 Save Changes", key=f"save_{p['id']}"):
+                            rules, rules_error = parse_warranty_rules(new_rules)
                             if not new_client.strip():
                                 st.error("❌ Client Name cannot be empty!")
+                            elif rules_error:
+                                st.error(f"❌ Invalid warranty rules: {rules_error}")
                             else:
                                 p['client_name'] = new_client.strip()
                                 p['warranty_issue'] = new_warranty.strip()
                                 p['terms_text'] = new_terms
+                                p['warranty_rules'] = rules
                                 show_success("✅ Project updated successfully!")
                                 st.rerun()
                     
+                    # Re-issue already issued certificates with the saved terms
+                    issued = get_registry().count(p['id'])
+                    if issued and st.button(f"♻️ Re-issue {issued} certificate(s) with current terms", key=f"reissue_{p['id']}"):
+                        company = get_company_by_id(p.get('company_id')) or {}
+                        branding = {
+                            "company_name": company.get('name', ''),
+                            "project_id": p['id'],
+                            "logo_path": company.get('logo_path'),
+                            "client_name": get_client_name(p),
+                            "terms_text": p.get('terms_text', ''),
+                        }
+                        bar = st.progress(0.0)
+                        result = reissue_project(p['id'], branding, progress=lambda done, total: bar.progress(done / total))
+                        failed_note = f" {len(result['failed'])} failed: {result['failed'][:5]}" if result['failed'] else ""
+                        show_success(f"✅ Re-issued {result['reissued']} certificate(s) in {result['seconds']:.1f}s.{failed_note}")
+                        st.rerun()
+                    
                     with col_delete:
                         if st.button("🗑️ Delete", key=f"del_{p['id']}", type="secondary"):
-                            st.session_state.projects = [x for x in st.session_state.projects if x['id'] != p['id']]
+                            st.session_state.projects[:] = [x for x in st.session_state.projects if x['id'] != p['id']]
                             show_success("✅ Project deleted.")
                             st.rerun()
 
 
 # ================= 2. INTERNAL COMPANY =================
 def view_internal_company():
+    from asset_store import store_logo
     st.header("🏢 Internal Company")
     
     tab_create, tab_edit = st.tabs(["➕ Add New", "✏️ Manage Existing"])
@@ -234,10 +257,8 @@ def view_internal_company():
                         logo_path = None
                         if logo_file:
                             try:
-                                os.makedirs("assets", exist_ok=True)
-                                logo_path = os.path.join("assets", f"company_{len(st.session_state.internal_companies)+1}_{logo_file.name}")
-                                with open(logo_path, 'wb') as f:
-                                    f.write(logo_file.getbuffer())
+                                # Stored by content hash; certificates use the prepared header variant
+                                logo_path = store_logo(logo_file.getbuffer(), logo_file.name)["pdf_path"]
                             except Exception as e:
                                 st.error(f"❌ Error uploading logo: {e}")
                                 logo_path = None
@@ -260,7 +281,9 @@ def view_internal_company():
         if not st.session_state.internal_companies:
             st.info("No companies yet. Add one from the 'Add New' tab.")
         else:
-            for c in st.session_state.internal_companies:
+            visible = search_page("companies", st.session_state.internal_companies, lambda c: (c['name'],),
+                                  placeholder="Search companies")
+            for c in visible:
                 status_icon = "🟢" if c['is_active'] else "🔴"
                 with st.expander(f"{status_icon} {c['name']}"):
                     col_logo, col_details = st.columns([1, 3])
@@ -288,11 +311,7 @@ def view_internal_company():
                                     # Handle new logo
                                     if new_logo:
                                         try:
-                                            os.makedirs("assets", exist_ok=True)
-                                            logo_path = os.path.join("assets", f"company_{c['id']}_{new_logo.name}")
-                                            with open(logo_path, 'wb') as f:
-                                                f.write(new_logo.getbuffer())
-                                            c['logo_path'] = logo_path
+                                            c['logo_path'] = store_logo(new_logo.getbuffer(), new_logo.name)["pdf_path"]
                                         except Exception as e:
                                             st.error(f"❌ Error uploading logo: {e}")
                                     
@@ -314,23 +333,32 @@ def view_internal_company():
                                 if linked_projects:
                                     st.error(f"❌ Cannot delete. {len(linked_projects)} project(s) linked to this company.")
                                 else:
-                                    st.session_state.internal_companies = [x for x in st.session_state.internal_companies if x['id'] != c['id']]
+                                    st.session_state.internal_companies[:] = [x for x in st.session_state.internal_companies if x['id'] != c['id']]
                                     show_success("✅ Company deleted.")
                                     st.rerun()
 
 
 # ================= 3. GENERATE WARRANTY =================
 def view_generate_warranty(user):
+    import pandas as pd
+    from pdf_engine import generate_bulk_results
+    from cert_registry import get_registry
+    from job_scheduler import get_scheduler
+    from work_queue import JOB_TIMEOUT_SECONDS, generate_distributed
+    from warranty_rules import compile_rules
+    from photo_spool import PhotoSpool
+    from photo_library import get_photo_library, photo_slots
     st.header("🏭 Generate Warranty")
     
-    # Get active companies
-    companies = [c for c in st.session_state.internal_companies if c['is_active']]
+    # Only the companies/projects this session may use (a client user: its own project)
+    scope = tenant_scope(user)
+    companies = [c for c in scope["companies"] if c['is_active']]
     
     if not companies:
         st.error("❌ No internal companies available. Please create one first.")
         return
     
-    if not st.session_state.projects:
+    if not scope["projects"]:
         st.error("❌ No projects available. Please create a project first.")
         return
 
@@ -347,7 +375,7 @@ def view_generate_warranty(user):
     
     with c2:
         # Show warranty issues (projects) - can filter by company or show all
-        project_options = st.session_state.projects
+        project_options = scope["projects"]
         warranty_issues = [p.get('warranty_issue', get_client_name(p)) for p in project_options]
         
         selected_warranty = st.selectbox(
@@ -357,6 +385,9 @@ def view_generate_warranty(user):
         )
         active_project = next(p for p in project_options if p.get('warranty_issue', get_client_name(p)) == selected_warranty)
     
+    # Project's warranty rules, compiled once for this batch
+    rules = compile_rules(active_project.get('warranty_rules'))
+    
     st.divider()
     
     # Files with inline help
@@ -380,40 +411,38 @@ def view_generate_warranty(user):
             st.warning("Template file not found")
     with col_photo:
         photo_files = st.file_uploader("Upload Site Photos", type=['jpg', 'jpeg', 'png'], accept_multiple_files=True)
-        # Photo naming format guide
-        st.markdown("""
-**📸 Photo Naming Format:**
-| Format | Type | Example |
-|--------|------|---------|
-| `branch_code_1.jpg` | Complete Board | `101_1.jpg` |
-| `branch_code_2.jpg` | Only Fascia | `101_2.jpg` |
-| `branch_code_3.jpg` | Fascia + LED | `101_3.jpg` |
-""")
-
-    # Action
-    if excel_file and photo_files:
+        # Spooled to the photo store as they arrive, so Generate starts from local files
+        spool = st.session_state.setdefault('photo_spool', PhotoSpool())
+        with st.spinner("Storing photos..."):
+            images_dict = spool.sync(photo_files)
+        for message in spool.errors():
+            st.error(f"❌ Skipped unreadable upload {message}")
+        # Photo naming format guide (from the project's warranty rules)
+        st.markdown(rules.naming_guide())
+
+    # Action (photos are optional: the project's photo library covers what a re-run doesn't upload)
+    if excel_file:
         if st.button("Generate Certificates", type="primary"):
             with st.spinner("Processing..."):
                 try:
                     df = pd.read_excel(excel_file)
+                    library = get_photo_library()
+                    slots = photo_slots(df, rules)
+                    photos, from_library = library.fill_missing(active_project['id'], slots, images_dict)
+                    if from_library:
+                        st.caption(f"📚 {len(from_library)} photo(s) not uploaded come from the project's photo library.")
                     
-                    images_dict = {}
                     with tempfile.TemporaryDirectory() as temp_dir:
-                        for uploaded_file in photo_files:
-                            file_path = os.path.join(temp_dir, uploaded_file.name)
-                            with open(file_path, "wb") as f:
-                                f.write(uploaded_file.getbuffer())
-                            name_without_ext = os.path.splitext(uploaded_file.name)[0]
-                            images_dict[name_without_ext] = file_path
-                        
                         # Branding from selected company and project
                         # Get client name from project (for "This warranty is issued to..." line)
                         project_client_name = active_project.get('client_name') or active_project.get('warranty_issue') or selected_warranty
                         branding = {
                             "company_name": active_company['name'],
+                            "project_id": active_project['id'],
                             "logo_path": active_company.get('logo_path'),
                             "client_name": project_client_name,
                             "terms_text": active_project.get('terms_text', ''),
+                            "warranty_rules": active_project.get('warranty_rules'),
                             "warranty_issue": selected_warranty
                         }
                         
@@ -421,11 +450,30 @@ def view_generate_warranty(user):
                         output_dir = os.path.join(temp_dir, "output")
                         os.makedirs(output_dir, exist_ok=True)
                         
-                        generated = generate_bulk_certificates(
-                            df, images_dict, output_dir, branding
-                        )
+                        if os.environ.get("WORK_QUEUE_DIR"):
+                            # Distributed mode: shards go to the shared queue, workers on other hosts render them
+                            shard_bar = st.progress(0.0, text="Waiting for workers...")
+                            generated, errors = generate_distributed(
+                                df, photos, output_dir, branding, os.environ["WORK_QUEUE_DIR"],
+                                progress=lambda done, total: shard_bar.progress(done / total, text=f"{done}/{total} shards done"),
+                                timeout=JOB_TIMEOUT_SECONDS,
+                            )
+                            failures = [{"branch_code": branch, "reason": reason} for branch, reason in errors]
+                        else:
+                            results = generate_bulk_results(
+                                df, photos, output_dir, branding,
+                                scheduler=get_scheduler(), tenant=(active_company['id'], active_project['id'])
+                            )
+                            generated = [r.path for r in results if r.ok]
+                            failures = [r.as_dict() for r in results if not r.ok]
+                        
+                        render_failed_rows(failures)
                         
                         if generated:
+                            # Keep the issued PDFs so re-downloads don't need a re-render
+                            get_registry().register_batch(active_project['id'], df, output_dir, rules)
+                            # Next run only needs the photos that change
+                            library.add_uploads(active_project['id'], slots, images_dict)
                             zip_buffer = io.BytesIO()
                             with zipfile.ZipFile(zip_buffer, "w") as zf:
                                 for pdf in generated:
@@ -437,9 +485,60 @@ def view_generate_warranty(user):
                 except Exception as e:
                     st.error(f"❌ Error: {e}")
 
+    st.divider()
+    render_issued_certificates(active_project)
+
+
+def render_failed_rows(failures):
+    """Rows that could not be rendered (timed out, crashed or bad data), with the reason."""
+    import pandas as pd
+    if not failures:
+        return
+    st.error(f"❌ {len(failures)} certificate(s) failed. The rest were generated normally.")
+    failed_df = pd.DataFrame(failures).rename(columns={
+        "branch_code": "Branch Code", "reason": "Reason", "seconds": "Seconds", "attempts": "Attempts"
+    })
+    st.dataframe(failed_df.drop(columns=["status", "path"], errors="ignore"), use_container_width=True, hide_index=True)
+
+
+def render_issued_certificates(project):
+    """Re-download previously issued certificates straight from the registry."""
+    import pandas as pd
+    from cert_registry import get_registry
+    st.subheader("📂 Re-download Issued Certificates")
+    c1, c2 = st.columns(2)
+    branch_input = c1.text_input("Branch Codes (comma separated)", key="reg_branches", placeholder="e.g., 101, 102")
+    ifsc_input = c2.text_input("IFSC Codes (comma separated)", key="reg_ifsc", placeholder="e.g., RBGB0000101")
+    
+    branch_codes = [b.strip() for b in branch_input.split(',') if b.strip()]
+    ifsc_codes = [i.strip() for i in ifsc_input.split(',') if i.strip()]
+    if not branch_codes and not ifsc_codes:
+        st.caption(f"Search certificates issued for {get_client_name(project)}.")
+        return
+    
+    registry = get_registry()
+    records = registry.lookup(project['id'], branch_codes=branch_codes, ifsc_codes=ifsc_codes)
+    if not records:
+        st.info("No issued certificates match.")
+        return
+    
+    st.dataframe(pd.DataFrame([{
+        "Serial": r['serial'], "Branch Code": r['branch_code'], "IFSC": r['ifsc_code'], "Branch Name": r['branch_name'],
+        "Installed": r['installation_date'], "Valid Until": r['expiry_date'], "Issued At": r['issued_at']
+    } for r in records]), use_container_width=True)
+    
+    if len(records) == 1:
+        rec = records[0]
+        st.download_button("📥 Download Certificate", registry.read_bytes(rec), rec['file_name'], "application/pdf")
+    else:
+        st.download_button(f"📥 Download {len(records)} Certificates (ZIP)", registry.build_zip(records),
+                           f"Certificates_{get_client_name(project)}.zip", "application/zip")
+
 
 # ================= 4. MANAGE USERS =================
 def view_manage_users():
+    import pandas as pd
+    from user_import import email_index, next_user_ids, render_bulk_import
     st.header("👥 Manage Users")
     
     # Create User
@@ -457,18 +556,22 @@ def view_manage_users():
                 st.error("❌ Password is required!")
             else:
                 # Check for duplicate email
-                existing_emails = [u['email'].lower() for u in st.session_state.users_db]
-                if u_email.strip().lower() in existing_emails:
+                if u_email.strip().casefold() in email_index(st.session_state.users_db):
                     st.error(f"❌ A user with email \"{u_email.strip()}\" already exists!")
                 else:
                     st.session_state.users_db.append({
-                        "id": f"u{len(st.session_state.users_db)+1}",
+                        "id": next_user_ids(st.session_state.users_db, 1)[0],
                         "email": u_email.strip(),
                         "password": u_password.strip(),
                         "role": u_role
                     })
                     show_success(f"✅ User \"{u_email}\" added successfully!")
                     st.rerun()
+    
+    # Bulk Import
+    with st.expander("📤 Bulk Import Users (CSV / Excel)"):
+        st.caption("Columns: email, role (user/admin), project (client name or id), full_name, password (blank = temporary).")
+        render_bulk_import("users_db", st.session_state.projects, get_client_name)
             
     # List Users
     st.divider()
@@ -483,16 +586,19 @@ def view_manage_users():
 # ================= DASHBOARD =================
 def dashboard():
     user = st.session_state.user
+    # Start (or reuse) the shared render workers once someone has logged in, so they are warm by the first generation
+    get_render_pool()
     render_header(user)
     
     # Sidebar Navigation
     with st.sidebar:
         st.markdown("### 🧭 Menu")
         
-        # 4 Menu Options
-        options = ["Create Project", "Internal Company", "Generate Warranty"]
+        # Catalog and user admin only for admins; client users see their own project
+        options = ["Generate Warranty", "Expiry Analytics"]
         if user['role'] == 'admin':
-            options.append("Manage Users")
+            bind_admin_tables()
+            options = ["Create Project", "Internal Company"] + options + ["Manage Users"]
         
         # Ensure current_view is valid
         if st.session_state.current_view not in options:
@@ -517,6 +623,9 @@ def dashboard():
         view_internal_company()
     elif selection == "Generate Warranty":
         view_generate_warranty(user)
+    elif selection == "Expiry Analytics":
+        from expiry_analytics import render_expiry_dashboard
+        render_expiry_dashboard(tenant_scope(user)["projects"], get_client_name)
     elif selection == "Manage Users":
         view_manage_users()
     
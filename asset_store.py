@@ -0,0 +1,109 @@
+"""
+Logo Asset Store for E-Warranty Portal
+Uploaded logos are stored once per content hash, and at upload time a
+PDF-ready variant is built: sized for the certificate header box at print
+resolution, alpha flattened onto white and JPEG-compressed. Certificates only
+ever read the prepared variant, so rendering never decodes or scales the
+original upload.
+
+Layout (local stand-in for the storage bucket):
+    assets/logos/original/<sha256>.<ext>
+    assets/logos/pdf/<sha256>_<w>x<h>.jpg
+"""
+import hashlib
+import io
+import os
+import threading
+
+from PIL import Image
+
+import metrics
+
+ASSET_DIR = os.environ.get("ASSET_DIR", "assets")
+LOGO_DIR = os.path.join(ASSET_DIR, "logos")
+
+# Header logo box on the certificate (inches) and the print resolution of the variant
+LOGO_BOX_INCHES = (1.5, 0.8)
+LOGO_DPI = 300
+LOGO_QUALITY = 90
+
+_variants = {}                 # (path, mtime) -> prepared variant path, for logos stored before this pipeline
+_variants_lock = threading.Lock()
+
+
+def _box_px():
+    return tuple(round(side * LOGO_DPI) for side in LOGO_BOX_INCHES)
+
+
+def _flatten(img):
+    """RGB image with any transparency composited onto white."""
+    if img.mode in ("RGBA", "LA") or (img.mode == "P" and "transparency" in img.info):
+        img = img.convert("RGBA")
+        background = Image.new("RGB", img.size, (255, 255, 255))
+        background.paste(img, mask=img.getchannel("A"))
+        return background
+    return img.convert("RGB")
+
+
+def build_pdf_variant(data, content_hash):
+    """Writes (once) the header-ready JPEG for a logo and returns its path."""
+    box_w, box_h = _box_px()
+    with Image.open(io.BytesIO(data)) as img:
+        img.load()
+        scale = min(box_w / img.width, box_h / img.height, 1.0)   # never upscale
+        size = (max(1, round(img.width * scale)), max(1, round(img.height * scale)))
+        path = os.path.join(LOGO_DIR, "pdf", f"{content_hash}_{size[0]}x{size[1]}.jpg")
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            variant = _flatten(img).resize(size, Image.LANCZOS) if size != img.size else _flatten(img)
+            tmp = f"{path}.{os.getpid()}.tmp"
+            variant.save(tmp, "JPEG", quality=LOGO_QUALITY, optimize=True)
+            os.replace(tmp, path)
+    return path
+
+
+def store_logo(data, filename=""):
+    """
+    Stores an uploaded logo (bytes) by content hash and builds its PDF variant.
+    Returns {'hash', 'original_path', 'pdf_path'}; identical uploads share files.
+    Raises ValueError if the upload isn't a readable image.
+    """
+    data = bytes(data)
+    content_hash = hashlib.sha256(data).hexdigest()
+    ext = os.path.splitext(filename)[1].lower() or ".img"
+    original = os.path.join(LOGO_DIR, "original", f"{content_hash}{ext}")
+    try:
+        pdf_path = build_pdf_variant(data, content_hash)
+    except Exception as e:
+        raise ValueError(f"Not a readable image: {e}") from e
+    if not os.path.exists(original):
+        os.makedirs(os.path.dirname(original), exist_ok=True)
+        with open(original, "wb") as f:
+            f.write(data)
+    return {"hash": content_hash, "original_path": original, "pdf_path": pdf_path}
+
+
+def pdf_logo_path(logo_path):
+    """
+    The prepared variant for a logo path. Paths already pointing at a variant
+    are returned as they are; raw logos (uploaded before this store existed)
+    get a variant built on first use. None if missing/unreadable.
+    """
+    if not logo_path or not os.path.exists(logo_path):
+        return None
+    if os.path.dirname(os.path.abspath(logo_path)) == os.path.abspath(os.path.join(LOGO_DIR, "pdf")):
+        return logo_path
+    key = (logo_path, os.path.getmtime(logo_path))
+    with _variants_lock:
+        metrics.cache_lookup("logo_variant", key in _variants)
+        if key in _variants:
+            return _variants[key]
+    try:
+        with open(logo_path, "rb") as f:
+            data = f.read()
+        variant = build_pdf_variant(data, hashlib.sha256(data).hexdigest())
+    except Exception:
+        variant = None
+    with _variants_lock:
+        _variants[key] = variant
+    return variant
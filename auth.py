@@ -1,20 +1,33 @@
 """
 Authentication Helper for E-Warranty Portal
-Handles connection to Supabase for Login, Signup, and Password Reset.
+Handles connection to Supabase for Login, Signup, and Password Reset,
+and caches the signed-in session (tokens, profile, role) in session state.
 """
+import base64
+import hashlib
+import hmac
+import json
+import os
+import threading
+import time
+
 import streamlit as st
-from supabase import create_client, Client
 
-# Initialize these with actual values from the user
-SUPABASE_URL = "YOUR_SUPABASE_URL_HERE"
-SUPABASE_KEY = "YOUR_SUPABASE_KEY_HERE"
+# httpx and supabase are imported on first use: the login page renders without them
+
+# Initialize these with actual values from the user (or via environment)
+SUPABASE_URL = os.environ.get("SUPABASE_URL", "YOUR_SUPABASE_URL_HERE")
+SUPABASE_KEY = os.environ.get("SUPABASE_KEY", "YOUR_SUPABASE_KEY_HERE")
+# Optional: enables local signature checks of access tokens
+SUPABASE_JWT_SECRET = os.environ.get("SUPABASE_JWT_SECRET")
 
 @st.cache_resource
-def init_supabase() -> Client:
+def init_supabase():
     """Initialize Supabase client."""
     if SUPABASE_URL == "YOUR_SUPABASE_URL_HERE":
         return None
     try:
+        from supabase import create_client
         return create_client(SUPABASE_URL, SUPABASE_KEY)
     except Exception as e:
         st.error(f"Failed to connect to Supabase: {e}")
@@ -58,3 +71,198 @@ def reset_password(email):
         return response
     except Exception as e:
         return {"error": str(e)}
+
+
+# --- SESSION LAYER ---
+# Tokens are kept per Streamlit session and checked locally on every rerun.
+# The network is only touched to sign in, to refresh ahead of expiry (in a
+# background thread) and to load the profile once per sign-in.
+
+REFRESH_MARGIN_SECONDS = 300   # start a background refresh this long before expiry
+CLOCK_SKEW_SECONDS = 30        # treat tokens this close to expiry as expired
+
+
+def _b64url_decode(segment):
+    return base64.urlsafe_b64decode(segment + "=" * (-len(segment) % 4))
+
+
+def decode_access_token(token):
+    """
+    Decodes the claims of a Supabase access token (JWT) without a network call.
+    The HS256 signature is checked when SUPABASE_JWT_SECRET is set.
+    Returns the claims dict, or None if the token is malformed or forged.
+    """
+    try:
+        header_b64, payload_b64, signature_b64 = token.split(".")
+        claims = json.loads(_b64url_decode(payload_b64))
+    except Exception:
+        return None
+    if SUPABASE_JWT_SECRET:
+        expected = hmac.new(SUPABASE_JWT_SECRET.encode(), f"{header_b64}.{payload_b64}".encode(), hashlib.sha256).digest()
+        if not hmac.compare_digest(expected, _b64url_decode(signature_b64)):
+            return None
+    return claims
+
+
+class AuthSession:
+    """
+    Holds the tokens, user and cached profile of one signed-in session.
+    Safe to share with the background refresh thread.
+    """
+
+    def __init__(self, access_token, refresh_token, expires_at, user):
+        self._lock = threading.Lock()
+        self._refreshing = False
+        self.access_token = access_token
+        self.refresh_token = refresh_token
+        self.expires_at = expires_at
+        self.user = user          # {'id': ..., 'email': ...}
+        self.profile = None       # row from the profiles table, loaded once
+
+    @classmethod
+    def from_response(cls, response):
+        """Builds a session from a sign-in/refresh response (AuthResponse or GoTrue JSON)."""
+        if response is None or (isinstance(response, dict) and response.get("error")):
+            return None
+        if isinstance(response, dict):
+            data = response
+            user = data.get("user") or {}
+        else:
+            if not response.session:
+                return None
+            data = response.session.model_dump()
+            user = response.user.model_dump() if response.user else data.get("user") or {}
+        claims = decode_access_token(data.get("access_token", ""))
+        if claims is None:
+            return None
+        expires_at = data.get("expires_at") or claims.get("exp") or time.time() + data.get("expires_in", 0)
+        return cls(
+            data["access_token"],
+            data["refresh_token"],
+            float(expires_at),
+            {"id": user.get("id") or claims.get("sub"), "email": user.get("email") or claims.get("email")},
+        )
+
+    @property
+    def role(self):
+        return (self.profile or {}).get("role", "user")
+
+    def seconds_left(self, now=None):
+        return self.expires_at - (now or time.time())
+
+    def is_valid(self, now=None):
+        """Local check only: the token decodes and has not expired."""
+        return self.seconds_left(now) > CLOCK_SKEW_SECONDS
+
+    def needs_refresh(self, now=None):
+        return self.seconds_left(now) <= REFRESH_MARGIN_SECONDS
+
+    def _apply(self, data):
+        claims = decode_access_token(data.get("access_token", ""))
+        if claims is None:
+            raise ValueError("Refresh returned an invalid access token")
+        with self._lock:
+            self.access_token = data["access_token"]
+            self.refresh_token = data.get("refresh_token", self.refresh_token)
+            self.expires_at = float(data.get("expires_at") or claims.get("exp") or time.time() + data.get("expires_in", 0))
+
+    def refresh(self):
+        """Exchanges the refresh token for a new access token. Returns True on success."""
+        try:
+            data = _auth_request("POST", "token", params={"grant_type": "refresh_token"},
+                                 json_body={"refresh_token": self.refresh_token})
+            self._apply(data)
+            return True
+        except Exception:
+            return False
+        finally:
+            self._refreshing = False
+
+    def refresh_in_background(self):
+        """Starts a refresh thread unless one is already running."""
+        with self._lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+        threading.Thread(target=self.refresh, daemon=True).start()
+
+    def load_profile(self):
+        """Fetches the profile row once; later calls return the cached copy."""
+        if self.profile is None:
+            rows = _rest_request("profiles", self.access_token, {"id": f"eq.{self.user['id']}", "select": "*"})
+            self.profile = rows[0] if rows else {"id": self.user["id"], "email": self.user["email"], "role": "user"}
+        return self.profile
+
+
+def _auth_request(method, path, params=None, json_body=None):
+    import httpx
+    response = httpx.request(
+        method, f"{SUPABASE_URL.rstrip('/')}/auth/v1/{path}",
+        params=params, json=json_body,
+        headers={"apikey": SUPABASE_KEY}, timeout=10,
+    )
+    response.raise_for_status()
+    return response.json()
+
+
+def _rest_request(table, access_token, params):
+    import httpx
+    response = httpx.get(
+        f"{SUPABASE_URL.rstrip('/')}/rest/v1/{table}", params=params,
+        headers={"apikey": SUPABASE_KEY, "Authorization": f"Bearer {access_token}"}, timeout=10,
+    )
+    response.raise_for_status()
+    return response.json()
+
+
+def login(email, password, state=None):
+    """
+    Signs in and stores the session (tokens + profile) in session state.
+    Returns the user dict used by the views, or None on failure.
+    """
+    state = st.session_state if state is None else state
+    session = AuthSession.from_response(sign_in(email, password))
+    if session is None:
+        return None
+    try:
+        session.load_profile()
+    except Exception:
+        return None
+    state["auth_session"] = session
+    return session_user(session)
+
+
+def session_user(session):
+    profile = session.profile or {}
+    return {
+        "id": session.user["id"],
+        "email": session.user["email"],
+        "role": session.role,
+        "full_name": profile.get("full_name", ""),
+        "project_id": profile.get("project_id"),
+    }
+
+
+def ensure_session(state=None):
+    """
+    Called on every rerun. Validates the stored tokens locally and returns the
+    user dict without any network call while the access token is fresh.
+    Near expiry a background refresh is started; once expired a blocking
+    refresh is attempted, and the session is dropped if that fails.
+    """
+    state = st.session_state if state is None else state
+    session = state.get("auth_session")
+    if session is None:
+        return None
+    if not session.is_valid():
+        if not session.refresh():
+            logout(state)
+            return None
+    elif session.needs_refresh():
+        session.refresh_in_background()
+    return session_user(session)
+
+
+def logout(state=None):
+    state = st.session_state if state is None else state
+    state.pop("auth_session", None)
@@ -0,0 +1,110 @@
+"""
+Cold-start benchmark for the two portal entry points.
+Each run is a fresh interpreter (like a new container): it times the import
+of streamlit itself, then the first script run up to the rendered login page,
+and lists which heavy modules that first run pulled in and how many child
+processes (e.g. render workers) it started (none of either should be).
+
+    python benchmark_startup.py [--runs 5] [app.py main.py]
+"""
+import argparse
+import glob
+import json
+import multiprocessing
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+# Modules the login page must not need
+HEAVY_MODULES = ("pandas", "reportlab", "pypdf", "PIL", "pdf_engine", "streamlit_quill", "supabase", "httpx")
+# Worker processes are started from background threads: give them this long to appear
+CHILD_SETTLE_SECONDS = 2.0
+
+
+def _child_pids():
+    """Pids of this process's children (any kind on Linux, multiprocessing ones elsewhere)."""
+    files = glob.glob(f"/proc/{os.getpid()}/task/*/children")
+    if not files:
+        return {p.pid for p in multiprocessing.active_children()}
+    pids = set()
+    for path in files:
+        with open(path) as f:
+            pids.update(int(pid) for pid in f.read().split())
+    return pids
+
+
+def _child(script):
+    started = time.perf_counter()
+    import streamlit  # noqa: F401  (baseline every entry point pays)
+    streamlit_s = time.perf_counter() - started
+
+    from streamlit.testing.v1 import AppTest
+    before = set(sys.modules)
+    children_before = _child_pids()
+    at = AppTest.from_file(script, default_timeout=120)
+    started = time.perf_counter()
+    at.run()
+    login_s = time.perf_counter() - started
+    loaded = sorted({m.split(".")[0] for m in set(sys.modules) - before} & set(HEAVY_MODULES))
+    time.sleep(CHILD_SETTLE_SECONDS)
+    children = len(_child_pids() - children_before)
+    print(json.dumps({
+        "streamlit_s": streamlit_s,
+        "first_render_s": login_s,
+        "heavy_loaded": loaded,
+        "children_spawned": children,
+        "errors": [str(e.value) for e in at.exception],
+    }), flush=True)
+    # Skip interpreter teardown (render workers, runtime threads): not part of the start
+    os._exit(0)
+
+
+def measure(script, runs):
+    samples = []
+    for _ in range(runs):
+        out = subprocess.run([sys.executable, __file__, "--child", script],
+                             capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__)))
+        lines = [l for l in out.stdout.splitlines() if l.startswith("{")]
+        if not lines:
+            raise RuntimeError(f"{script}: benchmark run failed\n{out.stderr[-2000:]}")
+        samples.append(json.loads(lines[-1]))
+    return samples
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("scripts", nargs="*", default=["app.py", "main.py"])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--child")
+    args = parser.parse_args()
+    if args.child:
+        _child(args.child)
+        return
+
+    ok = True
+    for script in args.scripts:
+        samples = measure(script, args.runs)
+        streamlit_s = statistics.median(s["streamlit_s"] for s in samples)
+        render_s = statistics.median(s["first_render_s"] for s in samples)
+        heavy = sorted({m for s in samples for m in s["heavy_loaded"]})
+        children = max(s["children_spawned"] for s in samples)
+        errors = [e for s in samples for e in s["errors"]]
+        print(f"{script}: import streamlit {streamlit_s * 1000:.0f} ms, "
+              f"first login render {render_s * 1000:.0f} ms (median of {args.runs})")
+        if errors:
+            ok = False
+            print(f"FAILURE: {script} raised on first run: {errors[0]}")
+        if heavy:
+            ok = False
+            print(f"FAILURE: {script} loaded {', '.join(heavy)} before login")
+        if children:
+            ok = False
+            print(f"FAILURE: {script} started {children} child process(es) before login")
+    if ok:
+        print("SUCCESS: login pages render without the heavy modules or child processes")
+
+
+if __name__ == "__main__":
+    main()
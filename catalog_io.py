@@ -0,0 +1,197 @@
+"""
+Catalog Import / Export for E-Warranty Portal
+Internal companies and client projects (with terms and warranty rules) to and
+from one XLSX workbook with a "Companies" and a "Projects" sheet. Imports are
+checked in one indexed pass (case-folded names against existing records and
+within the sheet), parent companies are matched by name, and everything is
+committed in one assignment. Exports use the same layout, for backups and
+moving a catalog between environments. Logos are not part of the workbook.
+"""
+import io
+import json
+import re
+
+import pandas as pd
+import streamlit as st
+
+from warranty_rules import compile_rules
+
+COMPANY_COLUMNS = ["name", "is_active"]
+PROJECT_COLUMNS = ["client_name", "warranty_issue", "company", "terms_text", "warranty_rules", "is_active"]
+
+
+def next_ids(records, count, prefix=None):
+    """count fresh ids after the highest existing one: ints, or 'c3'-style strings when prefix is given."""
+    if prefix is None:
+        start = max((r["id"] for r in records if isinstance(r.get("id"), int)), default=0) + 1
+        return list(range(start, start + count))
+    numbers = [int(m.group(1)) for r in records if (m := re.fullmatch(rf"{prefix}(\d+)", str(r.get("id", ""))))]
+    start = max(numbers, default=0) + 1
+    return [f"{prefix}{n}" for n in range(start, start + count)]
+
+
+def _flag(value):
+    return str(value).strip().casefold() not in ("false", "0", "no", "n", "inactive")
+
+
+def _key(series):
+    return series.fillna("").astype(str).str.strip().str.casefold()
+
+
+# --- EXPORT ---
+def export_catalog(companies, projects, terms_key="terms_text"):
+    """XLSX bytes with every company and project."""
+    names = {c["id"]: c["name"] for c in companies}
+    companies_df = pd.DataFrame([{"name": c["name"], "is_active": c.get("is_active", True)} for c in companies],
+                                columns=COMPANY_COLUMNS)
+    projects_df = pd.DataFrame([{
+        "client_name": p.get("client_name") or p.get("name", ""),
+        "warranty_issue": p.get("warranty_issue", ""),
+        "company": names.get(p.get("company_id"), ""),
+        "terms_text": p.get(terms_key, ""),
+        "warranty_rules": json.dumps(p["warranty_rules"]) if p.get("warranty_rules") else "",
+        "is_active": p.get("is_active", True),
+    } for p in projects], columns=PROJECT_COLUMNS)
+    out = io.BytesIO()
+    with pd.ExcelWriter(out) as writer:
+        companies_df.to_excel(writer, sheet_name="Companies", index=False)
+        projects_df.to_excel(writer, sheet_name="Projects", index=False)
+    return out.getvalue()
+
+
+# --- IMPORT ---
+def read_catalog(uploaded):
+    """(companies_df, projects_df) from a workbook; a missing sheet gives an empty frame."""
+    sheets = pd.read_excel(uploaded, sheet_name=None, dtype=str)
+    frames = {name.strip().casefold(): df for name, df in sheets.items()}
+    out = []
+    for sheet, columns in (("companies", COMPANY_COLUMNS), ("projects", PROJECT_COLUMNS)):
+        df = frames.get(sheet, pd.DataFrame(columns=columns)).fillna("")
+        df.columns = [str(c).strip().lower().replace(" ", "_") for c in df.columns]
+        for col in columns:
+            if col not in df.columns:
+                df[col] = ""
+        out.append(df)
+    return tuple(out)
+
+
+def _parse_rules(text):
+    """(rules dict or None, error or '')"""
+    if not str(text).strip():
+        return None, ""
+    try:
+        compile_rules(text)
+        return json.loads(text), ""
+    except (ValueError, TypeError) as e:
+        # One bad cell marks its row invalid; it must never abort the whole import
+        return None, str(e)
+
+
+def plan_catalog_import(companies_df, projects_df, companies, projects, terms_key="terms_text",
+                        logo_key="logo_path", company_prefix=None, project_prefix=None):
+    """
+    Returns (new_companies, new_projects, report). report rows: sheet, row, name, status
+    (inserted / skipped / invalid) and reason. Projects may name a company from
+    the same workbook. terms_key/logo_key and the id prefixes follow the calling UI's tables.
+    """
+    reports = []
+
+    # Companies
+    c_name = companies_df["name"].fillna("").astype(str).str.strip()
+    c_key = _key(c_name)
+    c_invalid = c_name == ""
+    c_existing = c_key.isin({str(c["name"]).strip().casefold() for c in companies})
+    c_repeated = c_key.where(~c_invalid).duplicated(keep="first") & ~c_invalid
+    c_skipped = ~c_invalid & (c_existing | c_repeated)
+    c_insert = ~c_invalid & ~c_skipped
+    reports.append(pd.DataFrame({
+        "sheet": "Companies", "row": companies_df.index + 2, "name": c_name,
+        "status": pd.Series("inserted", index=companies_df.index).mask(c_skipped, "skipped").mask(c_invalid, "invalid"),
+        "reason": pd.Series("", index=companies_df.index).mask(c_invalid, "Name is required")
+                    .mask(c_skipped & c_existing, "Company already exists").mask(c_skipped & ~c_existing, "Duplicate in sheet"),
+    }))
+    new_companies = [
+        {"id": cid, "name": name, logo_key: None, "is_active": _flag(active), "created_at": "Imported"}
+        for cid, name, active in zip(next_ids(companies, int(c_insert.sum()), company_prefix),
+                                     c_name[c_insert], companies_df["is_active"][c_insert])
+    ]
+
+    # Projects: parent company by name, existing or just imported
+    company_by_name = {str(c["name"]).strip().casefold(): c["id"] for c in companies + new_companies}
+    p_name = projects_df["client_name"].fillna("").astype(str).str.strip()
+    p_key = _key(p_name)
+    company_key = _key(projects_df["company"])
+    parsed_rules = projects_df["warranty_rules"].map(_parse_rules)
+
+    reason = pd.Series("", index=projects_df.index)
+    reason = reason.mask(p_name == "", "Client name is required")
+    reason = reason.mask((reason == "") & (company_key == ""), "Company is required")
+    reason = reason.mask((reason == "") & ~company_key.isin(company_by_name.keys()),
+                         "Unknown company: " + projects_df["company"].astype(str))
+    reason = reason.mask((reason == "") & (parsed_rules.str[1] != ""), parsed_rules.str[1])
+    p_invalid = reason != ""
+    p_existing = p_key.isin({str(p.get("client_name") or p.get("name", "")).strip().casefold() for p in projects})
+    p_repeated = p_key.where(~p_invalid).duplicated(keep="first") & ~p_invalid
+    p_skipped = ~p_invalid & (p_existing | p_repeated)
+    reason = reason.mask(p_skipped & p_existing, "Project already exists").mask(p_skipped & ~p_existing, "Duplicate in sheet")
+    p_insert = ~p_invalid & ~p_skipped
+    reports.append(pd.DataFrame({
+        "sheet": "Projects", "row": projects_df.index + 2, "name": p_name,
+        "status": pd.Series("inserted", index=projects_df.index).mask(p_skipped, "skipped").mask(p_invalid, "invalid"),
+        "reason": reason,
+    }))
+
+    rows = projects_df[p_insert]
+    new_projects = []
+    for pid, (idx, row) in zip(next_ids(projects, len(rows), project_prefix), rows.iterrows()):
+        new_projects.append({
+            "id": pid,
+            "company_id": company_by_name[company_key[idx]],
+            "client_name": p_name[idx],
+            "warranty_issue": str(row["warranty_issue"]).strip(),
+            terms_key: str(row["terms_text"]),
+            "warranty_rules": parsed_rules[idx][0],
+            "is_active": _flag(row["is_active"]),
+            "created_at": "Imported",
+        })
+    return new_companies, new_projects, pd.concat(reports, ignore_index=True)
+
+
+def render_catalog_io(companies_key, projects_key, terms_key="terms_text", logo_key="logo_path",
+                      company_prefix=None, project_prefix=None, key="catalog"):
+    """Export button + workbook import (validation report, then one-shot insert)."""
+    companies = st.session_state[companies_key]
+    projects = st.session_state[projects_key]
+    st.download_button("📤 Export Companies & Projects", export_catalog(companies, projects, terms_key),
+                       "warranty_catalog.xlsx", "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+                       key=f"{key}_export")
+    st.caption("Import uses the same layout: a 'Companies' sheet (name, is_active) and a 'Projects' sheet "
+               "(client_name, warranty_issue, company, terms_text, warranty_rules, is_active).")
+    uploaded = st.file_uploader("Catalog workbook (.xlsx)", type=["xlsx"], key=f"{key}_file")
+    if not uploaded:
+        return
+    try:
+        companies_df, projects_df = read_catalog(uploaded)
+    except Exception as e:
+        st.error(f"❌ Could not read workbook: {e}")
+        return
+
+    new_companies, new_projects, report = plan_catalog_import(
+        companies_df, projects_df, companies, projects, terms_key, logo_key, company_prefix, project_prefix
+    )
+    counts = report["status"].value_counts()
+    c1, c2, c3, c4 = st.columns(4)
+    c1.metric("New Companies", len(new_companies))
+    c2.metric("New Projects", len(new_projects))
+    c3.metric("Skipped (duplicates)", int(counts.get("skipped", 0)))
+    c4.metric("Invalid", int(counts.get("invalid", 0)))
+    problems = report[report["status"] != "inserted"]
+    if not problems.empty:
+        st.dataframe(problems, use_container_width=True, hide_index=True)
+
+    if (new_companies or new_projects) and st.button("Import Catalog", type="primary", key=f"{key}_go"):
+        # Both tables are extended together (in place: they may be the shared catalog),
+        # so a failed run never leaves orphaned projects
+        companies.extend(new_companies)
+        projects.extend(new_projects)
+        st.success(f"✅ Imported {len(new_companies)} company(ies) and {len(new_projects)} project(s).")
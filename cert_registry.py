@@ -0,0 +1,327 @@
+"""
+Issued-Certificate Registry for E-Warranty Portal
+Keeps one row per issued certificate (see `issued_certificates` in db_schema.sql)
+and the PDF bytes in a content-addressed store, so a bank's re-download request
+is answered from stored bytes instead of re-rendering the sheet.
+
+Local stand-in: SQLite for the table, the filesystem for the storage bucket.
+"""
+import hashlib
+import io
+import os
+import sqlite3
+import threading
+import zipfile
+from datetime import datetime
+
+import pandas as pd
+
+from warranty_rules import compile_rules
+from pdf_engine import certificate_dates, certificate_filename, certificate_serial, clean_branch_code, verification_code
+
+REGISTRY_DIR = os.environ.get("CERT_REGISTRY_DIR", "registry")
+
+SCHEMA = """
+create table if not exists issued_certificates (
+  id integer primary key autoincrement,
+  serial text,
+  verification_code text,
+  project_id text not null,
+  branch_code text not null,
+  ifsc_code text,
+  branch_name text,
+  installation_date text,
+  expiry_date text,
+  content_hash text not null,
+  storage_path text not null,
+  file_name text not null,
+  issued_at text not null
+);
+create index if not exists idx_issued_cert_project_branch on issued_certificates (project_id, branch_code);
+create index if not exists idx_issued_cert_ifsc on issued_certificates (ifsc_code);
+"""
+
+# Columns added after the first release; created on older local databases at startup
+ADDED_COLUMNS = {
+    "serial": "text",
+    "verification_code": "text",
+    "rbd": "text",
+    "state": "text",
+    "district": "text",
+    "warranty_types": "text",
+}
+INDEXES = """
+create index if not exists idx_issued_cert_serial on issued_certificates (serial);
+"""
+
+RECORD_FIELDS = (
+    "serial", "verification_code", "project_id", "branch_code", "ifsc_code", "branch_name",
+    "installation_date", "expiry_date", "content_hash", "storage_path", "file_name", "issued_at",
+    "rbd", "state", "district", "warranty_types",
+)
+
+# Expiry analytics: certificate counts per bucket, kept in step with every insert.
+# Only the latest certificate of a branch counts, so re-issues move a branch between buckets.
+ROLLUP_DIMENSIONS = ("project_id", "expiry_month", "rbd", "state", "district", "warranty_types")
+ROLLUP_SCHEMA = """
+create table if not exists expiry_rollup (
+  project_id text not null,
+  expiry_month text not null,
+  rbd text not null,
+  state text not null,
+  district text not null,
+  warranty_types text not null,
+  certificates integer not null,
+  primary key (project_id, expiry_month, rbd, state, district, warranty_types)
+);
+"""
+
+
+def cell_text(value):
+    """Stripped text of a sheet cell; blank cells (None, NaN) become ''."""
+    return str(value).strip() if value is not None and pd.notna(value) else ""
+
+
+def rollup_key(record):
+    """Bucket of a certificate record in expiry_rollup (blank region fields stay blank)."""
+    return (
+        str(record["project_id"]),
+        str(record.get("expiry_date") or "")[:7],
+        cell_text(record.get("rbd")),
+        cell_text(record.get("state")),
+        cell_text(record.get("district")),
+        str(record.get("warranty_types") or ""),
+    )
+
+
+class CertificateRegistry:
+    def __init__(self, root=REGISTRY_DIR):
+        self.root = root
+        self.blob_dir = os.path.join(root, "blobs")
+        self.db_path = os.path.join(root, "registry.db")
+        os.makedirs(self.blob_dir, exist_ok=True)
+        with self._connect() as conn:
+            conn.executescript(SCHEMA)
+            existing = {r["name"] for r in conn.execute("pragma table_info(issued_certificates)")}
+            for name, col_type in ADDED_COLUMNS.items():
+                if name not in existing:
+                    conn.execute(f"alter table issued_certificates add column {name} {col_type}")
+            conn.executescript(INDEXES)
+            has_rollup = conn.execute(
+                "select 1 from sqlite_master where type = 'table' and name = 'expiry_rollup'"
+            ).fetchone()
+            conn.executescript(ROLLUP_SCHEMA)
+            if not has_rollup:
+                self._rebuild_rollup(conn)
+
+    def _connect(self):
+        # One short-lived connection per call: Streamlit serves each session from its own thread.
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        conn.execute("pragma journal_mode=wal")
+        return conn
+
+    # --- STORAGE ---
+    def store_bytes(self, pdf_bytes):
+        """Writes PDF bytes under their SHA-256; identical certificates are stored once."""
+        content_hash = hashlib.sha256(pdf_bytes).hexdigest()
+        path = os.path.join(self.blob_dir, content_hash[:2], f"{content_hash}.pdf")
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(pdf_bytes)
+            os.replace(tmp_path, path)
+        return content_hash, path
+
+    def read_bytes(self, record):
+        with open(record["storage_path"], "rb") as f:
+            return f.read()
+
+    # --- WRITES ---
+    def register_batch(self, project_id, df, output_dir, rules=None):
+        """
+        Records every certificate of a finished batch. Rows whose PDF was not
+        generated are skipped. Returns the number of certificates registered.
+        rules: the project's warranty rules (expiry dates depend on them)
+        """
+        rules = compile_rules(rules)
+        issued_at = datetime.now().isoformat(timespec="seconds")
+        records = []
+        for _, row in df.iterrows():
+            file_name = certificate_filename(row)
+            pdf_path = os.path.join(output_dir, file_name)
+            if not os.path.exists(pdf_path):
+                continue
+            with open(pdf_path, "rb") as f:
+                content_hash, storage_path = self.store_bytes(f.read())
+            install_date, expiry_date = certificate_dates(row, rules)
+            branch_code = clean_branch_code(row.get('branch_code', '0'))
+            serial = certificate_serial(row, project_id)
+            records.append({
+                "serial": serial,
+                "verification_code": verification_code(serial, branch_code, expiry_date),
+                "project_id": str(project_id),
+                "branch_code": branch_code,
+                "ifsc_code": cell_text(row.get('ifsc_code')).upper(),
+                "branch_name": cell_text(row.get('branch_name')),
+                "installation_date": install_date.strftime("%Y-%m-%d"),
+                "expiry_date": expiry_date.strftime("%Y-%m-%d"),
+                "content_hash": content_hash,
+                "storage_path": storage_path,
+                "file_name": file_name,
+                "issued_at": issued_at,
+                "rbd": cell_text(row.get('rbd')),
+                "state": cell_text(row.get('state')),
+                "district": cell_text(row.get('district')),
+                "warranty_types": ",".join(t.type_id for t in rules.present_types(row)),
+            })
+        return self.insert(records)
+
+    def insert(self, records):
+        """
+        Inserts certificate records (dicts with RECORD_FIELDS) and updates the
+        expiry rollup in the same transaction.
+        """
+        with self._connect() as conn:
+            deltas = self._rollup_deltas(conn, records)
+            conn.executemany(
+                f"insert into issued_certificates ({', '.join(RECORD_FIELDS)}) "
+                f"values ({', '.join('?' * len(RECORD_FIELDS))})",
+                [tuple(rec.get(f) for f in RECORD_FIELDS) for rec in records],
+            )
+            self._apply_rollup(conn, deltas)
+        return len(records)
+
+    # --- EXPIRY ROLLUP ---
+    def _rollup_deltas(self, conn, records):
+        """{bucket: +/-n}: each branch's new latest certificate in, its previous one out."""
+        latest = {}
+        for rec in records:
+            latest[(str(rec["project_id"]), rec["branch_code"])] = rec
+        deltas = {}
+        by_project = {}
+        for project_id, branch_code in latest:
+            by_project.setdefault(project_id, []).append(branch_code)
+        for project_id, codes in by_project.items():
+            for start in range(0, len(codes), 500):
+                chunk = codes[start:start + 500]
+                rows = conn.execute(
+                    f"""select * from issued_certificates c
+                        where c.project_id = ? and c.branch_code in ({','.join('?' * len(chunk))})
+                          and c.id = (select max(id) from issued_certificates
+                                      where project_id = c.project_id and branch_code = c.branch_code)""",
+                    [project_id] + chunk,
+                )
+                for r in rows:
+                    key = rollup_key(dict(r))
+                    deltas[key] = deltas.get(key, 0) - 1
+        for rec in latest.values():
+            key = rollup_key(rec)
+            deltas[key] = deltas.get(key, 0) + 1
+        return {k: v for k, v in deltas.items() if v}
+
+    def _apply_rollup(self, conn, deltas):
+        conn.executemany(
+            f"insert into expiry_rollup ({', '.join(ROLLUP_DIMENSIONS)}, certificates) values (?, ?, ?, ?, ?, ?, ?) "
+            f"on conflict ({', '.join(ROLLUP_DIMENSIONS)}) do update set certificates = certificates + excluded.certificates",
+            [key + (n,) for key, n in deltas.items()],
+        )
+        conn.execute("delete from expiry_rollup where certificates <= 0")
+
+    def _rebuild_rollup(self, conn):
+        """Recounts the rollup from the certificate table (first start on an existing database)."""
+        conn.execute("delete from expiry_rollup")
+        rows = conn.execute("""select c.* from issued_certificates c
+                               where c.id = (select max(id) from issued_certificates
+                                             where project_id = c.project_id and branch_code = c.branch_code)""")
+        deltas = {}
+        for r in rows:
+            key = rollup_key(dict(r))
+            deltas[key] = deltas.get(key, 0) + 1
+        self._apply_rollup(conn, deltas)
+
+    def rebuild_rollup(self):
+        with self._connect() as conn:
+            self._rebuild_rollup(conn)
+
+    def expiry_rollup(self, project_ids=None):
+        """Rollup rows (dicts with ROLLUP_DIMENSIONS + certificates), optionally for some projects."""
+        query = "select * from expiry_rollup"
+        params = []
+        if project_ids is not None:
+            params = [str(p) for p in project_ids]
+            query += f" where project_id in ({','.join('?' * len(params))})"
+        with self._connect() as conn:
+            return [dict(r) for r in conn.execute(query, params)]
+
+    def last_id(self):
+        """Id of the newest certificate; changes whenever the rollup can have changed."""
+        with self._connect() as conn:
+            return conn.execute("select coalesce(max(id), 0) from issued_certificates").fetchone()[0]
+
+    # --- LOOKUPS ---
+    def lookup(self, project_id, branch_codes=None, ifsc_codes=None):
+        """
+        Latest certificate per branch for a project, optionally narrowed to
+        some branch codes and/or IFSC codes. Served by the two indexes.
+        """
+        query = """select * from issued_certificates c
+                   where c.project_id = ?
+                     and c.id = (select max(id) from issued_certificates
+                                 where project_id = c.project_id and branch_code = c.branch_code)"""
+        params = [str(project_id)]
+        if branch_codes:
+            codes = [clean_branch_code(b).strip() for b in branch_codes]
+            query += f" and c.branch_code in ({','.join('?' * len(codes))})"
+            params += codes
+        if ifsc_codes:
+            codes = [str(i).strip().upper() for i in ifsc_codes]
+            query += f" and c.ifsc_code in ({','.join('?' * len(codes))})"
+            params += codes
+        with self._connect() as conn:
+            return [dict(r) for r in conn.execute(query + " order by c.branch_code", params)]
+
+    def count(self, project_id):
+        """Number of branches with an issued certificate in a project."""
+        with self._connect() as conn:
+            return conn.execute(
+                "select count(distinct branch_code) from issued_certificates where project_id = ?",
+                (str(project_id),),
+            ).fetchone()[0]
+
+    def lookup_ifsc(self, ifsc_code):
+        """All certificates ever issued for an IFSC, newest first."""
+        with self._connect() as conn:
+            rows = conn.execute(
+                "select * from issued_certificates where ifsc_code = ? order by id desc",
+                (str(ifsc_code).strip().upper(),),
+            )
+            return [dict(r) for r in rows]
+
+    def iter_since(self, last_id=0):
+        """Yields (id, record) for rows added after last_id, oldest first."""
+        with self._connect() as conn:
+            for r in conn.execute("select * from issued_certificates where id > ? order by id", (last_id,)):
+                yield r["id"], dict(r)
+
+    def build_zip(self, records):
+        """Zips stored certificates. PDFs are already compressed, so they are stored as-is."""
+        zip_buffer = io.BytesIO()
+        with zipfile.ZipFile(zip_buffer, "w", compression=zipfile.ZIP_STORED) as zf:
+            for rec in records:
+                zf.write(rec["storage_path"], arcname=rec["file_name"])
+        return zip_buffer.getvalue()
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_registry():
+    """Process-wide registry shared by all sessions."""
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            _registry = CertificateRegistry()
+        return _registry
@@ -13,9 +13,60 @@ create table client_projects (
   company_id uuid references internal_companies(id),
   client_name text not null,
   terms_conditions text, -- HTML or plain text from the editor
+  warranty_rules jsonb, -- Warranty types, periods, displayed columns, photo suffixes (null = defaults)
   is_active boolean default true,
   created_at timestamp with time zone default timezone('utc', now())
 );
 
--- 3. Storage Bucket Policy (Run this to allow public reading of logos)
+-- 3. Table for Issued Certificates (one row per certificate handed out)
+create table issued_certificates (
+  id bigint generated always as identity primary key,
+  serial text not null, -- Printed in the certificate footer, e.g. TRD-7K3M-Q9XP-2AHD
+  verification_code text not null, -- Keyed code printed next to the serial
+  project_id uuid references client_projects(id) not null,
+  branch_code text not null,
+  ifsc_code text,
+  branch_name text,
+  installation_date date,
+  expiry_date date,
+  content_hash text not null, -- SHA-256 of the PDF bytes
+  storage_path text not null, -- Path in the 'certificates' storage bucket
+  file_name text not null,
+  issued_at timestamp with time zone default timezone('utc', now()),
+  rbd text, -- Region from the sheet, for expiry analytics
+  state text,
+  district text,
+  warranty_types text -- Comma-separated type ids the certificate covers, e.g. '1,3'
+);
+create index idx_issued_cert_project_branch on issued_certificates (project_id, branch_code);
+create index idx_issued_cert_ifsc on issued_certificates (ifsc_code);
+create index idx_issued_cert_serial on issued_certificates (serial);
+
+-- Expiry analytics: latest certificate per branch counted per bucket, updated with every insert
+create table expiry_rollup (
+  project_id uuid references client_projects(id) not null,
+  expiry_month text not null, -- 'YYYY-MM'
+  rbd text not null,
+  state text not null,
+  district text not null,
+  warranty_types text not null,
+  certificates integer not null,
+  primary key (project_id, expiry_month, rbd, state, district, warranty_types)
+);
+
+-- Photo library: the latest photo per branch and warranty type, reused by later batches of the project
+create table project_photos (
+  project_id uuid references client_projects(id) not null,
+  branch_code text not null,
+  type_id text not null, -- '' for the generic branch photo
+  content_hash text not null, -- SHA-256 of the original upload
+  original_path text not null, -- Path in the 'photos' storage bucket
+  variant_path text not null, -- Downsized, certificate-ready JPEG
+  updated_at timestamp with time zone default timezone('utc', now()),
+  primary key (project_id, branch_code, type_id)
+);
+
+-- 4. Storage Bucket Policy (Run this to allow public reading of logos)
 insert into storage.buckets (id, name, public) values ('logos', 'logos', true);
+insert into storage.buckets (id, name, public) values ('certificates', 'certificates', false);
+insert into storage.buckets (id, name, public) values ('photos', 'photos', false);
@@ -0,0 +1,199 @@
+"""
+Batch Cost Estimator for E-Warranty Portal
+Predicts wall time and ZIP size of a bulk generation before it starts:
+
+    per-row cost = f(warranty types in the row, matched photos, photo resolution)
+
+The per-row model is calibrated twice: by a quick sample render of a few
+rows of the actual batch (this machine, this logo, these photos), and by the
+history of real batches (actual vs estimated), which captures parallel
+overhead the sample can't see.
+"""
+import io
+import json
+import os
+import statistics
+import tempfile
+import time
+from datetime import datetime
+
+from PIL import Image as PILImage
+
+from pdf_engine import clean_branch_code
+from pipeline import MAX_PHOTO_PX, GenerationPipeline, read_photo_source
+from render_worker import warm_up
+from warranty_rules import compile_rules
+
+HISTORY_PATH = os.environ.get("ESTIMATOR_HISTORY", os.path.join("benchmarks", "estimator_history.json"))
+HISTORY_KEEP = 50
+SAMPLE_ROWS = 3
+PHOTO_PROBE = 20            # photos opened to learn the typical resolution
+
+# Uncalibrated per-row model (seconds / bytes); only the shape matters once calibrated
+BASE_SECONDS, TYPE_SECONDS, MPX_SECONDS = 0.05, 0.01, 0.04
+BASE_BYTES, TYPE_BYTES, MPX_BYTES = 40_000, 2_000, 180_000
+STARTUP_SECONDS = 1.0
+SPLIT_BYTES = 2 * 1024 ** 3        # suggest splitting above this
+OVERNIGHT_SECONDS = 30 * 60        # suggest scheduling overnight above this
+
+
+class BatchEstimate:
+    """
+    Result of estimate_batch. seconds/bytes are for the whole batch;
+    sample_* are the sample-calibrated figures before the history correction.
+    """
+
+    def __init__(self, rows, photos, workers, sample_seconds, sample_bytes, time_factor=1.0, size_factor=1.0,
+                 sample_rows=0, history_runs=0):
+        self.rows = rows
+        self.photos = photos
+        self.workers = workers
+        self.sample_seconds = sample_seconds
+        self.sample_bytes = sample_bytes
+        self.seconds = sample_seconds * time_factor
+        self.bytes = sample_bytes * size_factor
+        self.sample_rows = sample_rows
+        self.history_runs = history_runs
+
+    @property
+    def advice(self):
+        if self.bytes > SPLIT_BYTES:
+            return "split"
+        if self.seconds > OVERNIGHT_SECONDS:
+            return "overnight"
+        return None
+
+    def as_dict(self):
+        return dict(self.__dict__)
+
+
+def _row_features(rules, row, photo_keys):
+    """(warranty types, matched photos) for one row."""
+    b_code = clean_branch_code(row.get('branch_code', '0'))
+    expected = rules.expected_photos(row, b_code)
+    photos = sum(1 for _, key in expected if key in photo_keys)
+    if not photos and b_code in photo_keys:
+        photos = 1
+    return len(expected), photos
+
+
+def _photo_mpx(photo_sources):
+    """Typical photo size in megapixels after the pipeline's downscale (header reads only)."""
+    sizes = []
+    for source in list(photo_sources.values())[:PHOTO_PROBE]:
+        try:
+            if hasattr(source, "seek"):
+                source.seek(0)
+                img = PILImage.open(source)
+            else:
+                img = PILImage.open(io.BytesIO(read_photo_source(source)))
+            w, h = img.size
+            scale = min(1.0, MAX_PHOTO_PX / max(w, h))
+            sizes.append(w * h * scale * scale / 1e6)
+        except Exception:
+            continue
+        finally:
+            if hasattr(source, "seek"):
+                source.seek(0)
+    return statistics.median(sizes) if sizes else 0.0
+
+
+def _model(types, photos, mpx):
+    seconds = BASE_SECONDS + TYPE_SECONDS * types + MPX_SECONDS * photos * mpx
+    size = BASE_BYTES + TYPE_BYTES * types + MPX_BYTES * photos * mpx
+    return seconds, size
+
+
+def _sample_render(df, photo_sources, branding_config, positions):
+    """(seconds, bytes) of rendering the given rows in this process, photos prepared as in a real run."""
+    warm_up()  # time rendering, not the first import of the PDF stack
+    sample = df.iloc[positions]
+    with tempfile.TemporaryDirectory() as work_dir:
+        started = time.perf_counter()
+        # Calibration, not issued certificates: kept out of the throughput metrics
+        pipeline = GenerationPipeline(sample, photo_sources, work_dir, branding_config, photo_threads=1, record_metrics=False)
+        results = pipeline.run(io.BytesIO())
+        seconds = time.perf_counter() - started
+        size = sum(os.path.getsize(r.path) for r in results if r.ok)
+    return seconds, size
+
+
+# --- HISTORY ---
+def load_history(path=HISTORY_PATH):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return []
+
+
+def record_run(estimate, actual_seconds, actual_bytes, path=HISTORY_PATH):
+    """Appends a finished batch to the benchmark history (actual vs the sample-only estimate)."""
+    history = load_history(path)
+    history.append({
+        "at": datetime.now().isoformat(timespec="seconds"),
+        "rows": estimate.rows,
+        "workers": estimate.workers,
+        "estimated_seconds": round(estimate.sample_seconds, 2),
+        "actual_seconds": round(actual_seconds, 2),
+        "estimated_bytes": int(estimate.sample_bytes),
+        "actual_bytes": int(actual_bytes),
+    })
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(history[-HISTORY_KEEP:], f, indent=1)
+
+
+def _history_factor(history, actual, estimated):
+    """Median actual/estimated over recent runs, clamped so one odd batch can't skew it."""
+    ratios = [h[actual] / h[estimated] for h in history[-20:] if h.get(estimated)]
+    return min(4.0, max(0.25, statistics.median(ratios))) if ratios else 1.0
+
+
+# --- ESTIMATE ---
+def estimate_batch(df, photo_sources, branding_config, workers=1, sample_rows=SAMPLE_ROWS, history_path=HISTORY_PATH):
+    """
+    Estimates wall time and output size for generating df with these photos.
+    photo_sources: { 'photo_key': path | UploadedFile | callable } as for GenerationPipeline.
+    """
+    rules = compile_rules(branding_config.get('warranty_rules'))
+    keys = set(photo_sources)
+    mpx = _photo_mpx(photo_sources)
+    features = [_row_features(rules, row, keys) for _, row in df.iterrows()]
+    modelled = [_model(types, photos, mpx) for types, photos in features]
+    if not modelled:
+        return BatchEstimate(0, 0, workers, 0.0, 0)
+
+    # Calibrate on rows spread across the sheet
+    n = min(sample_rows, len(df))
+    positions = sorted({round(i * (len(df) - 1) / max(n - 1, 1)) for i in range(n)})
+    time_scale = size_scale = 1.0
+    if positions:
+        sample_seconds, sample_bytes = _sample_render(df, photo_sources, branding_config, positions)
+        time_scale = sample_seconds / sum(modelled[p][0] for p in positions)
+        size_scale = sample_bytes / sum(modelled[p][1] for p in positions) if sample_bytes else 1.0
+
+    history = load_history(history_path)
+    seconds = STARTUP_SECONDS + time_scale * sum(s for s, _ in modelled) / max(workers, 1)
+    size = size_scale * sum(b for _, b in modelled)
+    return BatchEstimate(
+        len(df), sum(p for _, p in features), workers, seconds, size,
+        time_factor=_history_factor(history, "actual_seconds", "estimated_seconds"),
+        size_factor=_history_factor(history, "actual_bytes", "estimated_bytes"),
+        sample_rows=len(positions), history_runs=len(history),
+    )
+
+
+def format_duration(seconds):
+    if seconds < 90:
+        return f"{seconds:.0f} s"
+    if seconds < 90 * 60:
+        return f"{seconds / 60:.0f} min"
+    return f"{seconds / 3600:.1f} h"
+
+
+def format_bytes(size):
+    for unit in ("B", "KB", "MB", "GB"):
+        if size < 1024 or unit == "GB":
+            return f"{size:.0f} {unit}" if unit in ("B", "KB") else f"{size:.1f} {unit}"
+        size /= 1024
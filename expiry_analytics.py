@@ -0,0 +1,118 @@
+"""
+Warranty Expiry Analytics for E-Warranty Portal
+Which warranties run out when, broken down by month, region (RBD), state,
+district, project and warranty type. Served from the registry's expiry_rollup
+(counts kept up to date as batches are issued), so a rerun reads a few
+thousand bucket rows instead of every certificate.
+"""
+from datetime import date
+
+import pandas as pd
+import streamlit as st
+
+from cert_registry import ROLLUP_DIMENSIONS, get_registry
+from warranty_rules import compile_rules
+
+BREAKDOWNS = {
+    "Expiry Month": "expiry_month",
+    "Region (RBD)": "rbd",
+    "State": "state",
+    "District": "district",
+    "Project": "project",
+    "Warranty Type": "warranty_type",
+}
+
+
+@st.cache_data(show_spinner=False, max_entries=32)
+def load_rollup(project_ids, version):
+    """Rollup rows as a DataFrame; version (newest certificate id) invalidates the cache."""
+    rows = get_registry().expiry_rollup(list(project_ids) if project_ids is not None else None)
+    return pd.DataFrame(rows, columns=list(ROLLUP_DIMENSIONS) + ["certificates"])
+
+
+def type_labels(projects):
+    """{(project_id, type_id): title} from each project's warranty rules."""
+    labels = {}
+    for p in projects:
+        try:
+            rules = compile_rules(p.get('warranty_rules'))
+        except ValueError:
+            continue
+        for t in rules.types:
+            labels[(str(p['id']), t.type_id)] = t.title
+    return labels
+
+
+def breakdown(frame, by, project_names=None, labels=None):
+    """Certificates per value of one breakdown column, largest first (months in date order)."""
+    if frame.empty:
+        return pd.DataFrame(columns=[by, "certificates"])
+    if by == "warranty_type":
+        # A certificate counts once under every type it covers
+        exploded = frame.assign(warranty_type=frame["warranty_types"].str.split(",")).explode("warranty_type")
+        exploded["warranty_type"] = [
+            (labels or {}).get((pid, tid), f"Type {tid}") if tid else "Unspecified"
+            for pid, tid in zip(exploded["project_id"], exploded["warranty_type"])
+        ]
+        frame = exploded
+    elif by == "project":
+        frame = frame.assign(project=frame["project_id"].map(lambda pid: (project_names or {}).get(pid, pid)))
+    out = frame.groupby(by, as_index=False)["certificates"].sum()
+    out[by] = out[by].replace("", "Unspecified")
+    if by == "expiry_month":
+        return out.sort_values(by, ignore_index=True)
+    return out.sort_values("certificates", ascending=False, ignore_index=True)
+
+
+def expiry_summary(frame, today=None, horizon_months=3):
+    """(total, expired, expiring within horizon_months, still covered beyond it) certificate counts."""
+    today = today or date.today()
+    this_month = f"{today.year:04d}-{today.month:02d}"
+    y, m = divmod(today.month - 1 + horizon_months, 12)
+    horizon = f"{today.year + y:04d}-{m + 1:02d}"
+    months = frame["expiry_month"]
+    total = int(frame["certificates"].sum())
+    expired = int(frame.loc[months < this_month, "certificates"].sum())
+    soon = int(frame.loc[(months >= this_month) & (months <= horizon), "certificates"].sum())
+    return total, expired, soon, total - expired - soon
+
+
+def render_expiry_dashboard(projects, project_name, key="expiry"):
+    """Analytics page over the given projects (admins pass all, users their own)."""
+    st.header("📊 Warranty Expiry Analytics")
+    if not projects:
+        st.info("No projects to analyse.")
+        return
+    names = {str(p['id']): project_name(p) for p in projects}
+    registry = get_registry()
+    frame = load_rollup(tuple(names), registry.last_id())
+    if frame.empty:
+        st.info("No certificates have been issued yet.")
+        return
+
+    c_proj, c_state, c_rbd = st.columns(3)
+    chosen = c_proj.multiselect("Projects", list(names), format_func=names.get, key=f"{key}_projects")
+    states = c_state.multiselect("States", sorted(s for s in frame["state"].unique() if s), key=f"{key}_states")
+    regions = c_rbd.multiselect("Regions (RBD)", sorted(r for r in frame["rbd"].unique() if r), key=f"{key}_rbd")
+    if chosen:
+        frame = frame[frame["project_id"].isin(chosen)]
+    if states:
+        frame = frame[frame["state"].isin(states)]
+    if regions:
+        frame = frame[frame["rbd"].isin(regions)]
+
+    total, expired, soon, later = expiry_summary(frame)
+    m1, m2, m3, m4 = st.columns(4)
+    m1.metric("Certificates", f"{total:,}")
+    m2.metric("Expired", f"{expired:,}")
+    m3.metric("Expiring ≤ 3 months", f"{soon:,}")
+    m4.metric("Covered beyond", f"{later:,}")
+
+    by_month = breakdown(frame, "expiry_month")
+    if not by_month.empty:
+        st.bar_chart(by_month.set_index("expiry_month")["certificates"])
+
+    label = st.selectbox("Break down by", list(BREAKDOWNS), index=1, key=f"{key}_by")
+    table = breakdown(frame, BREAKDOWNS[label], names, type_labels(projects))
+    st.dataframe(table.rename(columns={BREAKDOWNS[label]: label, "certificates": "Certificates"}),
+                 use_container_width=True, hide_index=True)
@@ -2,12 +2,22 @@ import streamlit as st
 import pandas as pd
 import io
 import os
-import zipfile
 import tempfile
-from pdf_engine import generate_bulk_certificates
+import json
+import time
+from pipeline import GenerationPipeline
+from photo_spool import PhotoSpool
+from photo_library import get_photo_library, photo_slots
+from memory_profile import MEMORY_PROFILE, MemoryProfiler
+from estimator import estimate_batch, record_run, format_bytes, format_duration
+from preview import TERMS_PAGE, make_thumbnail, photo_keys_for, render_preview_png
+from cert_registry import get_registry
+from job_scheduler import get_scheduler
+from warranty_rules import compile_rules
 
-def create_sample_excel():
+def create_sample_excel(rules=None):
     """Generates a sample Excel file in memory for the user to download."""
+    rules = compile_rules(rules)
     data = {
         'branch_code': [101, 102],
         'ifsc_code': ['RBGB0000101', 'RBGB0000102'],
@@ -21,29 +31,34 @@ def create_sample_excel():
         'district': ['Jaipur', 'Udaipur'],
         'state': ['Rajasthan', 'Rajasthan'],
         'rbd': ['Jaipur Zone', 'Udaipur Zone'],
-        'complete_board_size': ['8x4', None],
-        'complete_board_qty': [1, 0],
-        'complete_board_sqft': [32, 0],
-        'only_fascia_replacement_size': [None, '10x5'],
-        'only_fascia_replacement_qty': [0, 1],
-        'only_fascia_replacement_sqft': [0, 50],
-        'fascia_+_led_replacement_size': [None, None],
-        'fascia_+_led_replacement_qty': [0, 0],
-        'fascia_+_led_replacement_sqft': [0, 0],
-        'led_module_qty': [0, 0],
-        'power_supply_watt': [0, 0]
     }
+    # Warranty columns come from the project's rules: first type filled on row 1, second on row 2
+    samples = [('8x4', 1, 32), ('10x5', 1, 50)]
+    for idx, t in enumerate(rules.types):
+        size, qty, sqft = samples[idx] if idx < len(samples) else (None, 0, 0)
+        filled = [r == idx for r in range(2)]
+        data[t.size_column] = [size if f else None for f in filled]
+        if t.qty_column:
+            data[t.qty_column] = [qty if f else 0 for f in filled]
+        if t.sqft_column:
+            data[t.sqft_column] = [sqft if f else 0 for f in filled]
+        for col in t.value_columns:
+            data.setdefault(col, [0, 0])
     df = pd.DataFrame(data)
     output = io.BytesIO()
     with pd.ExcelWriter(output, engine='openpyxl') as writer:
         df.to_excel(writer, index=False)
     return output.getvalue()
 
-def check_photo_match(df, uploaded_images):
+def check_photo_match(df, uploaded_images, rules=None, library_keys=()):
     """
     Validates which rows in the DataFrame have matching photos uploaded.
+    rules: the project's warranty rules (which types exist, photo suffixes)
+    library_keys: photo keys the project's photo library covers when not uploaded
     Returns: A DataFrame with validation status.
     """
+    rules = compile_rules(rules)  # once for the whole sheet
+    
     # 1. Map Uploaded Filenames (normalize)
     # We define what we HAVE
     # uploaded_images is a list of UploadedFile objects or paths
@@ -64,36 +79,17 @@ def check_photo_match(df, uploaded_images):
             b_code = str(row.get('branch_code', '')).split('.')[0]
             if not b_code: continue
             
-            # Check for Warranty Types
-            # Type 1: Complete Board
-            if pd.notna(row.get('complete_board_size')):
-                expected = f"{b_code}_1"
-                status = "✅ Ready" if expected in available_keys else "❌ Missing"
+            # One expected photo per warranty type present on the row
+            for t, expected in rules.expected_photos(row, b_code):
+                if expected in available_keys:
+                    status = "✅ Ready"
+                elif expected in library_keys:
+                    status = "✅ Ready (library)"
+                else:
+                    status = "❌ Missing"
                 validation_rows.append({
                     "Branch": b_code,
-                    "Type ID": "1 (Complete)",
-                    "Expected Photo": f"{expected}.jpg",
-                    "Status": status
-                })
-
-            # Type 2: Fascia Only
-            if pd.notna(row.get('only_fascia_replacement_size')):
-                expected = f"{b_code}_2"
-                status = "✅ Ready" if expected in available_keys else "❌ Missing"
-                validation_rows.append({
-                    "Branch": b_code,
-                    "Type ID": "2 (Fascia)",
-                    "Expected Photo": f"{expected}.jpg",
-                    "Status": status
-                })
-                
-            # Type 3: Fascia + LED
-            if pd.notna(row.get('fascia_+_led_replacement_size')):
-                expected = f"{b_code}_3"
-                status = "✅ Ready" if expected in available_keys else "❌ Missing"
-                validation_rows.append({
-                    "Branch": b_code,
-                    "Type ID": "3 (Fascia+LED)",
+                    "Type ID": f"{t.type_id} ({t.label})",
                     "Expected Photo": f"{expected}.jpg",
                     "Status": status
                 })
@@ -109,6 +105,99 @@ def check_photo_match(df, uploaded_images):
     return pd.DataFrame(validation_rows)
 
 
+def spooled_photo_sources(photo_files):
+    """{photo_key: stored path} for uploaded photos and photos inside uploaded zips, spooled on the rerun they arrive."""
+    spool = st.session_state.setdefault('photo_spool', PhotoSpool())
+    with st.spinner("Storing photos..."):
+        sources = spool.sync(photo_files)
+    for message in spool.errors():
+        st.error(f"❌ Skipped unreadable upload {message}")
+    return sources
+
+
+def render_batch_estimate(df, photo_sources, branding, workers):
+    """Estimated time / ZIP size for the batch; the sample render runs once per upload."""
+    key = (branding['project_id'], len(df), tuple(sorted(photo_sources.items())))
+    cached = st.session_state.get('batch_estimate')
+    if cached is None or cached[0] != key:
+        with st.spinner("Estimating batch cost (sample render)..."):
+            cached = (key, estimate_batch(df, photo_sources, branding, workers=workers))
+        st.session_state.batch_estimate = cached
+    estimate = cached[1]
+    
+    st.markdown("**⏱️ Batch Estimate**")
+    e1, e2, e3, e4 = st.columns(4)
+    e1.metric("Est. Time", format_duration(estimate.seconds))
+    e2.metric("Est. ZIP Size", format_bytes(estimate.bytes))
+    e3.metric("Photos", estimate.photos)
+    e4.metric("Workers", estimate.workers)
+    st.caption(f"Calibrated on {estimate.sample_rows} sample row(s) and {estimate.history_runs} past batch(es).")
+    if estimate.advice == "split":
+        st.warning("⚠️ Output will be very large. Consider splitting the sheet into smaller batches.")
+    elif estimate.advice == "overnight":
+        st.warning("⚠️ Long batch. Consider scheduling it overnight.")
+    return estimate
+
+
+@st.cache_data(max_entries=256, show_spinner=False)
+def cached_thumbnail(path):
+    """Thumbnail per stored photo (paths are content-addressed, so the path is the cache key)."""
+    return make_thumbnail(path)
+
+
+@st.cache_data(max_entries=64, show_spinner=False)
+def cached_preview(row, branding, thumbnails, page):
+    """PNG preview, cached per row, branding, thumbnails and page."""
+    return render_preview_png(row, branding, dict(thumbnails) if thumbnails else None, page=page)
+
+
+def render_draft_preview(df, photo_sources, branding, rules):
+    """Renders a few chosen rows straight away (no photos or thumbnails only) before the full run."""
+    with st.expander("👁️ Draft Preview", expanded=False):
+        labels = [f"{i + 1}. {str(r.get('branch_code', '')).split('.')[0]} - {r.get('branch_name', '')}" for i, (_, r) in enumerate(df.iterrows())]
+        c1, c2, c3 = st.columns([3, 1, 1])
+        chosen = c1.multiselect("Rows to preview", labels, default=labels[:1], max_selections=3)
+        with_photos = c2.checkbox("Photo thumbnails", value=False)
+        page = TERMS_PAGE if c3.radio("Page", ["Certificate", "Terms"], horizontal=True) == "Terms" else 0
+        if not chosen:
+            return
+        
+        cols = st.columns(len(chosen))
+        for col, label in zip(cols, chosen):
+            row = df.iloc[labels.index(label)]
+            thumbnails = None
+            if with_photos:
+                thumbnails = tuple(
+                    (key, cached_thumbnail(photo_sources[key]))
+                    for key in photo_keys_for(rules, row) if key in photo_sources
+                )
+            try:
+                col.image(cached_preview(row, branding, thumbnails, page), use_container_width=True)
+            except Exception as e:
+                col.error(f"Preview failed: {e}")
+
+
+def render_memory_report(profiler, output_dir):
+    """Per-stage memory table plus the report file (written next to the batch output)."""
+    report = profiler.report()
+    try:
+        paths = profiler.write_report(output_dir)
+    except OSError as e:
+        paths = [f"nowhere ({e})"]   # the on-screen report and download still work
+    mb = lambda n: round(n / 2 ** 20, 1)
+    with st.expander("🧠 Memory Profile", expanded=True):
+        c1, c2, c3 = st.columns(3)
+        c1.metric("Peak RSS", f"{mb(report['peak_rss_bytes'])} MB")
+        c2.metric("Peak traced (Python)", f"{mb(report['peak_traced_bytes'])} MB")
+        c3.metric("Render workers RSS", f"{mb(report['peak_workers_rss_bytes'])} MB")
+        st.dataframe(pd.DataFrame([{"Stage": s["stage"], "Peak MB": mb(s["peak_bytes"]), "Retained MB": mb(s["retained_bytes"])}
+                                   for s in report["stages"]]), hide_index=True)
+        st.caption("Inputs: " + ", ".join(f"{k} = {v:,}" for k, v in report["notes"].items()))
+        st.dataframe(pd.DataFrame(report["top_sites_at_peak"]), hide_index=True)
+        st.download_button("Download Memory Report", json.dumps(report, indent=1), "memory_report.json", "application/json")
+        st.caption(f"Saved to {paths[-1]}")
+
+
 def render_generator_ui():
     st.header("🏭 Warranty Generator")
     
@@ -137,6 +226,9 @@ def render_generator_ui():
         st.info("Please select a project to proceed.")
         return
 
+    # Project's warranty rules, compiled once for validation and rendering
+    rules = compile_rules(sel_project.get('warranty_rules'))
+
     st.markdown("---")
     
     # --- SECTION 2: UPLOAD ZONE ---
@@ -145,7 +237,7 @@ def render_generator_ui():
     with col_up1:
         excel_file = st.file_uploader("3. Upload Excel Data (.xlsx)", type=['xlsx', 'xls'])
         # Sample download directly under Excel upload
-        sample_bytes = create_sample_excel()
+        sample_bytes = create_sample_excel(rules)
         st.download_button(
             label="📥 Download Sample Excel Template",
             data=sample_bytes,
@@ -156,19 +248,15 @@ def render_generator_ui():
     
     with col_up2:
         photo_files = st.file_uploader("4. Upload Site Photos", type=['jpg', 'jpeg', 'png', 'zip'], accept_multiple_files=True)
+        # Written to the photo store now, so Generate starts from local files
+        photo_sources = spooled_photo_sources(photo_files)
         # Photo naming guide directly under photo upload
-        st.markdown("""
-        **📸 Photo Naming Format:**
-        | Format | Type | Example |
-        |--------|------|---------|
-        | `branch_code_1.jpg` | Complete Board | `101_1.jpg` |
-        | `branch_code_2.jpg` | Only Fascia | `101_2.jpg` |
-        | `branch_code_3.jpg` | Fascia + LED | `101_3.jpg` |
-        """)
+        st.markdown(rules.naming_guide())
 
     # --- SECTION 3: LIVE PREVIEW & VALIDATION ---
     
-    if excel_file and photo_files:
+    # Photos are optional: the project's photo library covers what a re-run doesn't upload
+    if excel_file:
         st.subheader("🔍 Validation Dashboard")
         
         try:
@@ -185,7 +273,11 @@ def render_generator_ui():
             # If user uploads zip, we might need to peek inside, but standard st.file_uploader returns list of files if multiple=True.
             # If zip is single file, we need extraction logic. Assuming multi-file for now or simple handling.
             
-            validation_df = check_photo_match(df, photo_files)
+            library = get_photo_library()
+            known_sources, from_library = library.fill_missing(sel_project['id'], photo_slots(df, rules), photo_sources)
+            validation_df = check_photo_match(df, photo_files or [], rules, library_keys=set(from_library))
+            if from_library:
+                st.caption(f"📚 {len(from_library)} photo(s) not uploaded come from the project's photo library.")
             
             # Styling validation table
             def color_status(val):
@@ -201,47 +293,70 @@ def render_generator_ui():
             if ready_count < total_count:
                 st.warning(f"⚠️ Warning: Only {ready_count}/{total_count} items have matching photos. Missing items will generate without images.")
 
+            # Config
+            branding = {
+                "logo_path": sel_company.get('logo_url'),
+                "project_id": sel_project['id'],
+                "client_name": sel_project['client_name'],
+                "terms_text": sel_project.get('terms_conditions', ''),
+                "warranty_rules": sel_project.get('warranty_rules')
+            }
+            
+            # C. Cost Estimate
+            scheduler = get_scheduler()
+            estimate = render_batch_estimate(df, known_sources, branding, scheduler.max_inflight)
+            
+            # D. Draft Preview
+            render_draft_preview(df, known_sources, branding, rules)
+
             # --- SECTION 4: GENERATE ACTION ---
+            profile_memory = st.checkbox("🧠 Profile memory (slower; writes a per-stage memory report)", value=MEMORY_PROFILE)
             if st.button(f"Generate {ready_count} Certificates", type="primary"):
                 with st.spinner("Generating..."):
-                     # Prepare Images Dict
-                    images_dict = {}
+                    # Photos are already spooled to the store; the pipeline's photo stage reads the stored
+                    # files and takes the rest from the photo library (uploads are added to it)
                     with tempfile.TemporaryDirectory() as temp_dir:
-                        # Save uploaded photos to temp
-                        for pf in photo_files:
-                            # If it's a ZIP, extract it? For now assume individual files as per verification plan
-                            # But if zip:
-                            if pf.name.endswith('.zip'):
-                                with zipfile.ZipFile(pf) as z:
-                                    z.extractall(temp_dir)
-                                    for name in z.namelist():
-                                        if name.lower().endswith(('.jpg', '.jpeg', '.png')):
-                                            key = os.path.splitext(os.path.basename(name))[0]
-                                            images_dict[key] = os.path.join(temp_dir, name)
-                            else:
-                                path = os.path.join(temp_dir, pf.name)
-                                with open(path, "wb") as f: f.write(pf.getbuffer())
-                                key = os.path.splitext(pf.name)[0]
-                                images_dict[key] = path
-                        
-                        # Config
-                        branding = {
-                            "logo_path": sel_company.get('logo_url'),
-                            "client_name": sel_project['client_name'],
-                            "terms_text": sel_project.get('terms_conditions', '')
-                        }
-                        
-                        output_dir = os.path.join(temp_dir, "output")
-                        os.makedirs(output_dir, exist_ok=True)
+                        # Generate: ingest -> photo prep -> render -> zip, all stages overlapped
+                        pipeline = GenerationPipeline(
+                            df, photo_sources, temp_dir, branding,
+                            scheduler=scheduler, tenant=(sel_company['id'], sel_project['id']), library=library
+                        )
+                        stage_table = st.empty()
+                        zip_buffer = io.BytesIO()
+                        profiler = MemoryProfiler(pool=scheduler.pool) if profile_memory else None
+                        if profiler:
+                            profiler.note("rows", len(df))
+                            profiler.note("dataframe_bytes", df.memory_usage(deep=True).sum())
+                            profiler.note("upload_bytes", sum(pf.size for pf in photo_files or []))
+                            profiler.start()
+                        started = time.perf_counter()
+                        try:
+                            results = pipeline.run(zip_buffer, progress=lambda stats: stage_table.dataframe(pd.DataFrame(stats), hide_index=True))
+                        finally:
+                            if profiler:
+                                profiler.stop()
+                        if profiler:
+                            profiler.note("zip_bytes", zip_buffer.tell())
+                            render_memory_report(profiler, pipeline.output_dir)
+                        # Feed the estimator's benchmark history
+                        record_run(estimate, time.perf_counter() - started, zip_buffer.tell())
+                        stage_table.dataframe(pd.DataFrame(pipeline.stats()), hide_index=True)
                         
-                        # Generate
-                        generated = generate_bulk_certificates(df, images_dict, output_dir, branding)
+                        generated = [r.path for r in results if r.ok]
+                        failed = [r for r in results if not r.ok]
+                        if failed:
+                            st.error(f"{len(failed)} certificate(s) failed:")
+                            st.dataframe(pd.DataFrame([{
+                                "Branch Code": r.branch_code, "Reason": r.reason,
+                                "Seconds": round(r.seconds, 1), "Attempts": r.attempts
+                            } for r in failed]), hide_index=True)
+                        noted = [r for r in results if r.ok and r.reason]
+                        if noted:
+                            st.warning(f"{len(noted)} certificate(s) were generated without photos that couldn't be read:")
+                            st.dataframe(pd.DataFrame([{"Branch Code": r.branch_code, "Note": r.reason} for r in noted]), hide_index=True)
                         
                         if generated:
-                            zip_buffer = io.BytesIO()
-                            with zipfile.ZipFile(zip_buffer, "w") as zf:
-                                for pdf in generated:
-                                    zf.write(pdf, arcname=os.path.basename(pdf))
+                            get_registry().register_batch(sel_project['id'], df, pipeline.output_dir, rules)
                             st.success(f"✅ Successfully generated {len(generated)} certificates!")
                             st.download_button("Download Certificates ZIP", zip_buffer.getvalue(), "Certificates.zip", "application/zip")
                         else:
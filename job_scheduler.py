@@ -0,0 +1,251 @@
+"""
+Fair Job Scheduler for E-Warranty Portal
+Sits in front of the shared render pool. Each generation job is split into
+row chunks, and chunks are handed to the pool one at a time, interleaved
+fairly: first across internal companies, then across client projects inside a
+company (stride scheduling, weighted by tenant priority). Interactive jobs
+always go ahead of batch jobs, and a tenant can be capped to a number of
+chunks in flight, so a 20k-row overnight batch only uses spare capacity.
+
+Failure isolation: a chunk runs under a wall-clock limit of timeout x rows.
+If its worker hangs or dies, the chunk is split and every row re-run on its
+own, so only the culprit row is charged; failed rows are retried up to the
+job's retry budget.
+"""
+import itertools
+import threading
+import time
+
+import streamlit as st
+
+import metrics
+from render_pool import get_render_pool
+from render_worker import run_chunk
+
+INTERACTIVE, BATCH = 0, 1           # priority classes (lower runs first)
+INTERACTIVE_MAX_ROWS = 200          # jobs up to this size default to INTERACTIVE
+DEFAULT_CHUNK_SIZE = 10
+
+
+class GenerationJob:
+    """One submitted batch. results[i] is (ok, value_or_reason, seconds, attempts) for task i once done."""
+
+    def __init__(self, job_id, tenant, tasks, priority, chunk_size, timeout=None, retries=0):
+        self.id = job_id
+        self.tenant = tenant
+        self.priority = priority
+        self.timeout = timeout      # per task, seconds
+        self.retries = retries
+        self.total = len(tasks)
+        self.results = [None] * len(tasks)
+        self.attempts = [0] * len(tasks)
+        self.submitted_at = time.time()
+        self.finished_at = None
+        self._chunks = [
+            (start, tasks[start:start + chunk_size]) for start in range(0, len(tasks), chunk_size)
+        ]
+        self._next_chunk = 0
+        self._done_chunks = 0
+        self.cancelled = False
+        self._done = threading.Event()
+        self._callbacks = []
+        self._cb_lock = threading.Lock()
+        if not tasks:
+            self._finish()
+
+    @property
+    def done(self):
+        return sum(1 for r in self.results if r is not None)
+
+    @property
+    def pending_chunks(self):
+        return len(self._chunks) - self._next_chunk
+
+    def wait(self, timeout=None):
+        return self._done.wait(timeout)
+
+    def add_done_callback(self, fn):
+        """fn(job) once every task has a result (immediately if it already has). Must not block."""
+        with self._cb_lock:
+            if not self._done.is_set():
+                self._callbacks.append(fn)
+                return
+        fn(self)
+
+    def _finish(self):
+        self.finished_at = time.time()
+        with self._cb_lock:
+            self._done.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for fn in callbacks:
+            fn(self)
+
+
+class _Tenant:
+    __slots__ = ("key", "weight", "max_concurrency", "inflight", "pass_value", "jobs")
+
+    def __init__(self, key, weight=1.0, max_concurrency=None):
+        self.key = key
+        self.weight = weight
+        self.max_concurrency = max_concurrency
+        self.inflight = 0
+        self.pass_value = 0.0
+        self.jobs = []
+
+
+class FairScheduler:
+    """
+    submit(tenant, tasks) where tenant = (company, project) and tasks are
+    (fn, args) pairs for the render pool. Returns a GenerationJob.
+    """
+
+    def __init__(self, pool, max_inflight=None, chunk_size=DEFAULT_CHUNK_SIZE):
+        self.pool = pool
+        self.max_inflight = max_inflight or pool.size
+        self.chunk_size = chunk_size
+        self._lock = threading.Condition()
+        self._inflight = 0
+        self._ids = itertools.count(1)
+        self._tenants = {}          # (company, project) -> _Tenant
+        self._company_pass = {}     # company -> stride pass value
+        self._limits = {}           # (company, project) -> (weight, max_concurrency)
+        threading.Thread(target=self._dispatch_loop, name="fair-scheduler", daemon=True).start()
+        metrics.QUEUE_DEPTH.set_function(
+            lambda: sum(t["pending_chunks"] for t in self.status()["tenants"].values()), queue="scheduler")
+
+    # --- CONFIGURATION ---
+    def configure_tenant(self, tenant, weight=1.0, max_concurrency=None):
+        """Higher weight = larger share of the pool; max_concurrency caps chunks in flight."""
+        with self._lock:
+            self._limits[tenant] = (weight, max_concurrency)
+            if tenant in self._tenants:
+                self._tenants[tenant].weight = weight
+                self._tenants[tenant].max_concurrency = max_concurrency
+            self._lock.notify_all()
+
+    # --- SUBMISSION ---
+    def submit(self, tenant, tasks, priority=None, chunk_size=None, timeout=None, retries=0):
+        """timeout: wall-clock seconds per task (None = unlimited); retries: extra attempts for a failed task."""
+        if priority is None:
+            priority = INTERACTIVE if len(tasks) <= INTERACTIVE_MAX_ROWS else BATCH
+        job = GenerationJob(next(self._ids), tenant, list(tasks), priority, chunk_size or self.chunk_size,
+                            timeout, retries)
+        if job.total == 0:
+            return job
+        with self._lock:
+            t = self._tenants.get(tenant)
+            if t is None:
+                weight, max_conc = self._limits.get(tenant, (1.0, None))
+                t = self._tenants[tenant] = _Tenant(tenant, weight, max_conc)
+                # New tenants start level with the busiest ones instead of catching up on history
+                t.pass_value = min((x.pass_value for x in self._tenants.values() if x.jobs), default=0.0)
+                if tenant[0] not in self._company_pass:
+                    busy = [self._company_pass[x.key[0]] for x in self._tenants.values() if x.jobs]
+                    self._company_pass[tenant[0]] = min(busy, default=0.0)
+            t.jobs.append(job)
+            self._lock.notify_all()
+        return job
+
+    def cancel(self, job, reason="Cancelled"):
+        """
+        Drops a job's chunks not yet handed to the pool; their tasks fail with
+        reason. Chunks already in flight finish, but nothing is split or retried.
+        """
+        with self._lock:
+            if job.cancelled or job._done.is_set():
+                return
+            job.cancelled = True
+            for start, chunk in job._chunks[job._next_chunk:]:
+                for i in range(len(chunk)):
+                    job.results[start + i] = (False, reason, 0.0, job.attempts[start + i])
+            del job._chunks[job._next_chunk:]
+            if job._done_chunks == len(job._chunks):
+                self._tenants[job.tenant].jobs.remove(job)
+                job._finish()
+            self._lock.notify_all()
+
+    def status(self):
+        """Snapshot for dashboards: per-tenant jobs, pending chunks and chunks in flight."""
+        with self._lock:
+            return {
+                "inflight": self._inflight,
+                "tenants": {
+                    t.key: {"jobs": len(t.jobs), "pending_chunks": sum(j.pending_chunks for j in t.jobs), "inflight": t.inflight}
+                    for t in self._tenants.values() if t.jobs or t.inflight
+                },
+            }
+
+    # --- DISPATCH ---
+    def _eligible(self, t, priority):
+        if t.max_concurrency is not None and t.inflight >= t.max_concurrency:
+            return None
+        jobs = [j for j in t.jobs if j.pending_chunks and j.priority == priority]
+        return min(jobs, key=lambda j: j.id) if jobs else None
+
+    def _pick(self):
+        """Next (tenant, job): best priority class, then least-served company, then least-served project."""
+        for priority in (INTERACTIVE, BATCH):
+            candidates = {}
+            for t in self._tenants.values():
+                job = self._eligible(t, priority)
+                if job is not None:
+                    candidates.setdefault(t.key[0], []).append((t, job))
+            if not candidates:
+                continue
+            company = min(candidates, key=lambda c: self._company_pass[c])
+            t, job = min(candidates[company], key=lambda tj: tj[0].pass_value)
+            return t, job
+        return None, None
+
+    def _dispatch_loop(self):
+        while True:
+            with self._lock:
+                while True:
+                    t, job = (None, None) if self._inflight >= self.max_inflight else self._pick()
+                    if job is not None:
+                        break
+                    self._lock.wait()
+                start, chunk = job._chunks[job._next_chunk]
+                job._next_chunk += 1
+                self._inflight += 1
+                t.inflight += 1
+                t.pass_value += 1.0 / t.weight
+                self._company_pass[t.key[0]] += 1.0
+            limit = job.timeout * len(chunk) if job.timeout else None
+            future = self.pool.submit_with_timeout(limit, run_chunk, chunk)
+            future.add_done_callback(
+                lambda f, t=t, job=job, start=start, chunk=chunk, sent=time.perf_counter():
+                self._chunk_done(t, job, start, chunk, sent, f)
+            )
+
+    def _chunk_done(self, t, job, start, chunk, sent, future):
+        try:
+            results = future.result()
+        except Exception as e:  # the whole chunk was lost (worker crash or timeout)
+            results = None
+            lost = (False, f"{type(e).__name__}: {e}", time.perf_counter() - sent)
+        with self._lock:
+            if results is None and len(chunk) > 1 and not job.cancelled:
+                # Re-run each row on its own so only the culprit is charged
+                job._chunks.extend((start + i, [task]) for i, task in enumerate(chunk))
+            else:
+                for i, (ok, value, seconds) in enumerate(results or [lost] * len(chunk)):
+                    idx = start + i
+                    job.attempts[idx] += 1
+                    if not ok and job.attempts[idx] <= job.retries and not job.cancelled:
+                        job._chunks.append((idx, [chunk[i]]))
+                    else:
+                        job.results[idx] = (ok, value, seconds, job.attempts[idx])
+            job._done_chunks += 1
+            self._inflight -= 1
+            t.inflight -= 1
+            if job._done_chunks == len(job._chunks):
+                t.jobs.remove(job)
+                job._finish()
+            self._lock.notify_all()
+
+
+@st.cache_resource
+def get_scheduler():
+    """Server-wide scheduler in front of the shared render pool."""
+    return FairScheduler(get_render_pool())
@@ -1,7 +1,9 @@
 import streamlit as st
 import os
-from PIL import Image
 import admin_modules
+import auth
+from render_pool import get_render_pool
+from metrics import start_exporter
 
 # Page Configuration
 st.set_page_config(
@@ -28,6 +30,9 @@ if 'current_view' not in st.session_state:
 # Initialize Mock Data consistently
 admin_modules.init_mock_data()
 
+# Metrics endpoint/file, if METRICS_PORT / METRICS_FILE are set
+start_exporter()
+
 # --- AUTHENTICATION VIEW ---
 def login_view():
     c1, c2, c3 = st.columns([1, 1, 1])
@@ -48,19 +53,13 @@ def login_view():
             submitted = st.form_submit_button("Sign In", use_container_width=True)
             
             if submitted:
-                # Mock Auth Logic (Replace with auth.sign_in)
-                user_found = None
-                # Check mocked profiles in admin_modules
-                # (We initialize them there, but might need to ensure they exist here or duplicate init)
-                # To be safe, we rely on admin_modules mock init running once or check here.
-                # Let's import the session state mock from admin_modules logic via a dummy call or check here.
-                
-                # Basic Mock Check if specific user
-                if email == "admin@triad.com":
-                    st.session_state.user = {"email": email, "role": "admin", "full_name": "System Admin"}
-                    st.rerun()
-                elif email == "user@triad.com":
-                    st.session_state.user = {"email": email, "role": "user", "full_name": "Operations User"}
+                if auth.init_supabase():
+                    user = auth.login(email, password)
+                else:
+                    # Supabase not configured: fall back to the mock profiles
+                    user = next((p for p in st.session_state.profiles if p['email'].lower() == email.strip().lower()), None)
+                if user:
+                    st.session_state.user = user
                     st.rerun()
                 else:
                     st.error("Invalid Credentials. (Try admin@triad.com)")
@@ -71,6 +70,8 @@ def login_view():
 def main_app():
     user = st.session_state.user
     role = user.get('role', 'user')
+    # Start (or reuse) the shared render workers once someone has logged in, so they are warm by the first generation
+    get_render_pool()
     
     # SYSTEM HEADER (Top Right Profile)
     # Using columns to create a header bar
@@ -89,12 +90,13 @@ def main_app():
         
         options = ["Warranty Generator"]
         if role == 'admin':
-            options = ["Warranty Generator", "Client Projects", "Internal Companies", "User Management"]
+            options = ["Warranty Generator", "Client Projects", "Internal Companies", "User Management", "Expiry Analytics"]
             
         selection = st.radio("Go To", options)
         
         st.divider()
         if st.button("Log Out"):
+            auth.logout()
             st.session_state.user = None
             st.rerun()
             
@@ -107,6 +109,9 @@ def main_app():
         admin_modules.render_company_management()
     elif selection == "Client Projects" and role == 'admin':
         admin_modules.render_project_management()
+    elif selection == "Expiry Analytics" and role == 'admin':
+        from expiry_analytics import render_expiry_dashboard
+        render_expiry_dashboard(st.session_state.client_projects, lambda p: p['client_name'])
 
     # GLOBAL FOOTER
     st.markdown("---")
@@ -115,6 +120,9 @@ def main_app():
 
 # --- ENTRY POINT ---
 if __name__ == "__main__":
+    if 'auth_session' in st.session_state:
+        # Local token check; refreshes in the background near expiry
+        st.session_state.user = auth.ensure_session()
     if st.session_state.user:
         main_app()
     else:
@@ -0,0 +1,268 @@
+"""
+Memory Profiling for Bulk Generation (opt-in)
+Wraps a GenerationPipeline run with tracemalloc and RSS sampling and reports,
+per pipeline stage, the peak and the retained Python memory plus the top
+allocation sites at the overall peak. Allocations are attributed to a stage by
+the pipeline method on their stack (ingest / photos / render / package), so
+concurrent stages are told apart; anything else (DataFrame, uploads, session)
+lands in "other". Renders that run in the render pool are separate processes:
+they are covered by the workers' RSS, not by tracemalloc.
+
+Turn on with MEMORY_PROFILE=1 (or the checkbox in the generator). With the
+render pool the overhead is small; rendering inline (no scheduler) under
+tracemalloc is many times slower, so keep it for diagnosis, not normal runs.
+"""
+import ast
+import json
+import logging
+import os
+import threading
+import time
+import tracemalloc
+from datetime import datetime
+from functools import lru_cache
+
+MEMORY_PROFILE = os.environ.get("MEMORY_PROFILE", "0") not in ("0", "", "false")
+REPORT_DIR = os.environ.get("MEMORY_REPORT_DIR", os.path.join("benchmarks", "memory"))
+SAMPLE_INTERVAL = 1.0
+TRACE_FRAMES = 16
+TOP_SITES = 15
+
+# Pipeline methods -> stage they belong to (see pipeline.GenerationPipeline)
+STAGE_FUNCTIONS = {
+    "_ingest": "ingest",
+    "_photos": "photos",
+    "_prepare_photo": "photos",
+    "_load_photo": "photos",
+    "_render": "render",
+    "_rendered": "render",
+    "_package": "package",
+}
+STAGES = ("ingest", "photos", "render", "package", "other")
+_OWN_FILES = (tracemalloc.__file__, __file__)
+_PROFILER = "profiler"
+
+log = logging.getLogger(__name__)
+
+# tracemalloc is process-wide while profiling is per session: tracing stays on
+# until the last active profiler stops (and is only stopped if a profiler started it)
+_tracing_lock = threading.Lock()
+_tracing_users = 0
+_tracing_owned = False
+
+
+@lru_cache(maxsize=1)
+def _pipeline_file():
+    import pipeline
+    return os.path.abspath(pipeline.__file__)
+
+
+@lru_cache(maxsize=1)
+def _pipeline_functions():
+    """{line: method name} for pipeline.py (tracemalloc frames carry only file and line)."""
+    with open(_pipeline_file()) as f:
+        tree = ast.parse(f.read())
+    lines = {}
+    # ast.walk visits outer definitions first, so nested callbacks keep their method's name
+    for node in ast.walk(tree):
+        if isinstance(node, ast.FunctionDef):
+            for line in range(node.lineno, node.end_lineno + 1):
+                lines.setdefault(line, node.name)
+    return lines
+
+
+def rss_bytes(pid="self"):
+    """Resident set size of a process (Linux /proc); this process falls back to its peak RSS elsewhere."""
+    try:
+        with open(f"/proc/{pid}/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        if pid == "self":
+            import resource  # POSIX only; /proc is tried first
+            return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+        return 0
+
+
+class MemoryProfiler:
+    """
+    with MemoryProfiler(pool=render_pool) as prof:
+        prof.note("dataframe_bytes", df.memory_usage(deep=True).sum())
+        pipeline.run(...)
+    prof.write_report(output_dir)
+    """
+
+    def __init__(self, interval=SAMPLE_INTERVAL, pool=None, frames=TRACE_FRAMES):
+        self.interval = interval
+        self.pool = pool
+        self.frames = frames
+        self.notes = {}
+        self.samples = []                 # [{t, rss, workers_rss, traced, stages}]
+        self.stage_peak = dict.fromkeys(STAGES, 0)
+        self.stage_retained = dict.fromkeys(STAGES, 0)
+        self.peak_sites = []
+        self.retained_sites = []
+        self.peak_traced = 0
+        self._peak_seen = -1
+        self._stage_of = {}               # traceback -> stage, reused across snapshots
+        self._stop = threading.Event()
+        self._thread = None
+        self._tracing = False
+        self._baseline = None
+        self._t0 = None
+
+    def note(self, name, value):
+        """Records a fact for the report (sizes of inputs, row counts...)."""
+        self.notes[name] = value.item() if hasattr(value, "item") else value   # numpy scalars -> JSON-able
+
+    # --- SAMPLING ---
+    def _classify(self, traceback):
+        stage = self._stage_of.get(traceback)
+        if stage is None:
+            stage = "other"
+            if traceback[-1].filename in _OWN_FILES:
+                stage = _PROFILER   # the profiler's own bookkeeping is not part of the batch
+            else:
+                for frame in reversed(traceback):   # innermost pipeline method wins
+                    if os.path.abspath(frame.filename) == _pipeline_file():
+                        name = STAGE_FUNCTIONS.get(_pipeline_functions().get(frame.lineno))
+                        if name:
+                            stage = name
+                            break
+            self._stage_of[traceback] = stage
+        return stage
+
+    def _by_stage(self, snapshot):
+        totals = dict.fromkeys(STAGES + (_PROFILER,), 0)
+        for trace in snapshot.traces:
+            totals[self._classify(trace.traceback)] += trace.size
+        del totals[_PROFILER]
+        return totals
+
+    def _sample(self):
+        snapshot = tracemalloc.take_snapshot()
+        stages = self._by_stage(snapshot)
+        traced = sum(stages.values())
+        for name, size in stages.items():
+            self.stage_peak[name] = max(self.stage_peak[name], size)
+        workers = [rss_bytes(pid) for pid in (self.pool.pids if self.pool is not None else [])]
+        self.samples.append({
+            "t": round(time.perf_counter() - self._t0, 2),
+            "rss": rss_bytes(),
+            "workers_rss": sum(workers),
+            "traced": traced,
+            "stages": stages,
+        })
+        if traced > self._peak_seen:
+            self._peak_seen = traced
+            self.peak_sites = self._top_sites(snapshot)
+        return snapshot
+
+    @staticmethod
+    def _top_sites(snapshot, limit=TOP_SITES):
+        return [{"site": f"{s.traceback[0].filename}:{s.traceback[0].lineno}", "bytes": s.size, "blocks": s.count}
+                for s in snapshot.statistics("lineno")[:limit]]
+
+    def _loop(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self._sample()
+            except Exception as e:   # tracing stopped from outside: keep what was sampled
+                log.warning("Memory profiler sampling stopped: %s", e)
+                return
+
+    # --- LIFECYCLE ---
+    def start(self):
+        global _tracing_users, _tracing_owned
+        with _tracing_lock:
+            if _tracing_users == 0:
+                if not tracemalloc.is_tracing():
+                    tracemalloc.start(self.frames)
+                    _tracing_owned = True
+                # The peak is shared: only reset it when no other profile is running
+                tracemalloc.reset_peak()
+            _tracing_users += 1
+            self._tracing = True
+        self._t0 = time.perf_counter()
+        self._baseline = tracemalloc.take_snapshot()
+        self._thread = threading.Thread(target=self._loop, name="memory-profiler", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """Stops sampling and computes the retained figures; never raises (the batch comes first)."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        try:
+            self._finish()
+        except Exception as e:
+            log.warning("Memory profile incomplete: %s", e)
+        finally:
+            self._baseline = None
+            self._release_tracing()
+
+    def _release_tracing(self):
+        global _tracing_users, _tracing_owned
+        with _tracing_lock:
+            if not self._tracing:
+                return
+            self._tracing = False
+            _tracing_users -= 1
+            if _tracing_users == 0 and _tracing_owned:
+                _tracing_owned = False
+                tracemalloc.stop()
+
+    def _finish(self):
+        final = self._sample()
+        self.peak_traced = tracemalloc.get_traced_memory()[1]
+        # Retained: what is still allocated at the end that wasn't before the run
+        baseline_stages = self._by_stage(self._baseline)
+        self.stage_retained = {name: max(0, final_size - baseline_stages[name])
+                               for name, final_size in self.samples[-1]["stages"].items()}
+        self.retained_sites = [
+            {"site": f"{s.traceback[0].filename}:{s.traceback[0].lineno}", "bytes": s.size_diff, "blocks": s.count_diff}
+            for s in final.compare_to(self._baseline, "lineno")[:TOP_SITES] if s.size_diff > 0
+        ]
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+        return False
+
+    # --- REPORT ---
+    def report(self):
+        rss = [s["rss"] for s in self.samples]
+        workers = [s["workers_rss"] for s in self.samples]
+        return {
+            "created_at": datetime.now().isoformat(timespec="seconds"),
+            "seconds": self.samples[-1]["t"] if self.samples else 0,
+            "notes": self.notes,
+            "peak_traced_bytes": self.peak_traced,
+            "peak_rss_bytes": max(rss, default=0),
+            "peak_workers_rss_bytes": max(workers, default=0),
+            "stages": [{"stage": name, "peak_bytes": self.stage_peak[name], "retained_bytes": self.stage_retained[name]}
+                       for name in STAGES],
+            "top_sites_at_peak": self.peak_sites,
+            "top_retained_sites": self.retained_sites,
+            "samples": [{k: v for k, v in s.items() if k != "stages"} for s in self.samples],
+        }
+
+    def write_report(self, output_dir=None):
+        """
+        Writes memory_report.json into output_dir (next to the certificates) and a
+        copy under REPORT_DIR, which outlives temporary batch folders. Returns the paths.
+        """
+        data = json.dumps(self.report(), indent=1)
+        paths = []
+        stamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+        for folder, name in ((output_dir, "memory_report.json"), (REPORT_DIR, f"memory_{stamp}.json")):
+            if not folder:
+                continue
+            os.makedirs(folder, exist_ok=True)
+            path = os.path.join(folder, name)
+            with open(path, "w") as f:
+                f.write(data)
+            paths.append(path)
+        return paths
@@ -0,0 +1,258 @@
+"""
+Metrics for E-Warranty Portal
+Counters, histograms and callback gauges in the Prometheus text format, fed
+by the PDF engine, the generation pipeline and the render pool, labelled by
+company and project. Recording is a dict lookup and an add under a per-metric
+lock, so it stays on under load.
+
+Exposure (both off unless configured; one exporter per server process):
+    METRICS_PORT=9464          -> GET http://127.0.0.1:9464/metrics (METRICS_HOST to listen elsewhere)
+    METRICS_FILE=/path/x.prom  -> rewritten every METRICS_FILE_SECONDS (textfile collector)
+
+Metrics live per process: renders inside render-pool workers report through
+the parent's job path (outcome, latency), not from the worker itself.
+"""
+import bisect
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+METRICS_PORT = os.environ.get("METRICS_PORT")
+# Labels carry company and project names: only a local scraper sees them unless told otherwise
+METRICS_HOST = os.environ.get("METRICS_HOST", "127.0.0.1")
+METRICS_FILE = os.environ.get("METRICS_FILE")
+METRICS_FILE_SECONDS = float(os.environ.get("METRICS_FILE_SECONDS", "15"))
+
+# Per-certificate render latency (seconds) and batch duration buckets
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2, 5, 10, 30, 60, 120)
+BATCH_BUCKETS = (1, 5, 15, 30, 60, 120, 300, 600, 1800, 3600)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names, values, extra=()):
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)] + list(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        return tuple(str(labels.get(n, "")) for n in self.labelnames)
+
+    def header(self):
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(self._key(labels), 0)
+
+    def samples(self):
+        with self._lock:
+            items = list(self._values.items())
+        return [f"{self.name}{_labels(self.labelnames, key)} {value}" for key, value in items]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help_text, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, amount, **labels):
+        key = self._key(labels)
+        idx = bisect.bisect_left(self.buckets, amount)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][idx] += 1
+            state[1] += amount
+            state[2] += 1
+
+    def count(self, **labels):
+        state = self._values.get(self._key(labels))
+        return state[2] if state else 0
+
+    def samples(self):
+        with self._lock:
+            items = [(key, (list(s[0]), s[1], s[2])) for key, s in self._values.items()]
+        out = []
+        for key, (counts, total, n) in items:
+            cumulative = 0
+            for bound, c in zip(self.buckets + (float("inf"),), counts):
+                cumulative += c
+                le = 'le="+Inf"' if bound == float("inf") else f'le="{float(bound)!r}"'
+                out.append(f"{self.name}_bucket{_labels(self.labelnames, key, [le])} {cumulative}")
+            out.append(f"{self.name}_sum{_labels(self.labelnames, key)} {total}")
+            out.append(f"{self.name}_count{_labels(self.labelnames, key)} {n}")
+        return out
+
+
+class Gauge(_Metric):
+    """Read at scrape time from callbacks: fn() -> number, one per label set."""
+    kind = "gauge"
+
+    def set_function(self, fn, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = fn
+
+    def samples(self):
+        with self._lock:
+            items = list(self._values.items())
+        out = []
+        for key, fn in items:
+            try:
+                out.append(f"{self.name}{_labels(self.labelnames, key)} {fn()}")
+            except Exception:
+                continue  # a source that went away (e.g. a shut-down pool) is just skipped
+        return out
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _get(self, cls, name, help_text, labelnames, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, help_text, labelnames, **kwargs)
+            return metric
+
+    def counter(self, name, help_text, labelnames=()):
+        return self._get(Counter, name, help_text, labelnames)
+
+    def histogram(self, name, help_text, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self._get(Histogram, name, help_text, labelnames, buckets=buckets)
+
+    def gauge(self, name, help_text, labelnames=()):
+        return self._get(Gauge, name, help_text, labelnames)
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format."""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines += metric.header() + metric.samples()
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+TENANT_LABELS = ("company", "project")
+CERTIFICATES = REGISTRY.counter(
+    "warranty_certificates_total", "Certificates rendered, by outcome (ok / failed)", TENANT_LABELS + ("status",))
+RENDER_SECONDS = REGISTRY.histogram(
+    "warranty_certificate_render_seconds", "Render time per certificate", TENANT_LABELS)
+RETRIES = REGISTRY.counter(
+    "warranty_certificate_retries_total", "Extra render attempts after a failure or timeout", TENANT_LABELS)
+BATCHES = REGISTRY.counter(
+    "warranty_batches_total", "Bulk generation batches run", TENANT_LABELS + ("path",))
+BATCH_SECONDS = REGISTRY.histogram(
+    "warranty_batch_seconds", "Wall-clock time per bulk batch", TENANT_LABELS, buckets=BATCH_BUCKETS)
+CACHE_REQUESTS = REGISTRY.counter(
+    "warranty_cache_requests_total", "Cache lookups by cache and result (hit / miss)", ("cache", "result"))
+QUEUE_DEPTH = REGISTRY.gauge(
+    "warranty_queue_depth", "Items waiting, by queue", ("queue",))
+WORKERS_BUSY = REGISTRY.gauge(
+    "warranty_render_workers_busy", "Render pool workers currently rendering")
+
+
+def tenant_labels(tenant=None, branding_config=None):
+    """{'company', 'project'} from a scheduler tenant (company, project) or, failing that, the branding config."""
+    if tenant:
+        company, project = tenant
+    else:
+        company, project = "", (branding_config or {}).get("project_id", "")
+    return {"company": company, "project": project}
+
+
+def record_certificate(labels, result):
+    """One finished certificate (a pdf_engine.CertificateResult)."""
+    CERTIFICATES.inc(status="ok" if result.ok else "failed", **labels)
+    RENDER_SECONDS.observe(result.seconds, **labels)
+    if result.attempts > 1:
+        RETRIES.inc(result.attempts - 1, **labels)
+
+
+def record_batch(labels, seconds, path):
+    BATCHES.inc(path=path, **labels)
+    BATCH_SECONDS.observe(seconds, **labels)
+
+
+def cache_lookup(cache, hit):
+    CACHE_REQUESTS.inc(cache=cache, result="hit" if hit else "miss")
+
+
+# --- EXPOSURE ---
+class _Handler(BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_response(404)
+            self.end_headers()
+            return
+        data = REGISTRY.render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+def write_textfile(path):
+    """Atomically rewrites a .prom file for a textfile collector."""
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w") as f:
+        f.write(REGISTRY.render())
+    os.replace(tmp, path)
+
+
+_exporter_started = False
+_exporter_lock = threading.Lock()
+
+
+def start_exporter(port=METRICS_PORT, path=METRICS_FILE, interval=METRICS_FILE_SECONDS, host=METRICS_HOST):
+    """Starts the configured exposure once per process; a no-op when neither is set."""
+    global _exporter_started
+    with _exporter_lock:
+        if _exporter_started:
+            return
+        _exporter_started = True
+    if port:
+        server = ThreadingHTTPServer((host, int(port)), _Handler)
+        threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    if path:
+        def _loop():
+            while True:
+                try:
+                    write_textfile(path)
+                except OSError:
+                    pass
+                time.sleep(interval)
+        threading.Thread(target=_loop, name="metrics-file", daemon=True).start()
@@ -1,14 +1,28 @@
 from reportlab.lib.pagesizes import A4
 from reportlab.lib import colors
-from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Image, Spacer, PageBreak, Paragraph
+from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Image, Spacer, PageBreak, Paragraph, Flowable
 from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
 from reportlab.lib.units import inch
 from reportlab.lib.enums import TA_CENTER, TA_LEFT, TA_JUSTIFY
 from reportlab.pdfgen import canvas
-import pandas as pd
+from reportlab.lib.utils import ImageReader
+from reportlab.pdfbase.pdfdoc import DummyDoc, PDFText
 import os
-from dateutil.relativedelta import relativedelta
+import base64
+import io
+import hashlib
+import hmac
+import json
+import logging
+import time
 from datetime import datetime
+from functools import lru_cache
+from warranty_rules import compile_rules
+from asset_store import LOGO_BOX_INCHES, pdf_logo_path
+from render_worker import run_chunk
+import metrics
+
+log = logging.getLogger(__name__)
 
 # Color Constants
 TRIAD_ORANGE = colors.Color(0.9, 0.4, 0.1)  # Approx Orange/Rust
@@ -16,13 +30,292 @@ BANK_GREEN = colors.Color(0.0, 0.5, 0.0)    # Dark Green
 HEADER_BG_COLOR = colors.whitesmoke
 BORDER_COLOR = colors.black
 
+# Serial Numbers & Verification Codes
+SERIAL_PREFIX = "TRD"
+VERIFY_SECRET = os.environ.get("CERT_VERIFY_SECRET", "").encode()
+if not VERIFY_SECRET:
+    # Without a real secret anyone can compute valid verification codes
+    VERIFY_SECRET = b"change-me-in-production"
+    log.warning("CERT_VERIFY_SECRET is not set: verification codes use a public default secret "
+                "and can be forged. Set CERT_VERIFY_SECRET before issuing real certificates.")
+
+# Bulk generation: wall-clock limit per certificate (pool/scheduler runs) and extra attempts
+RENDER_TIMEOUT_SECONDS = 120
+RENDER_RETRIES = 1
+
+# Per-process caches (kept warm in render pool workers)
+_STYLES = None
+_LOGO_CACHE = {}
+
+# Deterministic output: fixed timestamps and a document ID derived from the inputs,
+# so identical inputs give byte-identical PDFs (ETags, dedupe, batch diffs).
+# Bump PDF_LAYOUT_VERSION whenever the layout changes so old fingerprints don't match.
+DETERMINISTIC_PDF = os.environ.get("DETERMINISTIC_PDF", "1") != "0"
+PDF_LAYOUT_VERSION = 1
+
+# Named destination marking the first Terms & Conditions page
+TERMS_BOOKMARK = "terms"
+TERMS_OUTLINE_TITLE = "Terms & Conditions"
+
+def clean_branch_code(raw):
+    """Branch codes come back from Excel as floats (101.0); keep the integer part."""
+    return str(raw).split('.')[0]
+
+
+def parse_install_date(install_date_raw):
+    """Accepts datetime/Timestamp or 'YYYY-MM-DD' / 'DD-MM-YYYY' strings. Falls back to today."""
+    if isinstance(install_date_raw, str):
+        try:
+            return datetime.strptime(install_date_raw, "%Y-%m-%d")
+        except:
+            install_date = datetime.today()
+            try: install_date = datetime.strptime(install_date_raw, "%d-%m-%Y") 
+            except: pass
+            return install_date
+    return install_date_raw
+
+
+@lru_cache(maxsize=32)
+def _row_index(columns):
+    """{column: position}, shared by every row of a sheet (and rebuilt once per worker)."""
+    return {name: i for i, name in enumerate(columns)}
+
+
+def _restore_row(columns, values):
+    return CertificateRow(_row_index(columns), values)
+
+
+class CertificateRow:
+    """
+    One sheet row on the render path: a tuple of values plus the sheet's shared
+    column index, read like the Series it replaces (row.get(col, default),
+    row[col], dict(row)). Values keep their column's type instead of the
+    per-row coercion of iterrows(); pickles as (columns, values) for workers.
+    """
+    __slots__ = ("_index", "_values")
+
+    def __init__(self, index, values):
+        self._index = index
+        self._values = values
+
+    def get(self, key, default=None):
+        i = self._index.get(key)
+        return default if i is None else self._values[i]
+
+    def __getitem__(self, key):
+        return self._values[self._index[key]]
+
+    def __contains__(self, key):
+        return key in self._index
+
+    def __iter__(self):
+        return iter(self._index)
+
+    def __len__(self):
+        return len(self._values)
+
+    def keys(self):
+        return self._index.keys()
+
+    def items(self):
+        return zip(self._index, self._values)
+
+    def __reduce__(self):
+        return _restore_row, (tuple(self._index), self._values)
+
+    def __repr__(self):
+        return f"CertificateRow({dict(self.items())!r})"
+
+
+def certificate_rows(df):
+    """CertificateRow per sheet row, in order (itertuples: no Series built per row)."""
+    index = _row_index(tuple(df.columns))
+    return [CertificateRow(index, values) for values in df.itertuples(index=False, name=None)]
+
+
+def certificate_dates(data_row, rules=None):
+    """Returns (installation_date, expiry_date) for a row under the project's warranty rules."""
+    install_date = parse_install_date(data_row.get('installation_date', datetime.today()))
+    return install_date, compile_rules(rules).expiry_date(data_row, install_date)
+
+
+def certificate_filename(data_row):
+    """File name used for a row's certificate, e.g. Certificate_101_Jaipur Main.pdf"""
+    b_code = clean_branch_code(data_row.get('branch_code', '0'))
+    b_name = str(data_row.get('branch_name', 'Unknown')).replace('/', '-')
+    return f"Certificate_{b_code}_{b_name}.pdf"
+
+
+def get_styles():
+    """Sample stylesheet, built once per process (we never mutate it)."""
+    global _STYLES
+    if _STYLES is None:
+        _STYLES = getSampleStyleSheet()
+    return _STYLES
+
+
+def get_logo(logo_path):
+    """Decoded PDF-ready logo variant (asset_store) as an ImageReader, cached per file version. None if missing/unreadable."""
+    logo_path = pdf_logo_path(logo_path)
+    if not logo_path:
+        return None
+    key = (logo_path, os.path.getmtime(logo_path))
+    metrics.cache_lookup("logo", key in _LOGO_CACHE)
+    if key not in _LOGO_CACHE:
+        try:
+            reader = ImageReader(logo_path)
+            reader.getRGBData()  # decode now, not on first draw
+            _LOGO_CACHE[key] = reader
+        except Exception:
+            _LOGO_CACHE[key] = None
+    return _LOGO_CACHE[key]
+
+
+def _b32(digest, length):
+    return base64.b32encode(digest).decode()[:length]
+
+
+def certificate_serial(data_row, project_id):
+    """
+    Stable serial for a row, e.g. TRD-7K3M-Q9XP-2AHD. Derived from project,
+    branch and installation date, so re-issuing the same certificate keeps its serial.
+    """
+    install_date = parse_install_date(data_row.get('installation_date', datetime.today()))
+    key = "|".join([
+        str(project_id),
+        clean_branch_code(data_row.get('branch_code', '0')),
+        str(data_row.get('ifsc_code', '')).strip().upper(),
+        install_date.strftime("%Y-%m-%d"),
+    ])
+    code = _b32(hashlib.sha256(key.encode()).digest(), 12)
+    return f"{SERIAL_PREFIX}-{code[:4]}-{code[4:8]}-{code[8:]}"
+
+
+def verification_code(serial, branch_code, expiry_date):
+    """Short keyed code printed next to the serial, e.g. ABCD-EFGH. Only the issuer can mint it."""
+    msg = f"{serial}|{branch_code}|{expiry_date.strftime('%Y-%m-%d')}".encode()
+    code = _b32(hmac.new(VERIFY_SECRET, msg, hashlib.sha256).digest(), 8)
+    return f"{code[:4]}-{code[4:]}"
+
+
+def draw_serial_footer(canvas, serial, code):
+    """Serial line above the footer; also stamped onto re-issued terms pages."""
+    width, height = A4
+    canvas.setFont("Helvetica-Bold", 8)
+    canvas.setFillColor(colors.black)
+    canvas.drawCentredString(width/2, 0.65*inch, f"Serial No: {serial}   |   Verification Code: {code}")
+
+
+class TermsMarker(Flowable):
+    """Zero-size flowable that adds a 'Terms & Conditions' outline entry on the first terms page."""
+
+    def wrap(self, availWidth, availHeight):
+        return (0, 0)
+
+    def draw(self):
+        self.canv.bookmarkPage(TERMS_BOOKMARK)
+        self.canv.addOutlineEntry(TERMS_OUTLINE_TITLE, TERMS_BOOKMARK, level=0)
+
+
+def _new_doc(output_path, deterministic=False):
+    return SimpleDocTemplate(
+        output_path, 
+        pagesize=A4,
+        rightMargin=0.5*inch, leftMargin=0.5*inch, 
+        topMargin=1.5*inch, bottomMargin=1.0*inch,
+        invariant=1 if deterministic else None
+    )
+
+
+def _photo_digest(source):
+    """Content digest of a photo (path or file-like), so temp paths don't change the fingerprint."""
+    h = hashlib.sha256()
+    if isinstance(source, str):
+        try:
+            with open(source, "rb") as f:
+                for block in iter(lambda: f.read(1 << 20), b""):
+                    h.update(block)
+        except OSError:
+            return None
+    else:
+        h.update(source.getvalue())
+    return h.hexdigest()
+
+
+def certificate_fingerprint(data_row, photos_map, branding_config, rules=None):
+    """sha256 over everything that shapes a row's certificate: row, dates, photos used, branding, layout version."""
+    rules = compile_rules(rules or branding_config.get('warranty_rules'))
+    row = dict(data_row)
+    branch_code = clean_branch_code(row.get('branch_code', '0'))
+    install_date, expiry_date = certificate_dates(data_row, rules)
+    keys = [key for _, key in rules.expected_photos(data_row, branch_code)] + [branch_code]
+    photos = {key: _photo_digest(photos_map[key]) for key in keys if key in photos_map}
+    logo_path = branding_config.get('logo_path')
+    payload = {
+        "layout": PDF_LAYOUT_VERSION,
+        "row": row,
+        "dates": [install_date, expiry_date],
+        "photos": photos,
+        "branding": branding_config,
+        "logo": _photo_digest(logo_path) if logo_path and os.path.exists(logo_path) else None,
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def _deterministic_canvas(fingerprint):
+    """Canvas class whose PDF /ID is the given fingerprint instead of a content/time digest."""
+    digest = bytes.fromhex(fingerprint)[:16]
+
+    class DeterministicCanvas(canvas.Canvas):
+        def __init__(self, *args, **kwargs):
+            kwargs['invariant'] = 1
+            super().__init__(*args, **kwargs)
+            ids = PDFText(digest, enc='raw').format(DummyDoc())
+            self._doc._ID = b'\n[' + ids + ids + b']\n% ReportLab generated PDF document -- digest (opensource)\n'
+
+    return DeterministicCanvas
+
+
+def terms_story(branding_config, styles):
+    """Flowables of the Terms & Conditions section (without the page break before it)."""
+    story = [TermsMarker()]
+    story.append(Paragraph("<b>Terms & Conditions</b>", styles['Heading2']))
+    story.append(Spacer(1, 10))
+    
+    terms_text = branding_config.get('terms_text', 'Standard Warranty Terms Apply.')
+    # Handle simple newlines in text
+    for line in terms_text.split('\n'):
+        if line.strip():
+            story.append(Paragraph(line, styles['Normal']))
+            story.append(Spacer(1, 6))
+    return story
+
+
+def render_terms_pdf(branding_config, output, deterministic=None):
+    """
+    Renders only the Terms & Conditions pages (header/footer, no serial).
+    Used to re-issue certificates after a project's terms change.
+    output: path or file-like object
+    """
+    deterministic = DETERMINISTIC_PDF if deterministic is None else deterministic
+    doc = _new_doc(output, deterministic)
+    fingerprint = hashlib.sha256(json.dumps(
+        {"layout": PDF_LAYOUT_VERSION, "terms": branding_config}, sort_keys=True, default=str
+    ).encode()).hexdigest()
+    doc.build(terms_story(branding_config, get_styles()),
+              onFirstPage=lambda c, d: draw_header_footer(c, d, branding_config),
+              onLaterPages=lambda c, d: draw_header_footer(c, d, branding_config),
+              canvasmaker=_deterministic_canvas(fingerprint) if deterministic else canvas.Canvas)
+
+
 def draw_header_footer(canvas, doc, branding_config):
     """
     Draws the Header (Logo + Title) and Footer on every page.
     branding_config: {
         'logo_path': str (path to Internal Company Logo),
         'client_name': str (e.g. Rajasthan Gramin Bank),
-        'terms_text': str
+        'terms_text': str,
+        'serial' / 'verification_code': str (per certificate, optional)
     }
     """
     width, height = A4
@@ -30,12 +323,14 @@ def draw_header_footer(canvas, doc, branding_config):
     
     # --- HEADER ---
     # Logo (Top Left)
-    logo_path = branding_config.get('logo_path')
-    if logo_path and os.path.exists(logo_path):
+    logo = get_logo(branding_config.get('logo_path'))
+    if logo:
         try:
             # Draw Internal Company Logo
             # Position: Top Left, small margin
-            canvas.drawImage(logo_path, 0.5*inch, height - 1.2*inch, width=1.5*inch, height=0.8*inch, preserveAspectRatio=True, mask='auto')
+            # The variant is pre-sized for this box with alpha flattened, so no mask/rescale work here
+            box_w, box_h = LOGO_BOX_INCHES
+            canvas.drawImage(logo, 0.5*inch, height - 1.2*inch, width=box_w*inch, height=box_h*inch, preserveAspectRatio=True)
         except Exception:
             pass
 
@@ -57,24 +352,27 @@ def draw_header_footer(canvas, doc, branding_config):
     canvas.drawCentredString(width/2, 0.5*inch, "This is a computer-generated warranty certificate. No signature required.")
     canvas.drawCentredString(width/2, 0.35*inch, "This document contains confidential terms and proprietary information")
     
+    serial = branding_config.get('serial')
+    if serial:
+        draw_serial_footer(canvas, serial, branding_config.get('verification_code', ''))
+    
     canvas.restoreState()
 
 
-def generate_certificate(data_row, photos_map, output_path, branding_config):
+def generate_certificate(data_row, photos_map, output_path, branding_config, rules=None, deterministic=None):
     """
     Generates a single PDF certificate.
-    data_row: dict of excel row data
+    data_row: excel row data (CertificateRow, dict or Series)
     photos_map: dict of {filename_key: file_path} (e.g. '3_1': 'path/to/img')
     branding_config: dict
+    rules: compiled warranty rules; compiled from branding_config['warranty_rules'] if not given
+    deterministic: byte-identical output for identical inputs (default: DETERMINISTIC_PDF)
     """
-    doc = SimpleDocTemplate(
-        output_path, 
-        pagesize=A4,
-        rightMargin=0.5*inch, leftMargin=0.5*inch, 
-        topMargin=1.5*inch, bottomMargin=1.0*inch
-    )
+    rules = compile_rules(rules or branding_config.get('warranty_rules'))
+    deterministic = DETERMINISTIC_PDF if deterministic is None else deterministic
+    doc = _new_doc(output_path, deterministic)
     
-    styles = getSampleStyleSheet()
+    styles = get_styles()
     story = []
     
     # 1. Branding / "Issued To" Line
@@ -95,7 +393,7 @@ def generate_certificate(data_row, photos_map, output_path, branding_config):
     # 2. Branch Details (Single Table)
     # Extract Data - using new column names
     branch_name = str(data_row.get('branch_name', 'N/A'))
-    branch_code = str(data_row.get('branch_code', 'N/A')).split('.')[0]  # Clean float
+    branch_code = clean_branch_code(data_row.get('branch_code', 'N/A'))
     ifsc = str(data_row.get('ifsc_code', 'N/A'))
     city = str(data_row.get('city_name', 'N/A'))
     address = str(data_row.get('address', 'N/A'))
@@ -103,18 +401,12 @@ def generate_certificate(data_row, photos_map, output_path, branding_config):
     state = str(data_row.get('state', 'N/A'))
     
     # Installation Date & Warranty Period
-    install_date_raw = data_row.get('installation_date', datetime.today())
-    if isinstance(install_date_raw, str):
-        try:
-            install_date = datetime.strptime(install_date_raw, "%Y-%m-%d")
-        except:
-            install_date = datetime.today()
-            try: install_date = datetime.strptime(install_date_raw, "%d-%m-%Y") 
-            except: pass
-    else:
-        install_date = install_date_raw
-
-    expiry_date = install_date + relativedelta(months=36)
+    install_date, expiry_date = certificate_dates(data_row, rules)
+    
+    # Serial & verification code for the footer
+    serial = certificate_serial(data_row, branding_config.get('project_id', ''))
+    branding_config = dict(branding_config, serial=serial,
+                           verification_code=verification_code(serial, branch_code, expiry_date))
     
     install_str = install_date.strftime("%d-%m-%Y")
     expiry_str = expiry_date.strftime("%d-%m-%Y")
@@ -146,108 +438,30 @@ def generate_certificate(data_row, photos_map, output_path, branding_config):
     story.append(Spacer(1, 20))
 
     # 3. Dynamic Warranty Sections (Core Logic)
-    # We check for 3 types: 
-    # Type 1: Complete Board (Suffix 1)
-    # Type 2: Only Fascia (Suffix 2)
-    # Type 3: Fascia + LED (Suffix 3)
-    
-    # Using new column names:
-    # complete_board_size, complete_board_qty, complete_board_sqft
-    # only_fascia_replacement_size, only_fascia_replacement_qty, only_fascia_replacement_sqft
-    # fascia_+_led_replacement_size, fascia_+_led_replacement_qty, fascia_+_led_replacement_sqft
-    # led_module_qty, power_supply_watt
-    
-    warranties = []
-    
-    # Get LED module data (shared across types)
-    led_module_qty = data_row.get('led_module_qty', 0)
-    power_supply_watt = data_row.get('power_supply_watt', 0)
-    
-    # --- Type 1 logic: Complete Board ---
-    if pd.notna(data_row.get('complete_board_size')):
-        warranties.append({
-            'type_id': '1',
-            'title': 'Complete Board',
-            'size': data_row.get('complete_board_size'),
-            'qty': data_row.get('complete_board_qty', 1),
-            'sqft': data_row.get('complete_board_sqft', 0),
-            'led_power_display': 'comprehensive',  # Merged cell showing "Comprehensive Warranty"
-        })
-        
-    # --- Type 2 logic: Only Fascia ---
-    if pd.notna(data_row.get('only_fascia_replacement_size')):
-        warranties.append({
-            'type_id': '2',
-            'title': 'Only Fascia Replacement',
-            'size': data_row.get('only_fascia_replacement_size'),
-            'qty': data_row.get('only_fascia_replacement_qty', 1),
-            'sqft': data_row.get('only_fascia_replacement_sqft', 0),
-            'led_power_display': 'blank',  # Leave blank
-        })
-
-    # --- Type 3 logic: Fascia + LED ---
-    if pd.notna(data_row.get('fascia_+_led_replacement_size')):
-        warranties.append({
-            'type_id': '3',
-            'title': 'Fascia + LED Replacement',
-            'size': data_row.get('fascia_+_led_replacement_size'),
-            'qty': data_row.get('fascia_+_led_replacement_qty', 1),
-            'sqft': data_row.get('fascia_+_led_replacement_sqft', 0),
-            'led_power_display': 'values',  # Show actual LED qty and Power watt
-            'led_qty': led_module_qty,
-            'power_watt': power_supply_watt,
-        })
-
-    # Render Warranties side-by-side or stacked
-    # Implementation: Render each as a block
-    
+    # Warranty types, their columns and how the extra (LED / Power) cells
+    # are shown come from the project's compiled rules (see warranty_rules.py).
+    warranties = rules.warranties(data_row)
+
     # Render all warranties in a single horizontal table
     if warranties:
         story.append(Paragraph("<b><i>Signage Specifications</i></b>", styles['Heading4']))
         story.append(Spacer(1, 5))
         
         # Table header
-        spec_data = [
-            ['Warranty Coverage', 'Board Size', 'Total Sqft', 'LED Module (Qty)', 'Power Supply']
-        ]
+        spec_data = [list(rules.spec_headers)]
         
-        # Track which rows need merged cells (for "Comprehensive Warranty")
+        # Track which rows need merged cells (e.g. "Comprehensive Warranty")
         merge_rows = []
         
         # Add rows for each warranty type
         for idx, w in enumerate(warranties):
-            row_idx = idx + 1  # +1 for header row
-            
-            if w['led_power_display'] == 'comprehensive':
-                # Complete Board: Merge LED and Power columns, show "Comprehensive Warranty"
-                spec_data.append([
-                    w['title'],
-                    str(w['size']),
-                    str(w['sqft']),
-                    'Comprehensive Warranty',
-                    ''  # Will be merged
-                ])
-                merge_rows.append(row_idx)
-            elif w['led_power_display'] == 'blank':
-                # Only Fascia: Leave LED and Power blank
-                spec_data.append([
-                    w['title'],
-                    str(w['size']),
-                    str(w['sqft']),
-                    '',
-                    ''
-                ])
-            else:
-                # Fascia + LED: Show actual values
-                spec_data.append([
-                    w['title'],
-                    str(w['size']),
-                    str(w['sqft']),
-                    str(w.get('led_qty', '')),
-                    str(w.get('power_watt', ''))
-                ])
+            spec_data.append([w['title'], str(w['size']), str(w['sqft'])] + w['extra_cells'])
+            if w['merged']:
+                merge_rows.append(idx + 1)  # +1 for header row
         
-        t_spec = Table(spec_data, colWidths=[1.8*inch, 1.0*inch, 1.0*inch, 1.5*inch, 1.5*inch])
+        n_extra = rules.n_extra
+        extra_width = (3.0*inch / n_extra) if n_extra else 0
+        t_spec = Table(spec_data, colWidths=[1.8*inch, 1.0*inch, 1.0*inch] + [extra_width] * n_extra)
         
         # Base style
         style_commands = [
@@ -262,9 +476,10 @@ def generate_certificate(data_row, photos_map, output_path, branding_config):
             ('TOPPADDING', (0,0), (-1,-1), 6),
         ]
         
-        # Add merge commands for "Comprehensive Warranty" rows
-        for row_idx in merge_rows:
-            style_commands.append(('SPAN', (3, row_idx), (4, row_idx)))
+        # Merge the extra columns for merged-display rows
+        if n_extra > 1:
+            for row_idx in merge_rows:
+                style_commands.append(('SPAN', (3, row_idx), (-1, row_idx)))
         
         t_spec.setStyle(TableStyle(style_commands))
         story.append(t_spec)
@@ -272,7 +487,7 @@ def generate_certificate(data_row, photos_map, output_path, branding_config):
         
         # Photos section - show all available photos
         for w in warranties:
-            photo_key_specific = f"{branch_code}_{w['type_id']}"
+            photo_key_specific = f"{branch_code}{w['photo_suffix']}"
             photo_key_generic = f"{branch_code}"
             
             img_path = None
@@ -288,6 +503,10 @@ def generate_certificate(data_row, photos_map, output_path, branding_config):
                     story.append(Paragraph(size_label, styles['Normal']))
                     story.append(Spacer(1, 5))
                     
+                    if deterministic and isinstance(img_path, str):
+                        # reportlab names file images after their path; in-memory ones after their content
+                        with open(img_path, "rb") as f:
+                            img_path = io.BytesIO(f.read())
                     img = Image(img_path, width=4*inch, height=2.5*inch)
                     story.append(img)
                     story.append(Spacer(1, 15))
@@ -295,54 +514,135 @@ def generate_certificate(data_row, photos_map, output_path, branding_config):
                     pass
         
         # If no photos found at all
-        if not any(f"{branch_code}_{w['type_id']}" in photos_map or f"{branch_code}" in photos_map for w in warranties):
+        if not any(f"{branch_code}{w['photo_suffix']}" in photos_map or f"{branch_code}" in photos_map for w in warranties):
             story.append(Paragraph("<i>[No Photo Available]</i>", styles['Normal']))
         
         story.append(Spacer(1, 20))
         
     # 4. Terms & Conditions Page
     story.append(PageBreak())
-    story.append(Paragraph("<b>Terms & Conditions</b>", styles['Heading2']))
-    story.append(Spacer(1, 10))
-    
-    terms_text = branding_config.get('terms_text', 'Standard Warranty Terms Apply.')
-    # Handle simple newlines in text
-    for line in terms_text.split('\n'):
-        if line.strip():
-            story.append(Paragraph(line, styles['Normal']))
-            story.append(Spacer(1, 6))
+    story.extend(terms_story(branding_config, styles))
 
     # Build
+    canvasmaker = canvas.Canvas
+    if deterministic:
+        canvasmaker = _deterministic_canvas(certificate_fingerprint(data_row, photos_map, branding_config, rules))
     doc.build(story, onFirstPage=lambda c, d: draw_header_footer(c, d, branding_config), 
-              onLaterPages=lambda c, d: draw_header_footer(c, d, branding_config))
+              onLaterPages=lambda c, d: draw_header_footer(c, d, branding_config),
+              canvasmaker=canvasmaker)
+
+
+class CertificateResult:
+    """
+    Outcome of one row in a bulk run: status is 'ok' or 'failed' (reason says why).
+    On an 'ok' row a reason is a note, e.g. photos that couldn't be read and were left out.
+    """
+    __slots__ = ("branch_code", "status", "path", "reason", "seconds", "attempts")
+
+    def __init__(self, branch_code, status, path=None, reason=None, seconds=0.0, attempts=1):
+        self.branch_code = branch_code
+        self.status = status
+        self.path = path
+        self.reason = reason
+        self.seconds = seconds
+        self.attempts = attempts
+
+    @property
+    def ok(self):
+        return self.status == "ok"
+
+    def as_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+
+def certificate_result(b_code, output_path, ok, reason, seconds, attempts, note=None):
+    if ok and not os.path.exists(output_path):
+        ok, reason = False, "No PDF written"
+    if ok:
+        return CertificateResult(b_code, "ok", output_path, note, seconds, attempts)
+    return CertificateResult(b_code, "failed", None, "; ".join(filter(None, (reason, note))), seconds, attempts)
 
 
-def generate_bulk_certificates(df, images_dict, output_dir, branding_config):
+def generate_bulk_results(df, images_dict, output_dir, branding_config, pool=None, scheduler=None, tenant=None,
+                          timeout=RENDER_TIMEOUT_SECONDS, retries=RENDER_RETRIES):
+    """
+    Same arguments as generate_bulk_certificates; returns one CertificateResult per row, in sheet order.
+    With a pool or scheduler every certificate runs in a worker process under a
+    wall-clock timeout (the worker is killed and replaced if it hangs) and a
+    failed row is retried up to `retries` times. In-process runs can't be
+    interrupted, so the timeout only applies to pool/scheduler runs.
+    """
+    started = time.perf_counter()
+    labels = metrics.tenant_labels(tenant, branding_config)
+    path = "scheduler" if scheduler is not None else "pool" if pool is not None else "inline"
+    results = _bulk_results(df, images_dict, output_dir, branding_config, pool, scheduler, tenant, timeout, retries)
+    for result in results:
+        metrics.record_certificate(labels, result)
+    metrics.record_batch(labels, time.perf_counter() - started, path)
+    return results
+
+
+def _bulk_results(df, images_dict, output_dir, branding_config, pool, scheduler, tenant, timeout, retries):
+    rules = compile_rules(branding_config.get('warranty_rules'))  # once per batch
+    rows = [(clean_branch_code(row.get('branch_code', '0')), row, os.path.join(output_dir, certificate_filename(row)))
+            for row in certificate_rows(df)]
+    
+    if scheduler is not None:
+        tasks = [(generate_certificate, (row, images_dict, output_path, branding_config, rules)) for _, row, output_path in rows]
+        job = scheduler.submit(tenant, tasks, timeout=timeout, retries=retries)
+        job.wait()
+        return [certificate_result(b_code, output_path, *outcome) for (b_code, _, output_path), outcome in zip(rows, job.results)]
+    
+    results = []
+    if pool is not None:
+        def submit(row, output_path):
+            task = (generate_certificate, (row, images_dict, output_path, branding_config, rules))
+            return pool.submit_with_timeout(timeout, run_chunk, [task])
+        
+        # Submit everything first; results are collected below in sheet order
+        futures = [submit(row, output_path) for _, row, output_path in rows]
+        for (b_code, row, output_path), future in zip(rows, futures):
+            for attempt in range(1, retries + 2):
+                try:
+                    ok, reason, seconds = future.result()[0]
+                except Exception as e:  # worker timed out or crashed
+                    ok, reason, seconds = False, f"{type(e).__name__}: {e}", timeout or 0.0
+                if ok or attempt > retries:
+                    break
+                future = submit(row, output_path)
+            results.append(certificate_result(b_code, output_path, ok, reason, seconds, attempt))
+        return results
+    
+    for b_code, row, output_path in rows:
+        started = time.perf_counter()
+        for attempt in range(1, retries + 2):
+            try:
+                generate_certificate(row, images_dict, output_path, branding_config, rules)
+                ok, reason = True, None
+            except Exception as e:
+                ok, reason = False, f"{type(e).__name__}: {e}"
+            if ok or attempt > retries:
+                break
+        results.append(certificate_result(b_code, output_path, ok, reason, time.perf_counter() - started, attempt))
+    return results
+
+
+def generate_bulk_certificates(df, images_dict, output_dir, branding_config, pool=None, scheduler=None, tenant=None):
     """
     df: Pandas DataFrame
     images_dict: { 'filename_no_ext': 'abspath' }
     output_dir: output folder
     branding_config: { ... }
+    pool: optional RenderPool (render_pool.py); rows are then rendered in parallel
+    scheduler/tenant: optional FairScheduler (job_scheduler.py) and (company, project);
+                      takes precedence over pool so batches share workers fairly
+    Returns the generated paths only (failures are logged); callers that show
+    failures to the user should use generate_bulk_results for per-row outcomes.
     """
     generated_files = []
-    
-    for _, row in df.iterrows():
-        try:
-            b_code_raw = row.get('branch_code', '0')
-            b_code = str(b_code_raw).split('.')[0]
-            b_name = str(row.get('branch_name', 'Unknown')).replace('/', '-')
-            
-            filename = f"Certificate_{b_code}_{b_name}.pdf"
-            output_path = os.path.join(output_dir, filename)
-            
-            generate_certificate(row, images_dict, output_path, branding_config)
-            
-            if os.path.exists(output_path):
-                generated_files.append(output_path)
-        except Exception as e:
-            print(f"Error generating {b_code}: {e}")
-            continue
-            
+    for result in generate_bulk_results(df, images_dict, output_dir, branding_config, pool, scheduler, tenant):
+        if result.ok:
+            generated_files.append(result.path)
+        else:
+            log.warning("Certificate for branch %s failed: %s", result.branch_code, result.reason)
     return generated_files
-
-
@@ -0,0 +1,155 @@
+"""
+Photo Library for E-Warranty Portal
+Site photos kept across batches, per project, indexed by (branch_code,
+type_id); the generic branch photo has type_id ''. Each entry points at the
+original in the photo store (photo_spool, content-addressed) and at a
+pre-resized, certificate-ready variant built once per content hash. A batch
+uses the upload for a slot when there is one and the library's variant
+otherwise, so a re-issue only needs the photos that changed, and photos seen
+before are never resized again.
+
+Local stand-in: SQLite for the table (see `project_photos` in db_schema.sql),
+the filesystem for the storage bucket:
+    assets/photos/library.db
+    assets/photos/variants/<sha256>_<px>.jpg
+"""
+import os
+import sqlite3
+import threading
+from datetime import datetime
+
+from PIL import Image as PILImage
+
+from pdf_engine import clean_branch_code
+from photo_spool import PHOTO_DIR, spool_buffer, stored_hash
+from pipeline import MAX_PHOTO_PX
+
+VARIANT_QUALITY = 85
+
+SCHEMA = """
+create table if not exists project_photos (
+  project_id text not null,
+  branch_code text not null,
+  type_id text not null,
+  content_hash text not null,
+  original_path text not null,
+  variant_path text not null,
+  updated_at text not null,
+  primary key (project_id, branch_code, type_id)
+);
+"""
+FIELDS = ("project_id", "branch_code", "type_id", "content_hash", "original_path", "variant_path", "updated_at")
+
+
+def photo_slots(df, rules):
+    """{photo_key: (branch_code, type_id)} for every photo the sheet can use (type_id '' = generic branch photo)."""
+    slots = {}
+    for _, row in df.iterrows():
+        b_code = clean_branch_code(row.get('branch_code', '0'))
+        for t, key in rules.expected_photos(row, b_code):
+            slots[key] = (b_code, t.type_id)
+        slots.setdefault(b_code, (b_code, ""))
+    return slots
+
+
+class PhotoLibrary:
+    def __init__(self, root=PHOTO_DIR, max_px=MAX_PHOTO_PX):
+        self.root = root
+        self.max_px = max_px
+        self.variant_dir = os.path.join(root, "variants")
+        self.db_path = os.path.join(root, "library.db")
+        os.makedirs(self.variant_dir, exist_ok=True)
+        with self._connect() as conn:
+            conn.executescript(SCHEMA)
+
+    def _connect(self):
+        # One short-lived connection per call: Streamlit serves each session from its own thread.
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        conn.execute("pragma journal_mode=wal")
+        return conn
+
+    # --- STORAGE ---
+    def _original(self, source, name):
+        """(content_hash, path) of a photo in the photo store; spooled paths are used as they are."""
+        if isinstance(source, str):
+            content_hash = stored_hash(source)
+            if content_hash:
+                return content_hash, source
+            with open(source, "rb") as f:
+                source = f.read()
+        path, _ = spool_buffer(source, name)
+        return stored_hash(path), path
+
+    def prepare(self, source, name=""):
+        """
+        Certificate-ready variant of a photo (a path or bytes): downsized JPEG
+        built once per content hash. Returns {'content_hash', 'original_path',
+        'variant_path'}; an image PIL can't re-encode keeps its original as the variant.
+        """
+        content_hash, original = self._original(source, name)
+        variant = os.path.join(self.variant_dir, f"{content_hash}_{self.max_px}.jpg")
+        if not os.path.exists(variant):
+            try:
+                with PILImage.open(original) as img:
+                    img.draft("RGB", (self.max_px, self.max_px))
+                    img.thumbnail((self.max_px, self.max_px))
+                    tmp = f"{variant}.{os.getpid()}.{threading.get_ident()}.tmp"
+                    img.convert("RGB").save(tmp, "JPEG", quality=VARIANT_QUALITY)
+                os.replace(tmp, variant)
+            except Exception:
+                variant = original   # hand the original bytes to reportlab
+        return {"content_hash": content_hash, "original_path": original, "variant_path": variant}
+
+    # --- INDEX ---
+    def entries(self, project_id):
+        """{(branch_code, type_id): row} of a project's library, variants that went missing left out."""
+        with self._connect() as conn:
+            rows = conn.execute("select * from project_photos where project_id = ?", (str(project_id),)).fetchall()
+        return {(r["branch_code"], r["type_id"]): dict(r) for r in rows if os.path.exists(r["variant_path"])}
+
+    def record(self, project_id, prepared):
+        """Upserts {(branch_code, type_id): prepare() result} into the project's library. Returns the count."""
+        updated_at = datetime.now().isoformat(timespec="seconds")
+        rows = [(str(project_id), b_code, type_id, p["content_hash"], p["original_path"], p["variant_path"], updated_at)
+                for (b_code, type_id), p in prepared.items()]
+        with self._connect() as conn:
+            conn.executemany(
+                f"insert into project_photos ({', '.join(FIELDS)}) values ({', '.join('?' * len(FIELDS))}) "
+                f"on conflict (project_id, branch_code, type_id) do update set "
+                f"content_hash = excluded.content_hash, original_path = excluded.original_path, "
+                f"variant_path = excluded.variant_path, updated_at = excluded.updated_at "
+                f"where content_hash != excluded.content_hash",
+                rows,
+            )
+        return len(rows)
+
+    def fill_missing(self, project_id, slots, photo_sources):
+        """
+        photo_sources plus the library's variant for every slot the upload
+        doesn't cover. Returns (sources, keys taken from the library).
+        """
+        library = self.entries(project_id)
+        sources = dict(photo_sources)
+        filled = [key for key, slot in slots.items() if key not in sources and slot in library]
+        for key in filled:
+            sources[key] = library[slots[key]]["variant_path"]
+        return sources, filled
+
+    def add_uploads(self, project_id, slots, photo_sources):
+        """Prepares and records every uploaded photo that fills a slot of the sheet. Returns the count."""
+        prepared = {slot: self.prepare(photo_sources[key], key) for key, slot in slots.items() if key in photo_sources}
+        return self.record(project_id, prepared)
+
+
+_library = None
+_library_lock = threading.Lock()
+
+
+def get_photo_library():
+    """Process-wide photo library shared by all sessions."""
+    global _library
+    with _library_lock:
+        if _library is None:
+            _library = PhotoLibrary()
+        return _library
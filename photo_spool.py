@@ -0,0 +1,161 @@
+"""
+Photo Spool for E-Warranty Portal
+Uploaded site photos are written to a content-addressed store on the rerun in
+which they arrive, not when Generate is pressed. Each upload is hashed and
+written in fixed-size chunks straight from its buffer through a memoryview, so
+no second in-memory copy of the photo is made; zip members are streamed the
+same way. A photo already in the store (same SHA-256) is not written again.
+Generation, estimates and previews then read plain file paths.
+
+Layout (local stand-in for the storage bucket):
+    assets/photos/<sha256[:2]>/<sha256>.<ext>
+"""
+import hashlib
+import os
+import tempfile
+import zipfile
+import zlib
+
+from asset_store import ASSET_DIR
+
+PHOTO_DIR = os.path.join(ASSET_DIR, "photos")
+PHOTO_EXTS = ('.jpg', '.jpeg', '.png')
+CHUNK_SIZE = 1 << 20
+
+
+def _store_path(content_hash, filename):
+    ext = os.path.splitext(filename)[1].lower() or ".img"
+    return os.path.join(PHOTO_DIR, content_hash[:2], f"{content_hash}{ext}")
+
+
+def stored_hash(path):
+    """Content hash of a path inside the photo store, or None for any other path."""
+    content_hash = os.path.splitext(os.path.basename(path))[0]
+    if len(content_hash) == 64 and os.path.abspath(_store_path(content_hash, path)) == os.path.abspath(path):
+        return content_hash
+    return None
+
+
+def _tmp_file():
+    """(open file, path) of a fresh temp file inside the store, renamed into place once hashed."""
+    os.makedirs(PHOTO_DIR, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=PHOTO_DIR, suffix=".tmp")
+    return os.fdopen(fd, "wb"), tmp
+
+
+def spool_buffer(buffer, filename):
+    """
+    Stores an in-memory photo (e.g. UploadedFile.getbuffer()) by content hash.
+    Returns (path, written); written is False when the photo was already stored.
+    """
+    with memoryview(buffer) as view:
+        digest = hashlib.sha256()
+        for start in range(0, len(view), CHUNK_SIZE):
+            digest.update(view[start:start + CHUNK_SIZE])
+        path = _store_path(digest.hexdigest(), filename)
+        if os.path.exists(path):
+            return path, False
+        f, tmp = _tmp_file()
+        try:
+            with f:
+                for start in range(0, len(view), CHUNK_SIZE):
+                    f.write(view[start:start + CHUNK_SIZE])
+        except BaseException:
+            os.remove(tmp)
+            raise
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    os.replace(tmp, path)
+    return path, True
+
+
+def spool_stream(stream, filename):
+    """
+    Stores a photo read from a file-like object (e.g. a zip member), hashing
+    while it is written, through one reused chunk buffer. Returns (path, written).
+    """
+    chunk = bytearray(CHUNK_SIZE)
+    digest = hashlib.sha256()
+    f, tmp = _tmp_file()
+    try:
+        with memoryview(chunk) as view, f:
+            while True:
+                n = stream.readinto(chunk)
+                if not n:
+                    break
+                digest.update(view[:n])
+                f.write(view[:n])
+        path = _store_path(digest.hexdigest(), filename)
+        if os.path.exists(path):
+            return path, False
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        os.replace(tmp, path)
+        return path, True
+    finally:
+        if os.path.exists(tmp):   # already stored, or the read failed (e.g. a CRC error)
+            os.remove(tmp)
+
+
+class PhotoSpool:
+    """
+    Photo key -> stored path for one session's uploads. Keep one per session
+    and call sync() with the uploader's current files on every rerun: only
+    uploads not seen before (by file id) are read, removed ones drop out.
+    A file that can't be read (corrupt zip, bad zip member) is skipped and
+    listed in errors() instead of failing the page.
+    """
+
+    def __init__(self):
+        self._uploads = {}       # file_id -> {photo_key: path}
+        self._errors = {}        # file_id -> ["name: reason"]
+        self.written = 0         # photos stored by this session
+        self.reused = 0          # photos that were already in the store
+
+    def _spool(self, uploaded):
+        """({photo_key: path}, [error]) for one upload."""
+        paths, errors = {}, []
+        try:
+            if uploaded.name.lower().endswith('.zip'):
+                with zipfile.ZipFile(uploaded) as z:
+                    for info in z.infolist():
+                        if info.is_dir() or not info.filename.lower().endswith(PHOTO_EXTS):
+                            continue
+                        try:
+                            with z.open(info) as member:
+                                path, written = spool_stream(member, info.filename)
+                        except (zipfile.BadZipFile, zlib.error, EOFError, OSError, RuntimeError) as e:
+                            errors.append(f"{uploaded.name}/{info.filename}: {e}")
+                            continue
+                        paths[os.path.splitext(os.path.basename(info.filename))[0]] = path
+                        self._count(written)
+            else:
+                path, written = spool_buffer(uploaded.getbuffer(), uploaded.name)
+                paths[os.path.splitext(uploaded.name)[0]] = path
+                self._count(written)
+        except (zipfile.BadZipFile, zlib.error, EOFError, OSError, RuntimeError) as e:
+            errors.append(f"{uploaded.name}: {e}")
+        return paths, errors
+
+    def _count(self, written):
+        if written:
+            self.written += 1
+        else:
+            self.reused += 1
+
+    def sync(self, uploaded_files):
+        """{photo_key: path} for the given uploads (later uploads win on a duplicate key)."""
+        current = {}
+        for uploaded in uploaded_files or []:
+            file_id = getattr(uploaded, "file_id", None) or (uploaded.name, uploaded.size)
+            if file_id not in self._uploads:
+                self._uploads[file_id], self._errors[file_id] = self._spool(uploaded)
+            current[file_id] = self._uploads[file_id]
+        self._uploads = current
+        self._errors = {file_id: self._errors[file_id] for file_id in current}
+        sources = {}
+        for paths in current.values():
+            sources.update(paths)
+        return sources
+
+    def errors(self):
+        """Problems with the uploads of the last sync(), one message per bad file or zip member."""
+        return [message for messages in self._errors.values() for message in messages]
@@ -0,0 +1,403 @@
+"""
+Staged Generation Pipeline for E-Warranty Portal
+Bulk generation as four stages running at the same time, joined by bounded
+queues, so photo I/O and zip writing hide behind rendering:
+
+    ingest (sheet rows) -> photos (thread pool: fetch + resize)
+                        -> render (render pool via the fair scheduler)
+                        -> package (writer thread: zip archive)
+
+stats() reports queue depth, throughput and busy share per stage, so the
+bottleneck is visible while a batch runs. If any stage fails the run is
+cancelled: every stage stops waiting on its queues and scheduler jobs not yet
+rendering are dropped.
+"""
+import io
+import os
+import queue
+import threading
+import time
+import zipfile
+from contextlib import contextmanager
+
+from PIL import Image as PILImage
+
+from job_scheduler import BATCH, INTERACTIVE, INTERACTIVE_MAX_ROWS
+from pdf_engine import (
+    RENDER_RETRIES, RENDER_TIMEOUT_SECONDS, CertificateResult, certificate_filename,
+    certificate_result, certificate_rows, clean_branch_code, generate_certificate,
+)
+from warranty_rules import compile_rules
+import metrics
+
+PHOTO_THREADS = 4
+QUEUE_SIZE = 32
+MAX_PHOTO_PX = 1600   # photos print at 4in wide; anything larger only slows rendering
+CANCEL_POLL_SECONDS = 0.2   # how often a blocked stage checks whether the run was cancelled
+
+_DONE = object()      # end-of-stream marker passed down the queues
+
+
+class _Stage:
+    """Counters for one stage. busy is seconds spent working, summed over its workers."""
+
+    def __init__(self, name, workers, inbox):
+        self.name = name
+        self.workers = workers
+        self.inbox = inbox
+        self.active = 0
+        self.done = 0
+        self.busy = 0.0
+        self.lock = threading.Lock()
+
+    @contextmanager
+    def track(self):
+        with self.lock:
+            self.active += 1
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            with self.lock:
+                self.active -= 1
+                self.done += 1
+                self.busy += time.perf_counter() - started
+
+
+def read_photo_source(source):
+    """Photo bytes from a path, an uploaded file (getbuffer) or a zero-arg callable (e.g. a zip member)."""
+    if isinstance(source, str):
+        with open(source, "rb") as f:
+            return f.read()
+    if callable(source):
+        return source()
+    return bytes(source.getbuffer())
+
+
+class GenerationPipeline:
+    """
+    df: prepared sheet; photo_sources: { 'photo_key': path | UploadedFile | callable }.
+    library: a photo_library.PhotoLibrary; photos go through its certificate-ready
+    variants, slots without an upload use the project's library, and the run's
+    uploads are added to it.
+    run(zip_target) renders every row and writes the PDFs into zip_target
+    (path or file object); returns CertificateResults in sheet order.
+    Without a scheduler rows are rendered in the render thread itself.
+    record_metrics=False keeps the run out of the certificate and batch
+    metrics (e.g. the estimator's sample renders).
+    """
+
+    def __init__(self, df, photo_sources, work_dir, branding_config, scheduler=None, tenant=None,
+                 photo_threads=PHOTO_THREADS, queue_size=QUEUE_SIZE, max_photo_px=MAX_PHOTO_PX,
+                 timeout=RENDER_TIMEOUT_SECONDS, retries=RENDER_RETRIES, library=None, record_metrics=True):
+        self.df = df
+        self.photo_sources = photo_sources
+        self.library = library
+        self._library_entries = {}
+        self._library_added = {}
+        self.branding = branding_config
+        self.rules = compile_rules(branding_config.get('warranty_rules'))
+        self.scheduler = scheduler
+        self.tenant = tenant
+        self.max_photo_px = max_photo_px
+        self.timeout = timeout
+        self.retries = retries
+        self.photo_dir = os.path.join(work_dir, "photos")
+        self.output_dir = os.path.join(work_dir, "output")
+        os.makedirs(self.photo_dir, exist_ok=True)
+        os.makedirs(self.output_dir, exist_ok=True)
+
+        # Two full chunks per scheduler slot: one rendering, one queued behind it
+        render_slots = 2 * scheduler.max_inflight * scheduler.chunk_size if scheduler is not None else 1
+        self._photo_q = queue.Queue(queue_size)
+        self._render_q = queue.Queue(queue_size)
+        # Bounded by the render slots below: a result is only produced for a held slot
+        self._package_q = queue.Queue()
+        self._slots = threading.Semaphore(render_slots)
+        self._render_slots = render_slots
+        self._photo_workers_left = photo_threads
+        self._photo_cache = {}
+        self._photo_lock = threading.Lock()
+        self.photo_errors = {}            # photo key -> why it couldn't be read
+        self._row_notes = {}              # sheet position -> photos left out of that row
+        self._cancel = threading.Event()
+        self._jobs = set()                # scheduler jobs not finished yet
+        self._jobs_lock = threading.Lock()
+        self._stages = {
+            "ingest": _Stage("Ingest", 1, None),
+            "photos": _Stage("Photo prep", photo_threads, self._photo_q),
+            "render": _Stage("Render", scheduler.max_inflight if scheduler is not None else 1, self._render_q),
+            "package": _Stage("Package", 1, self._package_q),
+        }
+        self.results = [None] * len(df)
+        self._labels = metrics.tenant_labels(tenant, branding_config) if record_metrics else None
+        self.started = None
+        self.error = None
+
+    # --- CANCELLATION ---
+    def _put(self, q, item):
+        """q.put that gives up once the run is cancelled. False if it did."""
+        while not self._cancel.is_set():
+            try:
+                q.put(item, timeout=CANCEL_POLL_SECONDS)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def _get(self, q):
+        """q.get that returns _DONE once the run is cancelled."""
+        while not self._cancel.is_set():
+            try:
+                return q.get(timeout=CANCEL_POLL_SECONDS)
+            except queue.Empty:
+                pass
+        return _DONE
+
+    def _acquire_slot(self):
+        """A render slot, or False once the run is cancelled."""
+        while not self._cancel.is_set():
+            if self._slots.acquire(timeout=CANCEL_POLL_SECONDS):
+                return True
+        return False
+
+    def _cancel_run(self):
+        """Stops every stage and drops the scheduler work not yet rendering."""
+        self._cancel.set()
+        if self.scheduler is not None:
+            with self._jobs_lock:
+                jobs = list(self._jobs)
+            for job in jobs:
+                self.scheduler.cancel(job, "Batch cancelled")
+
+    # --- STAGES ---
+    def _ingest(self):
+        stage = self._stages["ingest"]
+        try:
+            for pos, row in enumerate(certificate_rows(self.df)):
+                with stage.track():
+                    b_code = clean_branch_code(row.get('branch_code', '0'))
+                    keys = [(key, (b_code, t.type_id)) for t, key in self.rules.expected_photos(row, b_code)]
+                    keys.append((b_code, (b_code, "")))
+                if not self._put(self._photo_q, (pos, row, b_code, keys)):
+                    return
+        finally:
+            for _ in range(self._stages["photos"].workers):
+                self._put(self._photo_q, _DONE)
+
+    def _prepare_photo(self, key, slot):
+        """
+        Local, downsized JPEG for one photo key (once per key), or None if neither
+        uploaded nor in the library. An unreadable photo is left out (None) and
+        its error kept in photo_errors, so one bad file never stops the batch.
+        """
+        with self._photo_lock:
+            hit = key in self._photo_cache
+            metrics.cache_lookup("pipeline_photo", hit)
+            if hit:
+                return self._photo_cache[key]
+        try:
+            path = self._load_photo(key, slot)
+        except Exception as e:
+            path = None
+            with self._photo_lock:
+                self.photo_errors[key] = f"{type(e).__name__}: {e}"
+        with self._photo_lock:
+            self._photo_cache[key] = path
+        return path
+
+    def _load_photo(self, key, slot):
+        source = self.photo_sources.get(key)
+        path = None
+        if self.library is not None:
+            if source is not None:
+                prepared = self.library.prepare(source if isinstance(source, str) else read_photo_source(source), key)
+                path = prepared["variant_path"]
+                with self._photo_lock:
+                    self._library_added[slot] = prepared
+            else:
+                entry = self._library_entries.get(slot)
+                metrics.cache_lookup("photo_library", entry is not None)
+                path = entry["variant_path"] if entry else None
+        elif source is not None:
+            data = read_photo_source(source)
+            path = os.path.join(self.photo_dir, f"{key}.jpg")
+            try:
+                with PILImage.open(io.BytesIO(data)) as img:
+                    img.thumbnail((self.max_photo_px, self.max_photo_px))
+                    img.convert("RGB").save(path, "JPEG", quality=85)
+            except Exception:
+                # Not something PIL can re-encode: hand the original bytes to reportlab
+                with open(path, "wb") as f:
+                    f.write(data)
+        return path
+
+    def _photos(self):
+        stage = self._stages["photos"]
+        try:
+            while True:
+                item = self._get(self._photo_q)
+                if item is _DONE:
+                    break
+                pos, row, b_code, keys = item
+                with stage.track():
+                    photos = {}
+                    for key, slot in keys:
+                        path = self._prepare_photo(key, slot)
+                        if path:
+                            photos[key] = path
+                    left_out = [f"photo {key} left out ({self.photo_errors[key]})" for key, _ in keys if key in self.photo_errors]
+                    if left_out:
+                        self._row_notes[pos] = "; ".join(left_out)
+                if not self._put(self._render_q, (pos, row, b_code, photos)):
+                    break
+        finally:
+            with self._photo_lock:
+                self._photo_workers_left -= 1
+                last = self._photo_workers_left == 0
+            if last:
+                self._put(self._render_q, _DONE)
+
+    def _render(self):
+        stage = self._stages["render"]
+        priority = INTERACTIVE if len(self.df) <= INTERACTIVE_MAX_ROWS else BATCH
+        try:
+            item = None
+            while True:
+                if item is None:
+                    item = self._get(self._render_q)
+                if item is _DONE or not self._acquire_slot():
+                    break
+                if self.scheduler is None:
+                    self._render_here(item)
+                    item = None
+                    continue
+                # Rows already waiting go out as one job, so the scheduler gets full chunks
+                # instead of a job, callback and timeout per certificate
+                batch, item = [item], None
+                while len(batch) < self.scheduler.chunk_size:
+                    try:
+                        item = self._render_q.get_nowait()
+                    except queue.Empty:
+                        item = None
+                        break
+                    if item is _DONE or not self._slots.acquire(blocking=False):
+                        break   # handled by the outer loop
+                    batch.append(item)
+                    item = None
+                self._submit(batch, priority)
+        finally:
+            # Wait for renders still in flight before closing the stream
+            for _ in range(self._render_slots):
+                if not self._acquire_slot():
+                    break
+            self._package_q.put(_DONE)
+
+    def _render_here(self, item):
+        pos, row, b_code, photos = item
+        output_path = os.path.join(self.output_dir, certificate_filename(row))
+        started = time.perf_counter()
+        with self._stages["render"].track():
+            try:
+                generate_certificate(row, photos, output_path, self.branding, self.rules)
+                outcome = (True, None, time.perf_counter() - started, 1)
+            except Exception as e:
+                outcome = (False, f"{type(e).__name__}: {e}", time.perf_counter() - started, 1)
+        self._package_q.put((pos, b_code, output_path, outcome))
+
+    def _submit(self, batch, priority):
+        """One scheduler job for a batch of rows (each holding a render slot)."""
+        stage = self._stages["render"]
+        rows = [(pos, b_code, os.path.join(self.output_dir, certificate_filename(row)), row, photos)
+                for pos, row, b_code, photos in batch]
+        tasks = [(generate_certificate, (row, photos, output_path, self.branding, self.rules))
+                 for _, _, output_path, row, photos in rows]
+        with stage.lock:
+            stage.active += len(rows)
+        job = self.scheduler.submit(self.tenant, tasks, priority=priority,
+                                    timeout=self.timeout, retries=self.retries)
+        with self._jobs_lock:
+            self._jobs.add(job)
+        job.add_done_callback(lambda j, rows=rows: self._rendered(j, rows))
+        if self._cancel.is_set():   # cancelled while submitting: _cancel_run may have missed it
+            self.scheduler.cancel(job, "Batch cancelled")
+
+    def _rendered(self, job, rows):
+        with self._jobs_lock:
+            self._jobs.discard(job)
+        stage = self._stages["render"]
+        for (pos, b_code, output_path, _, _), outcome in zip(rows, job.results):
+            with stage.lock:
+                stage.active -= 1
+                stage.done += 1
+                stage.busy += outcome[2]
+            self._package_q.put((pos, b_code, output_path, outcome))
+
+    def _package(self, zip_target):
+        stage = self._stages["package"]
+        # PDFs are already compressed: store, don't deflate
+        with zipfile.ZipFile(zip_target, "w", zipfile.ZIP_STORED) as zf:
+            while True:
+                item = self._get(self._package_q)
+                if item is _DONE:
+                    break
+                pos, b_code, output_path, outcome = item
+                with stage.track():
+                    result = certificate_result(b_code, output_path, *outcome, note=self._row_notes.get(pos))
+                    if self._labels is not None:
+                        metrics.record_certificate(self._labels, result)
+                    if result.ok:
+                        zf.write(output_path, arcname=os.path.basename(output_path))
+                    self.results[pos] = result
+                self._slots.release()
+
+    # --- DRIVER ---
+    def _guard(self, fn, *args):
+        try:
+            fn(*args)
+        except Exception as e:
+            self.error = e
+            self._cancel_run()
+            raise
+
+    def run(self, zip_target, progress=None, interval=0.5):
+        """Runs all stages concurrently; progress(stats) is called every `interval` seconds."""
+        self.started = time.perf_counter()
+        if self.library is not None:
+            self._library_entries = self.library.entries(self.branding['project_id'])
+        threads = [threading.Thread(target=self._guard, args=(self._ingest,), name="pipeline-ingest", daemon=True)]
+        threads += [threading.Thread(target=self._guard, args=(self._photos,), name=f"pipeline-photos-{i}", daemon=True)
+                    for i in range(self._stages["photos"].workers)]
+        threads.append(threading.Thread(target=self._guard, args=(self._render,), name="pipeline-render", daemon=True))
+        writer = threading.Thread(target=self._guard, args=(self._package, zip_target), name="pipeline-package", daemon=True)
+        threads.append(writer)
+        for t in threads:
+            t.start()
+        while writer.is_alive():
+            writer.join(interval)
+            if progress:
+                progress(self.stats())
+        if self._labels is not None:
+            metrics.record_batch(self._labels, time.perf_counter() - self.started, "pipeline")
+        if self.error is not None:
+            for t in threads:   # all unblock within CANCEL_POLL_SECONDS of the cancel
+                t.join()
+            raise self.error
+        if self.library is not None and self._library_added:
+            self.library.record(self.branding['project_id'], self._library_added)
+        return [r or CertificateResult("?", "failed", reason="Not rendered") for r in self.results]
+
+    def stats(self):
+        """[{stage, queued, active, done, per_sec, busy_pct}] - the stage with the highest busy_pct is the bottleneck."""
+        elapsed = max(time.perf_counter() - (self.started or time.perf_counter()), 1e-9)
+        rows = []
+        for stage in self._stages.values():
+            rows.append({
+                "stage": stage.name,
+                "queued": stage.inbox.qsize() if stage.inbox is not None else 0,
+                "active": stage.active,
+                "done": stage.done,
+                "per_sec": round(stage.done / elapsed, 1),
+                "busy_pct": round(100 * stage.busy / (elapsed * stage.workers), 1),
+            })
+        return rows
@@ -0,0 +1,59 @@
+"""
+Draft Certificate Preview for E-Warranty Portal
+Renders a single row in-process and rasterises the first page to PNG, so
+layout problems (long addresses, wrong client name, broken terms markup) show
+up before a bulk run. Photos are skipped, or replaced by small thumbnails.
+"""
+import io
+
+import pypdfium2 as pdfium
+from PIL import Image as PILImage
+from pypdf import PdfReader
+
+from pdf_engine import clean_branch_code, generate_certificate
+from pipeline import read_photo_source
+from reissue import terms_start_page
+
+THUMBNAIL_PX = 480
+PREVIEW_SCALE = 1.25      # 72 dpi x scale; A4 page -> ~744 x 1052 px
+TERMS_PAGE = "terms"      # page= value for the first Terms & Conditions page, wherever it falls
+
+
+def make_thumbnail(source, max_px=THUMBNAIL_PX):
+    """Small JPEG bytes for a photo source (path, upload or callable); JPEGs decode at reduced size."""
+    with PILImage.open(io.BytesIO(read_photo_source(source))) as img:
+        img.draft("RGB", (max_px, max_px))
+        img.thumbnail((max_px, max_px))
+        out = io.BytesIO()
+        img.convert("RGB").save(out, "JPEG", quality=70)
+    return out.getvalue()
+
+
+def render_preview_pdf(data_row, branding_config, thumbnails=None, rules=None):
+    """PDF bytes for one row. thumbnails: { 'photo_key': jpeg_bytes } or None to skip photos."""
+    photos = {key: io.BytesIO(data) for key, data in (thumbnails or {}).items()}
+    out = io.BytesIO()
+    generate_certificate(data_row, photos, out, branding_config, rules)
+    return out.getvalue()
+
+
+def render_preview_png(data_row, branding_config, thumbnails=None, rules=None, page=0, scale=PREVIEW_SCALE):
+    """PNG bytes of one page (an index, default the certificate page, or TERMS_PAGE) of the row's certificate."""
+    pdf_bytes = render_preview_pdf(data_row, branding_config, thumbnails, rules)
+    if page == TERMS_PAGE:
+        # Long addresses or many photos push the terms past page 1: find them by their outline entry
+        page = terms_start_page(PdfReader(io.BytesIO(pdf_bytes)))
+    pdf = pdfium.PdfDocument(pdf_bytes)
+    try:
+        image = pdf[min(page, len(pdf) - 1)].render(scale=scale).to_pil()
+    finally:
+        pdf.close()
+    out = io.BytesIO()
+    image.save(out, "PNG", optimize=False)
+    return out.getvalue()
+
+
+def photo_keys_for(rules, data_row):
+    """Photo keys a row would use: one per warranty type present, plus the generic branch_code key."""
+    b_code = clean_branch_code(data_row.get('branch_code', '0'))
+    return [key for _, key in rules.expected_photos(data_row, b_code)] + [b_code]
@@ -0,0 +1,112 @@
+"""
+Incremental Re-issue for E-Warranty Portal
+When a project's terms change, every certificate already issued for it is
+rebuilt from its stored PDF: the certificate pages are kept as they are and
+only the Terms & Conditions pages are swapped for the new terms, rendered
+once per project. No sheet, photos or full re-render needed.
+"""
+import hashlib
+import io
+import time
+from datetime import datetime
+
+from pypdf import PdfReader, PdfWriter
+from reportlab.lib.pagesizes import A4
+from reportlab.pdfgen import canvas as rl_canvas
+
+from cert_registry import get_registry
+from pdf_engine import TERMS_OUTLINE_TITLE, draw_serial_footer, render_terms_pdf
+
+# Per worker: the terms pages being swapped in (see _terms_pages_for)
+_terms_key = None
+_terms_pages = None
+
+
+def terms_start_page(reader):
+    """Index of the first Terms & Conditions page (outline entry, else text search for older PDFs)."""
+    for item in reader.outline:
+        if not isinstance(item, list) and item.title == TERMS_OUTLINE_TITLE:
+            return reader.get_destination_page_number(item)
+    for idx, page in enumerate(reader.pages):
+        if TERMS_OUTLINE_TITLE in (page.extract_text() or ""):
+            return idx
+    return len(reader.pages)
+
+
+def _serial_stamp(serial, code):
+    buf = io.BytesIO()
+    c = rl_canvas.Canvas(buf, pagesize=A4)
+    draw_serial_footer(c, serial, code)
+    c.save()
+    return PdfReader(buf).pages[0]
+
+
+def swap_terms(pdf_bytes, terms_pages, serial=None, code=None):
+    """Returns new PDF bytes: certificate pages of pdf_bytes followed by terms_pages (serial stamped)."""
+    reader = PdfReader(io.BytesIO(pdf_bytes))
+    writer = PdfWriter()
+    start = terms_start_page(reader)
+    for page in reader.pages[:start]:
+        writer.add_page(page)
+    stamp = _serial_stamp(serial, code) if serial else None
+    for idx, page in enumerate(terms_pages):
+        new_page = writer.add_page(page)
+        if stamp is not None:
+            new_page.merge_page(stamp)
+        if idx == 0:
+            writer.add_outline_item(TERMS_OUTLINE_TITLE, start)
+    out = io.BytesIO()
+    writer.write(out)
+    return out.getvalue()
+
+
+def _terms_pages_for(terms_bytes):
+    """Parsed terms pages, cached per worker for the duration of a re-issue."""
+    global _terms_key, _terms_pages
+    key = hashlib.sha256(terms_bytes).digest()
+    if key != _terms_key:
+        _terms_key, _terms_pages = key, PdfReader(io.BytesIO(terms_bytes)).pages
+    return _terms_pages
+
+
+def reissue_one(storage_path, terms_bytes, serial, code):
+    """Pool task: new PDF bytes for one stored certificate."""
+    with open(storage_path, "rb") as f:
+        return swap_terms(f.read(), _terms_pages_for(terms_bytes), serial, code)
+
+
+def reissue_project(project_id, branding_config, registry=None, pool=None, progress=None):
+    """
+    Re-issues every current certificate of a project with the terms in branding_config.
+    Runs on the shared render pool. Serials and verification codes are
+    unchanged. progress(done, total) is called as certificates finish.
+    Returns {'reissued': int, 'failed': [(branch_code, reason)], 'seconds': float}.
+    """
+    registry = registry or get_registry()
+    started = time.perf_counter()
+    records = registry.lookup(project_id)
+    if not records:
+        return {"reissued": 0, "failed": [], "seconds": 0.0}
+
+    # New terms rendered once for the whole project
+    terms_buf = io.BytesIO()
+    render_terms_pdf(branding_config, terms_buf)
+
+    terms_bytes = terms_buf.getvalue()
+    if pool is None:
+        from render_pool import get_render_pool  # keeps Streamlit out of worker imports
+        pool = get_render_pool()
+    futures = [pool.submit(reissue_one, r["storage_path"], terms_bytes, r.get("serial"), r.get("verification_code"))
+               for r in records]
+    issued_at = datetime.now().isoformat(timespec="seconds")
+    new_records, failed = [], []
+    for done, (rec, future) in enumerate(zip(records, futures), 1):
+        try:
+            content_hash, storage_path = registry.store_bytes(future.result())
+            new_records.append(dict(rec, content_hash=content_hash, storage_path=storage_path, issued_at=issued_at))
+        except Exception as e:
+            failed.append((rec["branch_code"], str(e)))
+        if progress:
+            progress(done, len(records))
+    registry.insert(new_records)
+    return {"reissued": len(new_records), "failed": failed, "seconds": time.perf_counter() - started}
@@ -0,0 +1,212 @@
+"""
+Shared Render Pool for E-Warranty Portal
+One set of long-lived, pre-warmed render processes per server, shared by every
+Streamlit session through st.cache_resource. Tasks from all users go through
+one queue, so concurrent batches never run more renders than there are cores.
+"""
+import logging
+import multiprocessing as mp
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+import streamlit as st
+
+import metrics
+import render_worker
+
+log = logging.getLogger(__name__)
+
+# A worker that won't start is retried with backoff (1s, 2s, 4s, ...) before its slot gives up
+SPAWN_ATTEMPTS = 5
+SPAWN_BACKOFF_SECONDS = 1.0
+
+
+class WorkerCrashed(RuntimeError):
+    """The worker process died while running a task."""
+
+
+class TaskTimeout(WorkerCrashed):
+    """The task ran past its wall-clock limit; its worker was killed and replaced."""
+
+
+class _Slot(threading.Thread):
+    """Feeds tasks from the shared queue to one worker process."""
+
+    def __init__(self, pool, index):
+        super().__init__(name=f"render-slot-{index}", daemon=True)
+        self.pool = pool
+        self.process = None
+        self.conn = None
+        self.busy = False
+        self.ready = threading.Event()
+        self.settled = threading.Event()   # first start-up finished, successfully or not
+        self.alive = True
+
+    def _spawn(self):
+        parent_conn, child_conn = self.pool._ctx.Pipe()
+        self.process = self.pool._ctx.Process(
+            target=render_worker.worker_main, args=(child_conn, self.pool.logo_paths), daemon=True
+        )
+        self.process.start()
+        child_conn.close()
+        self.conn = parent_conn
+        while not self.conn.poll(1):  # ("ready", pid) arrives once warm
+            if not self.process.is_alive():
+                raise WorkerCrashed(f"Render worker exited during start-up (code {self.process.exitcode})")
+        self.conn.recv()
+        self.ready.set()
+
+    def _start_worker(self):
+        """Spawns the worker, retrying with backoff. False once the slot gives up."""
+        delay = SPAWN_BACKOFF_SECONDS
+        for attempt in range(1, SPAWN_ATTEMPTS + 1):
+            try:
+                self._spawn()
+                return True
+            except Exception as e:
+                self._kill()
+                log.warning("%s: worker start failed (attempt %d/%d): %s", self.name, attempt, SPAWN_ATTEMPTS, e)
+                if attempt < SPAWN_ATTEMPTS:
+                    time.sleep(delay)
+                    delay *= 2
+        log.error("%s: giving up after %d failed worker starts", self.name, SPAWN_ATTEMPTS)
+        return False
+
+    def _kill(self):
+        self.ready.clear()
+        if self.process is not None and self.process.is_alive():
+            self.process.kill()
+            self.process.join()
+        if self.conn is not None:
+            self.conn.close()
+
+    def run(self):
+        started = self._start_worker()
+        self.settled.set()
+        if not started:
+            self.pool._slot_died(self)
+            return
+        while True:
+            item = self.pool._tasks.get()
+            if item is None:   # shutdown
+                return self._stop_worker()
+            future, fn, args, kwargs, timeout = item
+            if not future.set_running_or_notify_cancel():
+                continue
+            self.busy = True
+            try:
+                self.conn.send((fn, args, kwargs))
+                if not self.conn.poll(timeout):
+                    # Hung render: the only way to stop it is to kill the process
+                    self._kill()
+                    future.set_exception(TaskTimeout(f"Task exceeded {timeout:g}s"))
+                    if not self._start_worker():
+                        break
+                    continue
+                status, payload = self.conn.recv()
+            except (EOFError, OSError) as e:
+                self._kill()
+                future.set_exception(WorkerCrashed(f"Render worker died: {e!r}"))
+                if not self._start_worker():
+                    break
+                continue
+            except Exception as e:  # e.g. arguments that cannot be pickled
+                future.set_exception(e)
+                continue
+            finally:
+                self.busy = False
+            if status == "ok":
+                future.set_result(payload)
+            else:
+                future.set_exception(payload)
+        self.pool._slot_died(self)
+
+    def _stop_worker(self):
+        try:
+            self.conn.send(None)
+        except Exception:
+            pass
+        self._kill()
+
+
+class RenderPool:
+    """
+    Process pool with warm workers. submit(fn, *args) runs fn(*args) in a worker
+    and returns a concurrent.futures.Future. fn must be a module-level function.
+    """
+
+    def __init__(self, workers=None, logo_paths=()):
+        self.size = workers or os.cpu_count() or 1
+        self.logo_paths = tuple(logo_paths)
+        # spawn: safe inside Streamlit's threaded server and the only option on Windows
+        self._ctx = mp.get_context("spawn")
+        self._tasks = queue.Queue()
+        self._slots_lock = threading.Lock()
+        self._live_slots = self.size
+        self._slots = [_Slot(self, i) for i in range(self.size)]
+        for slot in self._slots:
+            slot.start()
+        metrics.QUEUE_DEPTH.set_function(lambda: self.queued, queue="render_pool")
+        metrics.WORKERS_BUSY.set_function(lambda: self.busy)
+
+    def submit(self, fn, *args, **kwargs):
+        return self.submit_with_timeout(None, fn, *args, **kwargs)
+
+    def submit_with_timeout(self, timeout, fn, *args, **kwargs):
+        """Like submit, but the worker is killed (TaskTimeout) if fn runs longer than timeout seconds."""
+        future = Future()
+        with self._slots_lock:
+            if self._live_slots == 0:
+                future.set_exception(WorkerCrashed("No render workers could be started"))
+                return future
+            self._tasks.put((future, fn, args, kwargs, timeout))
+        return future
+
+    def _slot_died(self, slot):
+        """A slot gave up on its worker; with none left, queued tasks fail instead of waiting forever."""
+        with self._slots_lock:
+            slot.alive = False
+            self._live_slots -= 1
+            if self._live_slots > 0:
+                return
+            log.error("Render pool has no live workers; failing queued tasks")
+            while True:
+                try:
+                    item = self._tasks.get_nowait()
+                except queue.Empty:
+                    break
+                if item is not None and item[0].set_running_or_notify_cancel():
+                    item[0].set_exception(WorkerCrashed("No render workers could be started"))
+
+    def wait_ready(self, timeout=None):
+        """Blocks until every worker has finished warming up; False if any slot couldn't start one."""
+        return all(slot.settled.wait(timeout) for slot in self._slots) and all(slot.ready.is_set() for slot in self._slots)
+
+    @property
+    def queued(self):
+        return self._tasks.qsize()
+
+    @property
+    def busy(self):
+        return sum(slot.busy for slot in self._slots)
+
+    @property
+    def pids(self):
+        """Process ids of the live workers (e.g. for memory sampling)."""
+        return [slot.process.pid for slot in self._slots if slot.process is not None and slot.process.is_alive()]
+
+    def shutdown(self):
+        for slot in self._slots:
+            if slot.alive:
+                self._tasks.put(None)
+        for slot in self._slots:
+            slot.join()
+
+
+@st.cache_resource
+def get_render_pool():
+    """The server-wide render pool (created on first use, then shared by all sessions)."""
+    return RenderPool()
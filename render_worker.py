@@ -0,0 +1,65 @@
+"""
+Render Worker Process for E-Warranty Portal
+Entry point of each long-lived render pool process. Imports the PDF stack and
+warms fonts, stylesheets and logos once, then runs tasks sent by the pool.
+Kept free of Streamlit so workers start fast.
+"""
+import glob
+import os
+import time
+import traceback
+
+LOGO_GLOBS = ("assets/*.png", "assets/*.jpg", "assets/*.jpeg", "assets/**/*.png", "assets/**/*.jpg")
+
+
+def warm_up(logo_paths=()):
+    """Pay the import / font / stylesheet / logo decode cost before the first task."""
+    import pandas  # noqa: F401  (rows arrive as pandas objects)
+    import dateutil.relativedelta  # noqa: F401
+    from reportlab.pdfbase import pdfmetrics
+    import pdf_engine
+    from warranty_rules import compile_rules
+
+    for font in ("Helvetica", "Helvetica-Bold", "Helvetica-Oblique", "Helvetica-BoldOblique"):
+        pdfmetrics.getFont(font)
+    pdf_engine.get_styles()
+    compile_rules(None)
+    paths = set(logo_paths)
+    for pattern in LOGO_GLOBS:
+        paths.update(glob.glob(pattern, recursive=True))
+    for path in paths:
+        pdf_engine.get_logo(path)
+
+
+def worker_main(conn, logo_paths=()):
+    """Receives (fn, args, kwargs), replies ('ok', result) or ('err', exception)."""
+    warm_up(logo_paths)
+    conn.send(("ready", os.getpid()))
+    while True:
+        try:
+            task = conn.recv()
+        except (EOFError, OSError):
+            return
+        if task is None:
+            return
+        fn, args, kwargs = task
+        try:
+            conn.send(("ok", fn(*args, **kwargs)))
+        except Exception as e:
+            try:
+                conn.send(("err", e))
+            except Exception:
+                # Exception not picklable: send the traceback text instead
+                conn.send(("err", RuntimeError(traceback.format_exc())))
+
+
+def run_chunk(tasks):
+    """Runs a chunk of (fn, args) tasks; one failure doesn't stop the rest. Returns [(ok, result_or_reason, seconds)]."""
+    results = []
+    for fn, args in tasks:
+        started = time.perf_counter()
+        try:
+            results.append((True, fn(*args), time.perf_counter() - started))
+        except Exception as e:
+            results.append((False, f"{type(e).__name__}: {e}", time.perf_counter() - started))
+    return results
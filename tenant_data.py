@@ -0,0 +1,115 @@
+"""
+Tenant-Scoped Data Access for E-Warranty Portal (app.py)
+One process-wide catalog (the local stand-in for the companies, projects and
+users tables) instead of a full copy seeded into every session. Admin
+sessions work on the shared tables; a client user's session loads only its
+own project and that project's company, on first use, so per-session memory
+and page load stay the same however many tenants exist. Logos are resolved to
+their prepared PDF variant only when a certificate is rendered (asset_store).
+"""
+import threading
+
+import streamlit as st
+
+SEED_COMPANIES = [
+    {"id": 1, "name": "TRIAD Technologies", "logo_path": None, "is_active": True, "created_at": "2025-01-01"},
+    {"id": 2, "name": "TRIAD Marketing", "logo_path": None, "is_active": True, "created_at": "2025-01-15"},
+]
+SEED_PROJECTS = [
+    {"id": 1, "company_id": 1, "client_name": "Rajasthan Gramin Bank", "warranty_issue": "Branch Signage Warranty", "terms_text": "", "created_at": "2025-01-01"},
+    {"id": 2, "company_id": 1, "client_name": "Test Client Corp", "warranty_issue": "Equipment Installation", "terms_text": "Sample Terms", "created_at": "2025-02-01"},
+]
+SEED_USERS = [
+    {"id": "u1", "email": "admin@triad.com", "role": "admin", "project_id": None},
+    {"id": "u2", "email": "user@client.com", "role": "user", "project_id": 1},
+]
+
+# Session-state keys of the admin tables (the names the admin views always used)
+TABLES = ("internal_companies", "projects", "users_db")
+
+
+class CatalogStore:
+    """
+    Shared tables plus id/email indexes. Admin views edit the lists in place
+    (append, slice assignment); an index is rebuilt when its table's length
+    changes, so tenant lookups never scan the tables.
+    """
+
+    def __init__(self):
+        self.tables = {
+            "internal_companies": [dict(c) for c in SEED_COMPANIES],
+            "projects": [dict(p) for p in SEED_PROJECTS],
+            "users_db": [dict(u) for u in SEED_USERS],
+        }
+        self._indexes = {}
+        self._lock = threading.Lock()
+
+    def _index(self, table, field):
+        records = self.tables[table]
+        with self._lock:
+            cached = self._indexes.get((table, field))
+            if cached is None or cached[0] != len(records):
+                cached = (len(records), {self._norm(field, r.get(field)): r for r in records})
+                self._indexes[(table, field)] = cached
+            return cached[1]
+
+    @staticmethod
+    def _norm(field, value):
+        return str(value or "").strip().casefold() if field == "email" else value
+
+    def get(self, table, record_id):
+        record = self._index(table, "id").get(record_id)
+        # A stale index (edit that kept the length) must not hand out a removed or renumbered record
+        if record is not None and record.get("id") == record_id:
+            return record
+        return next((r for r in self.tables[table] if r.get("id") == record_id), None)
+
+    def user_by_email(self, email):
+        user = self._index("users_db", "email").get(self._norm("email", email))
+        if user is not None and self._norm("email", user.get("email")) == self._norm("email", email):
+            return user
+        return None
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store():
+    """Process-wide catalog shared by all sessions."""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = CatalogStore()
+        return _store
+
+
+def bind_admin_tables():
+    """Points this session's admin tables at the shared lists (admins only, on first use)."""
+    store = get_store()
+    for name in TABLES:
+        if name not in st.session_state:
+            st.session_state[name] = store.tables[name]
+
+
+def tenant_scope(user):
+    """
+    {'projects': [...], 'companies': [...]} visible to a session. Admins see
+    the shared tables; a client user gets only its own project and company,
+    looked up once and kept in the session.
+    """
+    if user.get('role') == 'admin':
+        bind_admin_tables()
+        return {"projects": st.session_state.projects, "companies": st.session_state.internal_companies}
+    scope = st.session_state.get("_tenant_scope")
+    if scope is None or scope["user_id"] != user.get('id'):
+        store = get_store()
+        project = store.get("projects", user.get('project_id'))
+        company = store.get("internal_companies", project.get('company_id')) if project else None
+        scope = {
+            "user_id": user.get('id'),
+            "projects": [project] if project else [],
+            "companies": [company] if company else [],
+        }
+        st.session_state["_tenant_scope"] = scope
+    return scope
@@ -0,0 +1,162 @@
+"""
+Bulk User Provisioning for E-Warranty Portal
+Reads a CSV/XLSX of users (email, role, project, ...), validates every row in
+one vectorized pass against a case-folded index of existing emails, and
+commits all new users at once. Each row is reported as inserted, skipped
+(duplicate) or invalid, with the reason.
+"""
+import io
+import re
+import secrets
+
+import pandas as pd
+import streamlit as st
+
+ROLES = ("user", "admin")
+TEMPLATE_COLUMNS = ["email", "role", "project", "full_name", "password"]
+EMAIL_PATTERN = r"^[^@\s]+@[^@\s]+\.[^@\s]+$"
+
+
+def read_user_sheet(uploaded):
+    """DataFrame from an uploaded .csv/.xlsx (anything with .name and file-like read)."""
+    name = getattr(uploaded, "name", "")
+    if name.lower().endswith(".csv"):
+        df = pd.read_csv(uploaded, dtype=str, keep_default_na=False)
+    else:
+        df = pd.read_excel(uploaded, dtype=str).fillna("")
+    df.columns = [str(c).strip().lower().replace(" ", "_") for c in df.columns]
+    if "email" not in df.columns:
+        raise ValueError("The sheet needs an 'email' column")
+    for col in TEMPLATE_COLUMNS:
+        if col not in df.columns:
+            df[col] = ""
+    return df
+
+
+def user_template():
+    """Sample XLSX for the import."""
+    out = io.BytesIO()
+    pd.DataFrame([
+        {"email": "staff101@bank.example", "role": "user", "project": "Rajasthan Gramin Bank", "full_name": "Branch 101", "password": ""},
+        {"email": "ops@bank.example", "role": "admin", "project": "", "full_name": "Ops Lead", "password": ""},
+    ], columns=TEMPLATE_COLUMNS).to_excel(out, index=False)
+    return out.getvalue()
+
+
+def email_index(users):
+    """Case-folded emails of existing users."""
+    return {str(u.get("email", "")).strip().casefold() for u in users}
+
+
+def next_user_ids(users, count, prefix="u"):
+    """count fresh ids after the highest existing one (ids never reuse a deleted user's number)."""
+    numbers = [int(m.group(1)) for u in users if (m := re.fullmatch(rf"{prefix}(\d+)", str(u.get("id", ""))))]
+    start = max(numbers, default=0) + 1
+    return [f"{prefix}{n}" for n in range(start, start + count)]
+
+
+def plan_import(df, users, projects, project_name):
+    """
+    Validates the sheet against existing users and projects.
+    projects: project dicts; project_name(p) gives the name users may type instead of the id.
+    Returns (new_users, report) - report has one row per sheet row with status and reason.
+    """
+    email = df["email"].astype(str).str.strip()
+    key = email.str.casefold()
+    role = df["role"].astype(str).str.strip().str.lower().replace("", "user")
+    project_raw = df["project"].astype(str).str.strip()
+
+    # Projects may be given by id or by name
+    lookup = {}
+    for p in projects:
+        lookup[str(p["id"]).casefold()] = p["id"]
+        lookup[str(project_name(p)).strip().casefold()] = p["id"]
+    known_project = project_raw.str.casefold().isin(lookup.keys())
+
+    reason = pd.Series("", index=df.index)
+    reason = reason.mask(~email.str.match(EMAIL_PATTERN), "Invalid email")
+    reason = reason.mask((reason == "") & ~role.isin(ROLES), "Unknown role: " + role)
+    reason = reason.mask((reason == "") & (project_raw != "") & ~known_project, "Unknown project: " + project_raw)
+    invalid = reason != ""
+
+    existing = key.isin(email_index(users))
+    repeated = key.where(~invalid).duplicated(keep="first") & ~invalid
+    skipped = ~invalid & (existing | repeated)
+    reason = reason.mask(skipped & existing, "Email already registered")
+    reason = reason.mask(skipped & ~existing, "Duplicate in sheet")
+
+    inserted = ~invalid & ~skipped
+    status = pd.Series("inserted", index=df.index).mask(skipped, "skipped").mask(invalid, "invalid")
+    report = pd.DataFrame({"row": df.index + 2, "email": email, "status": status, "reason": reason})
+
+    new = pd.DataFrame({
+        "email": email[inserted],
+        "role": role[inserted],
+        "project_id": project_raw[inserted].str.casefold(),
+        "full_name": df.loc[inserted, "full_name"].astype(str).str.strip(),
+        "password": df.loc[inserted, "password"].astype(str).str.strip(),
+    })
+    new_users = new.to_dict("records")
+    for user, user_id in zip(new_users, next_user_ids(users, len(new_users))):
+        user["id"] = user_id
+        user["project_id"] = lookup.get(user["project_id"])  # keeps the project's own id type
+        # Accounts without a password in the sheet get a one-time temporary password
+        user["temporary_password"] = not user["password"]
+        if user["temporary_password"]:
+            user["password"] = secrets.token_urlsafe(9)
+    return new_users, report
+
+
+def commit_import(users, new_users):
+    """All-or-nothing: the returned list replaces the user table in one assignment."""
+    return list(users) + new_users
+
+
+def credentials_csv(new_users):
+    """Emails and temporary passwords of the created accounts, for handing out."""
+    rows = [{"email": u["email"], "temporary_password": u["password"]} for u in new_users if u.get("temporary_password")]
+    return pd.DataFrame(rows, columns=["email", "temporary_password"]).to_csv(index=False).encode()
+
+
+def without_passwords(new_users):
+    """The users as stored by a portal that signs in elsewhere (Supabase): no password fields."""
+    return [{k: v for k, v in u.items() if k not in ("password", "temporary_password")} for u in new_users]
+
+
+def render_bulk_import(users_key, projects, project_name, key="bulk_users", with_passwords=True):
+    """
+    Upload -> validation report -> one-shot insert into st.session_state[users_key].
+    with_passwords=False: the user table keeps no passwords and none are handed out.
+    """
+    st.download_button("📥 Download Template", user_template(), "users_template.xlsx",
+                       "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet", key=f"{key}_tpl")
+    uploaded = st.file_uploader("Users sheet (.csv / .xlsx)", type=["csv", "xlsx"], key=f"{key}_file")
+    if not uploaded:
+        return
+    try:
+        df = read_user_sheet(uploaded)
+    except Exception as e:
+        st.error(f"❌ Could not read sheet: {e}")
+        return
+
+    new_users, report = plan_import(df, st.session_state[users_key], projects, project_name)
+    counts = report["status"].value_counts()
+    c1, c2, c3 = st.columns(3)
+    c1.metric("To insert", int(counts.get("inserted", 0)))
+    c2.metric("Skipped (duplicates)", int(counts.get("skipped", 0)))
+    c3.metric("Invalid", int(counts.get("invalid", 0)))
+    problems = report[report["status"] != "inserted"]
+    if not problems.empty:
+        st.dataframe(problems, use_container_width=True, hide_index=True)
+
+    if new_users and st.button(f"Import {len(new_users)} User(s)", type="primary", key=f"{key}_go"):
+        # In place: the table may be the shared catalog other sessions read
+        if with_passwords:
+            st.session_state[users_key][:] = commit_import(st.session_state[users_key], new_users)
+            st.session_state[f"{key}_credentials"] = credentials_csv(new_users)
+        else:
+            st.session_state[users_key][:] = commit_import(st.session_state[users_key], without_passwords(new_users))
+        st.success(f"✅ Imported {len(new_users)} user(s); {int(counts.get('skipped', 0))} skipped, {int(counts.get('invalid', 0))} invalid.")
+    if st.session_state.get(f"{key}_credentials"):
+        st.download_button("🔑 Download Temporary Passwords", st.session_state[f"{key}_credentials"],
+                           "temporary_passwords.csv", "text/csv", key=f"{key}_creds")
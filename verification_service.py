@@ -0,0 +1,160 @@
+"""
+Certificate Verification Service for E-Warranty Portal
+Answers "is this certificate genuine?" from an in-memory index of the
+issued-certificate registry. Unknown serials are rejected by a Bloom filter
+before touching the index, so junk and guessed serials cost almost nothing.
+
+Run standalone:  python verification_service.py --port 8600
+Query:           GET /verify?serial=TRD-XXXX-XXXX-XXXX&code=ABCD-EFGH
+"""
+import argparse
+import hashlib
+import hmac
+import json
+import math
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+from cert_registry import get_registry
+
+
+class BloomFilter:
+    """Fixed-size Bloom filter; sized for `capacity` items at `error_rate` false positives."""
+
+    def __init__(self, capacity, error_rate=0.001):
+        capacity = max(capacity, 1)
+        self.num_bits = max(8, int(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.num_hashes = max(1, round(self.num_bits / capacity * math.log(2)))
+        self.bits = bytearray((self.num_bits + 7) // 8)
+
+    def _positions(self, key):
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return [(h1 + i * h2) % self.num_bits for i in range(self.num_hashes)]
+
+    def add(self, key):
+        for pos in self._positions(key):
+            self.bits[pos >> 3] |= 1 << (pos & 7)
+
+    def __contains__(self, key):
+        return all(self.bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(key))
+
+
+class VerificationIndex:
+    """
+    serial -> (verification_code, public details) for every issued certificate.
+    Loaded once from the registry; `refresh()` only pulls rows added since.
+    """
+
+    def __init__(self, registry, capacity=None):
+        self.registry = registry
+        self._lock = threading.Lock()
+        self._entries = {}
+        self._last_id = 0
+        self._capacity = capacity
+        self._bloom = None
+        self.refresh()
+
+    def refresh(self):
+        new_rows = list(self.registry.iter_since(self._last_id))
+        fresh = {}
+        for row_id, rec in new_rows:
+            if not rec.get("serial"):
+                continue
+            # Later rows (re-issues) supersede earlier ones for the same serial
+            fresh[rec["serial"]] = (rec["verification_code"], {
+                "serial": rec["serial"],
+                "branch_code": rec["branch_code"],
+                "branch_name": rec["branch_name"],
+                "installation_date": rec["installation_date"],
+                "expiry_date": rec["expiry_date"],
+                "issued_at": rec["issued_at"],
+            })
+        # verify() reads without the lock: a serial goes into the filter before its
+        # entry, and a rebuilt filter is only published once it is complete
+        with self._lock:
+            total = len(self._entries) + sum(1 for serial in fresh if serial not in self._entries)
+            if self._bloom is None or total > self._capacity:
+                self._capacity = max(self._capacity or 0, total * 2, 1024)
+                bloom = BloomFilter(self._capacity)
+                for serial in list(self._entries) + list(fresh):
+                    bloom.add(serial)
+                self._bloom = bloom
+            else:
+                for serial in fresh:
+                    self._bloom.add(serial)
+            self._entries.update(fresh)
+            if new_rows:
+                self._last_id = new_rows[-1][0]
+        return len(new_rows)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def verify(self, serial, code):
+        """Returns {'status': 'valid' | 'invalid_code' | 'not_found', ...}."""
+        serial = (serial or "").strip().upper()
+        code = (code or "").strip().upper()
+        if serial not in self._bloom:
+            return {"status": "not_found"}
+        entry = self._entries.get(serial)
+        if entry is None:
+            return {"status": "not_found"}
+        expected_code, details = entry
+        if not hmac.compare_digest(expected_code, code):
+            return {"status": "invalid_code"}
+        return {"status": "valid", **details}
+
+
+def make_handler(index):
+    class VerifyHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"  # keep-alive: bank integrations send bursts over one connection
+        disable_nagle_algorithm = True
+
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            if url.path != "/verify":
+                return self._json(404, {"error": "not found"})
+            params = parse_qs(url.query)
+            result = index.verify(params.get("serial", [""])[0], params.get("code", [""])[0])
+            self._json(200, result)
+
+        def _json(self, code, body):
+            data = json.dumps(body).encode()
+            self.send_response(code)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+    return VerifyHandler
+
+
+def serve(host="0.0.0.0", port=8600, registry=None, refresh_seconds=60):
+    """Starts the HTTP endpoint; the index picks up newly issued certificates every refresh_seconds."""
+    index = VerificationIndex(registry or get_registry())
+    server = ThreadingHTTPServer((host, port), make_handler(index))
+
+    def _refresh_loop():
+        while True:
+            time.sleep(refresh_seconds)
+            index.refresh()
+
+    threading.Thread(target=_refresh_loop, daemon=True).start()
+    return server, index
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Certificate verification endpoint")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8600)
+    args = parser.parse_args()
+    server, index = serve(args.host, args.port)
+    print(f"Serving {len(index)} certificates on http://{args.host}:{args.port}/verify")
+    server.serve_forever()
@@ -0,0 +1,93 @@
+"""
+Checks the auth session layer against a local fake Supabase auth server.
+Sign-in, profile load and refresh hit the fake server; plain reruns must not.
+"""
+import base64
+import json
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+TOKEN_TTL = 3600
+calls = {"password": 0, "refresh_token": 0, "profiles": 0}
+
+
+def make_token(sub, email, ttl):
+    def enc(obj):
+        return base64.urlsafe_b64encode(json.dumps(obj).encode()).rstrip(b"=").decode()
+    return f"{enc({'alg': 'HS256', 'typ': 'JWT'})}.{enc({'sub': sub, 'email': email, 'exp': int(time.time()) + ttl})}.sig"
+
+
+class FakeAuthHandler(BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def _json(self, code, body):
+        data = json.dumps(body).encode()
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        grant = parse_qs(url.query).get("grant_type", [""])[0]
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        if url.path != "/auth/v1/token" or grant not in calls:
+            return self._json(404, {"msg": "not found"})
+        calls[grant] += 1
+        if grant == "password" and body.get("password") != "secret":
+            return self._json(400, {"error": "invalid_grant", "error_description": "Invalid login credentials"})
+        user = {"id": "u1", "email": "admin@triad.com", "aud": "authenticated", "app_metadata": {},
+                "user_metadata": {}, "created_at": "2025-01-01T00:00:00Z"}
+        self._json(200, {"access_token": make_token("u1", user["email"], TOKEN_TTL), "token_type": "bearer",
+                         "expires_in": TOKEN_TTL, "refresh_token": f"refresh-{calls[grant]}", "user": user})
+
+    def do_GET(self):
+        if urlparse(self.path).path == "/rest/v1/profiles":
+            calls["profiles"] += 1
+            return self._json(200, [{"id": "u1", "email": "admin@triad.com", "role": "admin", "full_name": "Admin User"}])
+        self._json(404, {"msg": "not found"})
+
+
+server = ThreadingHTTPServer(("127.0.0.1", 0), FakeAuthHandler)
+threading.Thread(target=server.serve_forever, daemon=True).start()
+os.environ["SUPABASE_URL"] = f"http://127.0.0.1:{server.server_port}"
+os.environ["SUPABASE_KEY"] = "test-anon-key"
+
+import auth  # noqa: E402  (reads the env above)
+
+state = {}
+print("Signing in with a wrong password...")
+print("SUCCESS" if auth.login("admin@triad.com", "wrong", state) is None else "FAILURE: bad password accepted")
+
+print("Signing in...")
+user = auth.login("admin@triad.com", "secret", state)
+print("SUCCESS" if user and user["role"] == "admin" else f"FAILURE: {user}")
+
+print("Simulating 100 reruns...")
+before = dict(calls)
+for _ in range(100):
+    user = auth.ensure_session(state)
+print("SUCCESS: no network calls" if calls == before and user else f"FAILURE: {before} -> {calls}")
+
+print("Near-expiry rerun triggers a background refresh...")
+session = state["auth_session"]
+session.expires_at = time.time() + auth.REFRESH_MARGIN_SECONDS - 1
+user = auth.ensure_session(state)
+deadline = time.time() + 5
+while calls["refresh_token"] == 0 and time.time() < deadline:
+    time.sleep(0.01)
+time.sleep(0.05)
+ok = user is not None and calls["refresh_token"] == 1 and session.refresh_token == "refresh-1" and not session.needs_refresh()
+print("SUCCESS" if ok else f"FAILURE: {calls}")
+
+print("Expired token is refreshed before use...")
+session.expires_at = time.time() - 1
+user = auth.ensure_session(state)
+print("SUCCESS" if user and calls["refresh_token"] == 2 and calls["profiles"] == 1 else f"FAILURE: {calls}")
+
+server.shutdown()
@@ -0,0 +1,76 @@
+"""
+Checks certificate serials/verification codes and the verification service.
+Renders one real certificate, loads a synthetic registry of 50k certificates
+and measures single-core lookup throughput.
+"""
+import http.client
+import json
+import os
+import tempfile
+import threading
+import time
+
+import pandas as pd
+
+from cert_registry import CertificateRegistry
+from pdf_engine import generate_bulk_certificates, certificate_serial, verification_code
+from verification_service import VerificationIndex, make_handler, ThreadingHTTPServer
+
+N_CERTS = 50_000
+
+with tempfile.TemporaryDirectory() as tmp:
+    registry = CertificateRegistry(os.path.join(tmp, "registry"))
+
+    print("Rendering and registering a certificate...")
+    df = pd.DataFrame([{"branch_code": 101, "ifsc_code": "RBGB0000101", "branch_name": "Jaipur Main",
+                        "installation_date": "2025-01-01", "complete_board_size": "8x4"}])
+    out_dir = os.path.join(tmp, "out")
+    os.makedirs(out_dir)
+    generate_bulk_certificates(df, {}, out_dir, {"project_id": 1, "client_name": "Test", "terms_text": "Terms"})
+    registry.register_batch(1, df, out_dir)
+    real = registry.lookup(1, ["101"])[0]
+    print("SUCCESS" if real["serial"] == certificate_serial(df.iloc[0], 1) else f"FAILURE: {real}")
+
+    print(f"Loading {N_CERTS} synthetic certificates...")
+    records = []
+    for i in range(N_CERTS):
+        row = {"branch_code": 1000 + i, "ifsc_code": f"TEST{i:07d}", "installation_date": "2024-06-01"}
+        serial = certificate_serial(row, 2)
+        records.append({"serial": serial, "verification_code": verification_code(serial, str(1000 + i), pd.Timestamp("2027-06-01")),
+                        "project_id": "2", "branch_code": str(1000 + i), "ifsc_code": row["ifsc_code"],
+                        "branch_name": f"B{i}", "installation_date": "2024-06-01", "expiry_date": "2027-06-01",
+                        "content_hash": "-", "storage_path": "-", "file_name": "-", "issued_at": "2024-06-01T00:00:00"})
+    registry.insert(records)
+    t0 = time.perf_counter()
+    index = VerificationIndex(registry)
+    print(f"Index of {len(index)} built in {time.perf_counter() - t0:.2f}s")
+
+    good = [(r["serial"], r["verification_code"]) for r in records[:5000]]
+    forged = [(s, "AAAA-AAAA") for s, _ in good[:1000]]
+    unknown = [(f"TRD-ZZZZ-{i:04d}-XXXX", "AAAA-AAAA") for i in range(4000)]
+
+    ok = all(index.verify(s, c)["status"] == "valid" for s, c in good)
+    ok &= all(index.verify(s, c)["status"] == "invalid_code" for s, c in forged)
+    ok &= all(index.verify(s, c)["status"] == "not_found" for s, c in unknown)
+    ok &= index.verify(real["serial"], real["verification_code"])["status"] == "valid"
+    print("SUCCESS: statuses correct" if ok else "FAILURE: wrong verification status")
+
+    queries = (good + forged + unknown) * 10
+    t0 = time.perf_counter()
+    for s, c in queries:
+        index.verify(s, c)
+    rate = len(queries) / (time.perf_counter() - t0)
+    print(f"{'SUCCESS' if rate > 5000 else 'FAILURE'}: {rate:,.0f} lookups/s on one core")
+
+    print("Querying the HTTP endpoint...")
+    server = ThreadingHTTPServer(("127.0.0.1", 0), make_handler(index))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    conn = http.client.HTTPConnection("127.0.0.1", server.server_port)
+    path = f"/verify?serial={real['serial']}&code={real['verification_code']}"
+    t0 = time.perf_counter()
+    for _ in range(2000):
+        conn.request("GET", path)
+        body = json.loads(conn.getresponse().read())
+    rate = 2000 / (time.perf_counter() - t0)
+    print(f"{'SUCCESS' if body['status'] == 'valid' else 'FAILURE'}: {body['branch_name']} valid, {rate:,.0f} HTTP requests/s (one keep-alive client)")
+    server.shutdown()
@@ -0,0 +1,63 @@
+"""
+Checks deterministic PDF output: the same row rendered twice (different
+output and photo paths) must give byte-identical files, and changing the
+inputs must change the bytes.
+"""
+import hashlib
+import io
+import os
+import shutil
+import tempfile
+
+import pandas as pd
+from PIL import Image
+
+from pdf_engine import generate_certificate, render_terms_pdf
+
+
+def sha(path_or_bytes):
+    if isinstance(path_or_bytes, bytes):
+        return hashlib.sha256(path_or_bytes).hexdigest()
+    with open(path_or_bytes, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+row = pd.Series({"branch_code": 101, "ifsc_code": "RBGB0000101", "branch_name": "Jaipur Main", "city": "Jaipur",
+                 "installation_date": "2025-01-01", "complete_board_size": "8x4", "complete_board_sqft": 32})
+branding = {"project_id": 1, "client_name": "Test Bank", "terms_text": "1. Terms apply.\n2. <b>Bold</b> term."}
+
+with tempfile.TemporaryDirectory() as tmp:
+    photo_a = os.path.join(tmp, "a", "101_1.jpg")
+    photo_b = os.path.join(tmp, "b", "101_1.jpg")
+    os.makedirs(os.path.dirname(photo_a))
+    os.makedirs(os.path.dirname(photo_b))
+    Image.new("RGB", (800, 500), (180, 60, 20)).save(photo_a, "JPEG")
+    shutil.copyfile(photo_a, photo_b)
+
+    print("Rendering the same row twice...")
+    out1, out2 = os.path.join(tmp, "one.pdf"), os.path.join(tmp, "two.pdf")
+    generate_certificate(row, {"101_1": photo_a}, out1, branding)
+    generate_certificate(row, {"101_1": photo_b}, out2, branding)
+    print("SUCCESS" if sha(out1) == sha(out2) else f"FAILURE: {sha(out1)} != {sha(out2)}")
+
+    print("Rendering to a buffer...")
+    buf = io.BytesIO()
+    generate_certificate(row, {"101_1": photo_a}, buf, branding)
+    print("SUCCESS" if sha(buf.getvalue()) == sha(out1) else "FAILURE: buffer output differs from file output")
+
+    print("Changing the client name...")
+    out3 = os.path.join(tmp, "three.pdf")
+    generate_certificate(row, {"101_1": photo_a}, out3, dict(branding, client_name="Other Bank"))
+    print("SUCCESS" if sha(out3) != sha(out1) else "FAILURE: different input, same bytes")
+
+    print("Terms-only render twice...")
+    t1, t2 = io.BytesIO(), io.BytesIO()
+    render_terms_pdf(branding, t1)
+    render_terms_pdf(branding, t2)
+    print("SUCCESS" if t1.getvalue() == t2.getvalue() else "FAILURE: terms render not deterministic")
+
+    print("Non-deterministic mode still differs (ID/timestamp)...")
+    n1, n2 = io.BytesIO(), io.BytesIO()
+    generate_certificate(row, {}, n1, branding, deterministic=False)
+    generate_certificate(row, {}, n2, branding, deterministic=False)
+    print("SUCCESS" if n1.getvalue() != n2.getvalue() else "NOTE: reportlab produced identical bytes anyway")
@@ -0,0 +1,99 @@
+"""
+Checks incremental re-issue: two certificates are issued and registered,
+then re-issued with new terms on a render pool. Serials, verification codes
+and the certificate pages must be unchanged, the terms pages replaced (and
+serial-stamped), and the expiry rollup the same as before. Also swaps the
+terms of a PDF without the outline entry (found by text search instead).
+"""
+import io
+import os
+import tempfile
+
+import pandas as pd
+from pypdf import PdfReader, PdfWriter
+
+from cert_registry import CertificateRegistry
+from pdf_engine import generate_bulk_certificates
+from render_pool import RenderPool
+from reissue import reissue_project, swap_terms, terms_start_page
+
+OLD_TERMS = "Old terms: repairs within OLDCLAUSE days."
+NEW_TERMS = "New terms: repairs within NEWCLAUSE days."
+
+
+def pdf_text(pdf_bytes):
+    """(certificate pages text, terms pages text, terms start page)."""
+    reader = PdfReader(io.BytesIO(pdf_bytes))
+    start = terms_start_page(reader)
+    text = [page.extract_text() or "" for page in reader.pages]
+    return "\n".join(text[:start]), "\n".join(text[start:]), start
+
+
+def check(ok, message):
+    print(f"{'SUCCESS' if ok else 'FAILURE'}: {message}")
+
+
+if __name__ == "__main__":
+    with tempfile.TemporaryDirectory() as tmp:
+        registry = CertificateRegistry(os.path.join(tmp, "registry"))
+        branding = {"project_id": 1, "client_name": "Test Bank", "terms_text": OLD_TERMS}
+
+        print("Issuing two certificates...")
+        df = pd.DataFrame([
+            {"branch_code": 101, "ifsc_code": "RBGB0000101", "branch_name": "Jaipur Main", "rbd": "Jaipur Zone",
+             "state": "Rajasthan", "district": "Jaipur", "installation_date": "2025-01-01", "complete_board_size": "8x4"},
+            {"branch_code": 102, "ifsc_code": "RBGB0000102", "branch_name": "Udaipur City", "rbd": "Udaipur Zone",
+             "state": "Rajasthan", "district": "Udaipur", "installation_date": "2025-03-15", "complete_board_size": "6x3"},
+        ])
+        out_dir = os.path.join(tmp, "out")
+        os.makedirs(out_dir)
+        generate_bulk_certificates(df, {}, out_dir, branding)
+        registry.register_batch(1, df, out_dir)
+        before = registry.lookup(1)
+        rollup_before = sorted(tuple(sorted(r.items())) for r in registry.expiry_rollup([1]))
+        old_pdfs = {r["branch_code"]: registry.read_bytes(r) for r in before}
+        check(len(before) == 2 and all(OLD_TERMS in pdf_text(b)[1] for b in old_pdfs.values()),
+              "issued certificates carry the old terms")
+
+        print("Re-issuing with new terms...")
+        pool = RenderPool(workers=1)
+        try:
+            outcome = reissue_project(1, dict(branding, terms_text=NEW_TERMS), registry=registry, pool=pool)
+        finally:
+            pool.shutdown()
+        after = registry.lookup(1)
+        check(outcome["reissued"] == 2 and not outcome["failed"],
+              f"{outcome['reissued']} re-issued in {outcome['seconds']:.2f}s, failed: {outcome['failed']}")
+        check([(r["branch_code"], r["serial"], r["verification_code"]) for r in after]
+              == [(r["branch_code"], r["serial"], r["verification_code"]) for r in before],
+              "serials and verification codes unchanged")
+        check(all(a["id"] != b["id"] and a["content_hash"] != b["content_hash"] for a, b in zip(after, before)),
+              "new PDFs recorded as the current certificates")
+
+        for rec in after:
+            cert_text, terms_text, start = pdf_text(registry.read_bytes(rec))
+            old_cert_text, _, old_start = pdf_text(old_pdfs[rec["branch_code"]])
+            check(cert_text == old_cert_text and start == old_start,
+                  f"{rec['branch_code']}: certificate pages kept as issued")
+            check(NEW_TERMS in terms_text and OLD_TERMS not in terms_text,
+                  f"{rec['branch_code']}: terms replaced")
+            check(rec["serial"] in terms_text and rec["verification_code"] in terms_text,
+                  f"{rec['branch_code']}: serial stamped on the new terms pages")
+
+        rollup_after = sorted(tuple(sorted(r.items())) for r in registry.expiry_rollup([1]))
+        check(rollup_after == rollup_before, f"expiry rollup unchanged ({len(rollup_after)} buckets)")
+        check(registry.count(1) == 2, "still two certificates in the project")
+
+        print("Swapping terms of a PDF without the outline entry...")
+        reader = PdfReader(io.BytesIO(old_pdfs["101"]))
+        writer = PdfWriter()
+        for page in reader.pages:
+            writer.add_page(page)
+        legacy = io.BytesIO()
+        writer.write(legacy)
+        new_terms = PdfReader(io.BytesIO(registry.read_bytes(after[0]))).pages[pdf_text(registry.read_bytes(after[0]))[2]:]
+        swapped = swap_terms(legacy.getvalue(), new_terms)
+        cert_text, terms_text, _ = pdf_text(swapped)
+        check(not PdfReader(io.BytesIO(legacy.getvalue())).outline and NEW_TERMS in terms_text
+              and OLD_TERMS not in terms_text + cert_text,
+              "terms found by text search and replaced")
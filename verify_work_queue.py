@@ -0,0 +1,91 @@
+"""
+Checks the distributed generation queue: two worker processes sharing one
+queue, a lease kept alive by its heartbeat while a shard renders, a dead
+worker's expired lease going back to the queue (and its late report being
+ignored), shards given up after too many expired leases, and the
+coordinator's timeout when no worker is running.
+"""
+import multiprocessing as mp
+import os
+import sqlite3
+import tempfile
+import time
+
+import pandas as pd
+
+import work_queue as wq
+
+LEASE_SECONDS = 1   # well under a shard's render time: only the heartbeat keeps the lease
+BRANDING = {"project_id": 1, "client_name": "Test", "terms_text": "Terms"}
+
+
+def sheet(n, first=100):
+    return pd.DataFrame([{"branch_code": first + i, "ifsc_code": f"RBGB{first + i:07d}", "branch_name": f"Branch {i}",
+                          "installation_date": "2025-01-01", "complete_board_size": "8x4"} for i in range(n)])
+
+
+def shards(queue_dir, job_id):
+    conn = sqlite3.connect(os.path.join(queue_dir, "queue.db"))
+    conn.row_factory = sqlite3.Row
+    rows = conn.execute("select * from shards where job_id = ? order by shard_no", (job_id,)).fetchall()
+    conn.close()
+    return rows
+
+
+def check(ok, message):
+    print(f"{'SUCCESS' if ok else 'FAILURE'}: {message}")
+
+
+if __name__ == "__main__":
+    with tempfile.TemporaryDirectory() as tmp:
+        print("No workers running...")
+        queue_dir = os.path.join(tmp, "idle")
+        out_dir = os.path.join(tmp, "idle_out")
+        os.makedirs(out_dir)
+        generated, errors = wq.generate_distributed(sheet(3), {}, out_dir, BRANDING, queue_dir, timeout=1)
+        check(not generated and sorted(b for b, _ in errors) == ["100", "101", "102"],
+              f"timed-out job reports every branch on its own ({errors[:1]})")
+        check(os.listdir(os.path.join(queue_dir, "jobs")) == [], "job directory removed after the timeout")
+
+        print("Lease expiring too often...")
+        queue_dir = os.path.join(tmp, "flaky")
+        job_id = wq.submit_job(sheet(2), {}, BRANDING, queue_dir, n_shards=1)
+        conn = wq.init_queue(queue_dir)
+        for attempt in range(wq.MAX_ATTEMPTS):
+            wq.claim_shard(conn, f"dead-{attempt}", lease_seconds=0)
+            time.sleep(0.01)
+        check(wq.claim_shard(conn, "late", lease_seconds=0) is None, "shard no longer handed out")
+        conn.close()
+        status = wq.job_status(job_id, queue_dir)
+        check(status["failed"] == 1 and sorted(status["errors"]) == [["100", "lease expired too often"], ["101", "lease expired too often"]],
+              f"shard failed with one error per branch ({status['errors']})")
+
+        print("Two workers, one dead lease...")
+        queue_dir = os.path.join(tmp, "shared")
+        job_id = wq.submit_job(sheet(320), {}, BRANDING, queue_dir, rows_per_shard=80)
+        conn = wq.init_queue(queue_dir)
+        abandoned = wq.claim_shard(conn, "dead-worker", lease_seconds=1)
+        conn.close()
+        workers = [mp.Process(target=wq.run_worker, args=(queue_dir, f"worker-{i}"), kwargs={"lease_seconds": LEASE_SECONDS, "poll": 0.2})
+                   for i in range(2)]
+        for p in workers:
+            p.start()
+        t0 = time.perf_counter()
+        status = wq.wait_for_job(job_id, queue_dir, timeout=600)
+        seconds = time.perf_counter() - t0
+        rows = shards(queue_dir, job_id)
+        check(status["done"] == status["total"] and len(status["generated"]) == 320 and not status["errors"],
+              f"{len(status['generated'])} certificates from {status['total']} shards in {seconds:.1f}s")
+        attempts = {r["id"]: r["attempts"] for r in rows}
+        check(attempts.pop(abandoned["id"]) == 2, "dead worker's shard re-leased once its lease expired")
+        per_shard = 2 * seconds / status["total"]
+        check(set(attempts.values()) == {1},
+              f"heartbeat kept every other lease alive: ~{per_shard:.1f}s per shard on a {LEASE_SECONDS}s lease (attempts {sorted(attempts.values())})")
+
+        before = [dict(r) for r in shards(queue_dir, job_id)]
+        wq.process_shard(queue_dir, abandoned, "dead-worker")
+        after = [dict(r) for r in shards(queue_dir, job_id)]
+        check(before == after, "late report from the dead worker ignored")
+        for p in workers:
+            p.terminate()
+            p.join()
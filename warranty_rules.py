@@ -0,0 +1,203 @@
+"""
+Warranty Rules for E-Warranty Portal
+Per-project description of the warranty types a sheet can carry: Excel columns,
+warranty period, how the LED/Power cells are shown and the photo suffix.
+Rules are stored with the client project (JSON) and compiled once per batch;
+validation (photo matching) and rendering both use the compiled evaluator.
+"""
+import copy
+import json
+from functools import lru_cache
+
+import pandas as pd
+from dateutil.relativedelta import relativedelta
+
+# The rules every project had before they became configurable
+DEFAULT_WARRANTY_RULES = {
+    "spec_headers": ["Warranty Coverage", "Board Size", "Total Sqft"],
+    # Extra spec-table columns, filled per type according to its "display"
+    "extra_headers": ["LED Module (Qty)", "Power Supply"],
+    "types": [
+        {
+            "type_id": "1",
+            "title": "Complete Board",
+            "label": "Complete",
+            "size_column": "complete_board_size",
+            "qty_column": "complete_board_qty",
+            "sqft_column": "complete_board_sqft",
+            "period_months": 36,
+            # merged: one cell spanning all extra columns with fixed text
+            "display": {"mode": "merged", "text": "Comprehensive Warranty"},
+            "photo_suffix": "_1",
+        },
+        {
+            "type_id": "2",
+            "title": "Only Fascia Replacement",
+            "label": "Fascia",
+            "size_column": "only_fascia_replacement_size",
+            "qty_column": "only_fascia_replacement_qty",
+            "sqft_column": "only_fascia_replacement_sqft",
+            "period_months": 36,
+            # blank: extra columns left empty
+            "display": {"mode": "blank"},
+            "photo_suffix": "_2",
+        },
+        {
+            "type_id": "3",
+            "title": "Fascia + LED Replacement",
+            "label": "Fascia+LED",
+            "size_column": "fascia_+_led_replacement_size",
+            "qty_column": "fascia_+_led_replacement_qty",
+            "sqft_column": "fascia_+_led_replacement_sqft",
+            "period_months": 36,
+            # values: extra columns show these sheet columns
+            "display": {"mode": "values", "columns": ["led_module_qty", "power_supply_watt"]},
+            "photo_suffix": "_3",
+        },
+    ],
+}
+
+DISPLAY_MODES = ("merged", "blank", "values")
+
+
+class CompiledType:
+    """One warranty type with everything precomputed for the per-row hot path."""
+    __slots__ = ("type_id", "title", "label", "size_column", "qty_column", "sqft_column",
+                 "period", "period_months", "mode", "merged_text", "value_columns", "photo_suffix")
+
+    def __init__(self, spec, n_extra):
+        self.type_id = str(spec["type_id"])
+        self.title = spec["title"]
+        self.label = spec.get("label", spec["title"])
+        self.size_column = spec["size_column"]
+        self.qty_column = spec.get("qty_column")
+        self.sqft_column = spec.get("sqft_column")
+        self.period_months = int(spec.get("period_months", 36))
+        self.period = relativedelta(months=self.period_months)
+        display = spec.get("display", {"mode": "blank"})
+        self.mode = display.get("mode", "blank")
+        if self.mode not in DISPLAY_MODES:
+            raise ValueError(f"Warranty type {self.type_id}: unknown display mode '{self.mode}'")
+        self.merged_text = display.get("text", "")
+        self.value_columns = tuple(display.get("columns", ()))
+        if self.mode == "values" and len(self.value_columns) != n_extra:
+            raise ValueError(f"Warranty type {self.type_id}: 'values' needs {n_extra} columns")
+        self.photo_suffix = spec.get("photo_suffix", f"_{self.type_id}")
+
+
+class CompiledRules:
+    """Evaluator built once per batch from a project's rules."""
+
+    def __init__(self, rules):
+        self.spec_headers = list(rules["spec_headers"]) + list(rules["extra_headers"])
+        self.n_extra = len(rules["extra_headers"])
+        self.types = tuple(CompiledType(t, self.n_extra) for t in rules["types"])
+        if not self.types:
+            raise ValueError("At least one warranty type is required")
+        ids = [t.type_id for t in self.types]
+        if len(set(ids)) != len(ids):
+            raise ValueError("Warranty type ids must be unique")
+        self.default_period = max((t.period for t in self.types), key=lambda p: p.months + 12 * p.years)
+        self.columns = []
+        for t in self.types:
+            for col in (t.size_column, t.qty_column, t.sqft_column) + t.value_columns:
+                if col and col not in self.columns:
+                    self.columns.append(col)
+
+    def present_types(self, row):
+        """Warranty types that apply to a row (their size column is filled)."""
+        return [t for t in self.types if pd.notna(row.get(t.size_column))]
+
+    def warranties(self, row):
+        """Row -> list of warranty dicts for the spec table and photos."""
+        out = []
+        for t in self.present_types(row):
+            if t.mode == "merged":
+                extra = [t.merged_text] + [''] * (self.n_extra - 1)
+            elif t.mode == "values":
+                extra = [str(row.get(c, 0)) for c in t.value_columns]
+            else:
+                extra = [''] * self.n_extra
+            out.append({
+                'type_id': t.type_id,
+                'title': t.title,
+                'size': row.get(t.size_column),
+                'qty': row.get(t.qty_column, 1) if t.qty_column else 1,
+                'sqft': row.get(t.sqft_column, 0) if t.sqft_column else 0,
+                'extra_cells': extra,
+                'merged': t.mode == "merged",
+                'photo_suffix': t.photo_suffix,
+                'period': t.period,
+            })
+        return out
+
+    def expiry_date(self, row, install_date):
+        """Longest warranty among the row's types (default period if none apply)."""
+        periods = [install_date + t.period for t in self.present_types(row)]
+        return max(periods) if periods else install_date + self.default_period
+
+    def expected_photos(self, row, branch_code):
+        """[(compiled type, photo key without extension)] for a row."""
+        return [(t, f"{branch_code}{t.photo_suffix}") for t in self.present_types(row)]
+
+    def naming_guide(self):
+        """Markdown table of the photo naming format for the upload zone."""
+        lines = ["**📸 Photo Naming Format:**", "| Format | Type | Example |", "|--------|------|---------|"]
+        for t in self.types:
+            lines.append(f"| `branch_code{t.photo_suffix}.jpg` | {t.title} | `101{t.photo_suffix}.jpg` |")
+        return "\n".join(lines)
+
+
+_DEFAULT_JSON = json.dumps(DEFAULT_WARRANTY_RULES, sort_keys=True)
+
+
+@lru_cache(maxsize=64)
+def _compile_json(rules_json):
+    return CompiledRules(json.loads(rules_json))
+
+
+def compile_rules(rules=None):
+    """
+    Compiles project rules (dict, JSON string or None for the defaults).
+    Identical rules share one compiled evaluator. Raises ValueError on bad rules.
+    """
+    if isinstance(rules, CompiledRules):
+        return rules
+    if not rules:
+        return _compile_json(_DEFAULT_JSON)
+    if isinstance(rules, str):
+        try:
+            rules = json.loads(rules)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"Warranty rules are not valid JSON: {e}")
+    if not isinstance(rules, dict):
+        raise ValueError("Warranty rules must be a JSON object")
+    merged = copy.deepcopy(DEFAULT_WARRANTY_RULES)
+    merged.update(rules)
+    if not isinstance(merged["types"], list) or not all(isinstance(t, dict) for t in merged["types"]):
+        raise ValueError("Warranty rules 'types' must be a list of objects")
+    for key in ("spec_headers", "extra_headers"):
+        if not isinstance(merged[key], list):
+            raise ValueError(f"Warranty rules '{key}' must be a list")
+    try:
+        return _compile_json(json.dumps(merged, sort_keys=True))
+    except KeyError as e:
+        raise ValueError(f"Warranty rules are missing {e}")
+    except (TypeError, AttributeError) as e:
+        # A field of the wrong shape inside a type (e.g. display that isn't an object)
+        raise ValueError(f"Warranty rules are malformed: {e}")
+
+
+def default_rules_json():
+    return json.dumps(DEFAULT_WARRANTY_RULES, indent=2)
+
+
+def parse_warranty_rules(text):
+    """(rules, error) from a project form's JSON field. Blank means default rules (None)."""
+    if not text.strip():
+        return None, None
+    try:
+        compile_rules(text)
+        return json.loads(text), None
+    except ValueError as e:
+        return None, str(e)
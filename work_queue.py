@@ -0,0 +1,312 @@
+"""
+Distributed Generation Queue for E-Warranty Portal
+A coordinator splits a bulk job into shards keyed by branch_code and puts them
+on a durable queue; any number of worker processes or hosts pull shards,
+render them with pdf_engine and report back. Shards are leased: a worker that
+dies stops renewing its lease and the shard goes back to the queue.
+
+Local stand-in: SQLite + a shared directory (NFS/SMB in a multi-host setup).
+
+    python work_queue.py worker --queue /shared/warranty_queue --processes 4
+    python work_queue.py status --queue /shared/warranty_queue
+"""
+import argparse
+import json
+import multiprocessing as mp
+import os
+import pickle
+import shutil
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+import zlib
+
+from pdf_engine import clean_branch_code, generate_bulk_results
+
+QUEUE_DIR = os.environ.get("WORK_QUEUE_DIR", "work_queue")
+LEASE_SECONDS = 60
+MAX_ATTEMPTS = 3
+# How long the coordinator waits for workers before giving up on the shards still open
+JOB_TIMEOUT_SECONDS = float(os.environ.get("WORK_QUEUE_TIMEOUT", 600))
+
+SCHEMA = """
+create table if not exists jobs (
+  id text primary key,
+  output_dir text not null,
+  total_shards integer not null,
+  created_at real not null
+);
+create table if not exists shards (
+  id integer primary key autoincrement,
+  job_id text not null references jobs(id),
+  shard_no integer not null,
+  branch_codes text not null,
+  payload_path text not null,
+  status text not null default 'pending', -- pending | leased | done | failed
+  lease_owner text,
+  lease_expires real,
+  attempts integer not null default 0,
+  result text,
+  updated_at real
+);
+create index if not exists idx_shards_status on shards (status, lease_expires);
+create index if not exists idx_shards_job on shards (job_id, status);
+"""
+
+
+def _connect(queue_dir):
+    conn = sqlite3.connect(os.path.join(queue_dir, "queue.db"), timeout=30, isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    conn.execute("pragma journal_mode=wal")
+    return conn
+
+
+def init_queue(queue_dir=QUEUE_DIR):
+    os.makedirs(os.path.join(queue_dir, "jobs"), exist_ok=True)
+    conn = _connect(queue_dir)
+    conn.executescript(SCHEMA)
+    return conn
+
+
+# --- COORDINATOR ---
+def shard_of(branch_code, n_shards):
+    """Stable shard for a branch: every row of a branch lands in the same shard."""
+    return zlib.crc32(branch_code.encode()) % n_shards
+
+
+def submit_job(df, images_dict, branding_config, queue_dir=QUEUE_DIR, n_shards=None, rows_per_shard=50):
+    """
+    Splits a prepared DataFrame into branch_code shards and enqueues them.
+    Photos are copied into the job directory so workers on other hosts can
+    read them. Returns the job id.
+    """
+    conn = init_queue(queue_dir)
+    job_id = uuid.uuid4().hex[:12]
+    job_dir = os.path.join(queue_dir, "jobs", job_id)
+    photo_dir = os.path.join(job_dir, "photos")
+    output_dir = os.path.join(job_dir, "output")
+    os.makedirs(photo_dir)
+    os.makedirs(output_dir)
+
+    shared_images = {}
+    for key, path in images_dict.items():
+        dest = os.path.join(photo_dir, f"{key}{os.path.splitext(path)[1]}")
+        shutil.copyfile(path, dest)
+        shared_images[key] = os.path.abspath(dest)
+
+    codes = df['branch_code'].map(clean_branch_code) if 'branch_code' in df.columns else df.index.map(str)
+    n_shards = n_shards or max(1, -(-len(df) // rows_per_shard))
+    shard_ids = codes.map(lambda c: shard_of(c, n_shards))
+
+    rows = []
+    for shard_no, shard_df in df.groupby(shard_ids.values):
+        payload_path = os.path.join(job_dir, f"shard_{shard_no}.pkl")
+        with open(payload_path, "wb") as f:
+            pickle.dump({"df": shard_df, "images": shared_images, "branding": branding_config}, f)
+        branch_codes = sorted(set(codes[shard_df.index]))
+        rows.append((job_id, int(shard_no), json.dumps(branch_codes), payload_path, time.time()))
+
+    conn.execute("begin immediate")
+    conn.execute("insert into jobs (id, output_dir, total_shards, created_at) values (?, ?, ?, ?)",
+                 (job_id, os.path.abspath(output_dir), len(rows), time.time()))
+    conn.executemany(
+        "insert into shards (job_id, shard_no, branch_codes, payload_path, updated_at) values (?, ?, ?, ?, ?)", rows
+    )
+    conn.execute("commit")
+    conn.close()
+    return job_id
+
+
+def job_status(job_id, queue_dir=QUEUE_DIR):
+    """{'total', 'pending', 'leased', 'done', 'failed', 'generated': [paths], 'errors': [(branch, reason)]}"""
+    conn = _connect(queue_dir)
+    status = {"total": 0, "pending": 0, "leased": 0, "done": 0, "failed": 0, "generated": [], "errors": []}
+    for r in conn.execute("select status, result, branch_codes from shards where job_id = ?", (job_id,)):
+        status["total"] += 1
+        status[r["status"]] += 1
+        if r["result"]:
+            result = json.loads(r["result"])
+            status["generated"] += result.get("generated", [])
+            status["errors"] += result.get("errors", [])
+    conn.close()
+    return status
+
+
+def wait_for_job(job_id, queue_dir=QUEUE_DIR, poll=1.0, timeout=None, progress=None):
+    """Blocks until every shard is done or failed. progress(status) is called each poll."""
+    deadline = time.time() + timeout if timeout else None
+    while True:
+        status = job_status(job_id, queue_dir)
+        if progress:
+            progress(status)
+        if status["done"] + status["failed"] == status["total"]:
+            return status
+        if deadline and time.time() > deadline:
+            raise TimeoutError(f"Job {job_id} not finished after {timeout}s")
+        time.sleep(poll)
+
+
+def cancel_job(job_id, queue_dir=QUEUE_DIR, reason="cancelled"):
+    """Fails every shard of a job that no worker has finished; a late worker's report is then ignored."""
+    conn = _connect(queue_dir)
+    conn.execute(
+        """update shards set status = 'failed', lease_owner = null, updated_at = ?,
+                  result = json_object('generated', json('[]'),
+                                       'errors', (select json_group_array(json_array(value, ?)) from json_each(branch_codes)))
+           where job_id = ? and status in ('pending', 'leased')""",
+        (time.time(), reason, job_id),
+    )
+    conn.close()
+
+
+def remove_job(job_id, queue_dir=QUEUE_DIR):
+    """Deletes a job's directory: the copied photos, shard payloads and rendered PDFs."""
+    shutil.rmtree(os.path.join(queue_dir, "jobs", job_id), ignore_errors=True)
+
+
+def generate_distributed(df, images_dict, output_dir, branding_config, queue_dir=QUEUE_DIR, progress=None,
+                         timeout=JOB_TIMEOUT_SECONDS):
+    """
+    Drop-in for generate_bulk_results when WORK_QUEUE_DIR is set: the PDFs end
+    up in output_dir and the job directory is removed afterwards. Shards not
+    finished within timeout seconds are reported as failed rows.
+    Returns (generated_paths, errors); progress(done, total) counts shards.
+    """
+    job_id = submit_job(df, images_dict, branding_config, queue_dir)
+    try:
+        on_poll = (lambda s: progress(s["done"] + s["failed"], s["total"])) if progress else None
+        try:
+            status = wait_for_job(job_id, queue_dir, timeout=timeout, progress=on_poll)
+        except TimeoutError:
+            cancel_job(job_id, queue_dir, reason=f"no worker finished this shard within {timeout:g}s")
+            status = job_status(job_id, queue_dir)
+        generated = []
+        for path in status["generated"]:
+            if os.path.exists(path):
+                generated.append(shutil.move(path, os.path.join(output_dir, os.path.basename(path))))
+        return generated, status["errors"]
+    finally:
+        remove_job(job_id, queue_dir)
+
+
+# --- WORKER ---
+def claim_shard(conn, worker_id, lease_seconds=LEASE_SECONDS):
+    """Leases the next pending (or expired) shard. Returns the shard row or None."""
+    now = time.time()
+    conn.execute("begin immediate")
+    try:
+        # Shards whose lease ran out too often are given up on
+        conn.execute(
+            """update shards set status = 'failed', updated_at = ?,
+                      result = json_object('generated', json('[]'),
+                                           'errors', (select json_group_array(json_array(value, 'lease expired too often')) from json_each(branch_codes)))
+               where status = 'leased' and lease_expires < ? and attempts >= ?""",
+            (now, now, MAX_ATTEMPTS),
+        )
+        row = conn.execute(
+            """select * from shards
+               where status = 'pending' or (status = 'leased' and lease_expires < ?)
+               order by id limit 1""",
+            (now,),
+        ).fetchone()
+        if row is not None:
+            conn.execute(
+                """update shards set status = 'leased', lease_owner = ?, lease_expires = ?,
+                          attempts = attempts + 1, updated_at = ? where id = ?""",
+                (worker_id, now + lease_seconds, now, row["id"]),
+            )
+        conn.execute("commit")
+    except Exception:
+        conn.execute("rollback")
+        raise
+    return row
+
+
+def _renew_lease(queue_dir, shard_id, worker_id, lease_seconds, stop):
+    conn = _connect(queue_dir)
+    while not stop.wait(lease_seconds / 3):
+        conn.execute(
+            "update shards set lease_expires = ? where id = ? and lease_owner = ? and status = 'leased'",
+            (time.time() + lease_seconds, shard_id, worker_id),
+        )
+    conn.close()
+
+
+def process_shard(queue_dir, shard, worker_id, lease_seconds=LEASE_SECONDS):
+    """Renders one shard while keeping its lease alive, then reports the result."""
+    stop = threading.Event()
+    heartbeat = threading.Thread(target=_renew_lease, args=(queue_dir, shard["id"], worker_id, lease_seconds, stop), daemon=True)
+    heartbeat.start()
+    try:
+        with open(shard["payload_path"], "rb") as f:
+            payload = pickle.load(f)
+        conn = _connect(queue_dir)
+        output_dir = conn.execute("select output_dir from jobs where id = ?", (shard["job_id"],)).fetchone()[0]
+        conn.close()
+        results = generate_bulk_results(payload["df"], payload["images"], output_dir, payload["branding"])
+        generated = [r.path for r in results if r.ok]
+        # Per-row reasons reach the user; anything else expected but missing is reported too
+        errors = [[r.branch_code, r.reason] for r in results if not r.ok]
+        expected = set(json.loads(shard["branch_codes"]))
+        reported = {r.branch_code for r in results}
+        errors += [[b, "not generated"] for b in sorted(expected - reported)]
+        result = {"generated": generated, "errors": errors}
+        status = "done"
+    except Exception as e:
+        result = {"generated": [], "errors": [[b, f"{type(e).__name__}: {e}"] for b in json.loads(shard["branch_codes"])]}
+        status = "failed" if shard["attempts"] + 1 >= MAX_ATTEMPTS else "pending"
+    finally:
+        stop.set()
+        heartbeat.join()
+    conn = _connect(queue_dir)
+    # Only the current lease holder may report; a reassigned shard belongs to someone else now
+    conn.execute(
+        "update shards set status = ?, result = ?, lease_owner = null, updated_at = ? where id = ? and lease_owner = ?",
+        (status, json.dumps(result), time.time(), shard["id"], worker_id),
+    )
+    conn.close()
+    return status
+
+
+def run_worker(queue_dir=QUEUE_DIR, worker_id=None, lease_seconds=LEASE_SECONDS, poll=1.0, once=False):
+    """Pulls and renders shards until stopped (or until the queue is empty when once=True)."""
+    worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}"
+    conn = init_queue(queue_dir)
+    while True:
+        shard = claim_shard(conn, worker_id, lease_seconds)
+        if shard is None:
+            if once:
+                return
+            time.sleep(poll)
+            continue
+        process_shard(queue_dir, shard, worker_id, lease_seconds)
+
+
+def _status_main(queue_dir):
+    conn = init_queue(queue_dir)
+    for job in conn.execute("select id, total_shards, created_at from jobs order by created_at desc limit 20"):
+        counts = dict(conn.execute("select status, count(*) from shards where job_id = ? group by status", (job["id"],)).fetchall())
+        print(f"{job['id']}  shards={job['total_shards']}  {counts}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Distributed certificate generation queue")
+    parser.add_argument("command", choices=["worker", "status"])
+    parser.add_argument("--queue", default=QUEUE_DIR, help="Shared queue directory")
+    parser.add_argument("--processes", type=int, default=1, help="Worker processes on this host")
+    parser.add_argument("--lease", type=int, default=LEASE_SECONDS, help="Lease timeout in seconds")
+    args = parser.parse_args()
+
+    if args.command == "status":
+        _status_main(args.queue)
+    elif args.processes == 1:
+        run_worker(args.queue, lease_seconds=args.lease)
+    else:
+        procs = [mp.Process(target=run_worker, args=(args.queue,), kwargs={"lease_seconds": args.lease})
+                 for _ in range(args.processes)]
+        for p in procs:
+            p.start()
+        for p in procs:
+            p.join()